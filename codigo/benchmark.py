@@ -0,0 +1,928 @@
+"""
+Benchmarks da ferramenta de pesquisa.
+
+Uso:
+    python benchmark.py                 # roda todos os benchmarks
+    python benchmark.py leitura_unica   # roda apenas os benchmarks informados
+
+O componente do Langflow (langflow.py) só é medido quando o pacote `langflow`
+está instalado no ambiente; caso contrário, apenas pesquisa.py é exercitado.
+"""
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+
+
+def carregar_modulo(nome: str, arquivo: str):
+    """Importa um dos scripts da pasta pelo caminho (langflow.py colide com o pacote langflow)."""
+    spec = importlib.util.spec_from_file_location(nome, os.path.join(PASTA, arquivo))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def modulos(cache_resultados: bool = False):
+    """pesquisa.py e langflow.py recém-carregados. O cache de resultados fica desligado (os
+    benchmarks repetem consultas para medir o cálculo), a não ser que cache_resultados=True."""
+    mods = {"pesquisa": carregar_modulo("pesquisa_bench", "pesquisa.py")}
+    # a pasta do script fica em sys.path e faria `import langflow` apontar para langflow.py
+    caminhos = sys.path[:]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or ".") != PASTA]
+    try:
+        mods["langflow"] = carregar_modulo("componente_bench", "langflow.py")
+    except ImportError as e:
+        sys.modules.pop("componente_bench", None)
+        print(f"(langflow.py ignorado: {e})")
+    finally:
+        sys.path[:] = caminhos
+    for mod in mods.values():
+        mod.cache_resultados = mod.CacheResultados(max_itens=0 if not cache_resultados else
+                                                   mod.CACHE_RESULTADOS_MAX_ITENS)
+    return mods
+
+
+def gerar_planilha(caminho: str, linhas: int, seed: int = 0) -> str:
+    """Gera uma planilha no formato do Titanic com `linhas` linhas."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "PassengerId": np.arange(1, linhas + 1),
+        "Survived": rng.integers(0, 2, linhas),
+        "Pclass": rng.integers(1, 4, linhas),
+        "Name": [f"Passenger {i}" for i in range(linhas)],
+        "Sex": rng.choice(["male", "female"], linhas),
+        "Age": np.where(rng.random(linhas) < 0.2, np.nan, rng.integers(1, 80, linhas)),
+        "Fare": (rng.random(linhas) * 100).round(2),
+        "Embarked": rng.choice(["S", "C", "Q"], linhas),
+    })
+    df.to_excel(caminho, index=False)
+    return caminho
+
+
+@contextlib.contextmanager
+def contar_leituras():
+    """Conta as chamadas a pd.read_excel feitas dentro do bloco (leituras só do cabeçalho não contam)."""
+    original = pd.read_excel
+    contagem = {"leituras": 0}
+
+    def read_excel_contado(*args, **kwargs):
+        if kwargs.get("nrows") != 0:
+            contagem["leituras"] += 1
+        return original(*args, **kwargs)
+
+    pd.read_excel = read_excel_contado
+    try:
+        yield contagem
+    finally:
+        pd.read_excel = original
+
+
+def cronometrar(func, repeticoes: int = 1) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func()
+    return (time.perf_counter() - inicio) / repeticoes
+
+
+# =========================
+# Benchmarks
+# =========================
+def bench_leitura_unica(pasta: str):
+    """A operação de porcentagem (com e sem group_by) deve ler a planilha uma única vez."""
+    arquivo = gerar_planilha(os.path.join(pasta, "leitura_unica.xlsx"), 5_000)
+    consultas = {
+        "percent": {"operation": "percent", "data": [{"column_name": "Sex", "value": "female"}]},
+        "percent por grupo": {"operation": "percent", "group_by": ["Pclass"],
+                              "data": [{"column_name": "Survived", "value": "1"}]},
+    }
+    for nome_mod, mod in modulos().items():
+        for nome, entrada in consultas.items():
+            mod.cache_planilhas.invalidar()
+            with contar_leituras() as contagem, contextlib.redirect_stdout(io.StringIO()):
+                tempo = cronometrar(lambda: mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo))
+            # com o snapshot colunar já gravado, a consulta pode nem abrir o Excel
+            status = "ok" if contagem["leituras"] <= 1 else "FALHOU"
+            print(f"[{nome_mod}] {nome}: {contagem['leituras']} leitura(s), {tempo * 1000:.1f} ms -> {status}")
+            assert contagem["leituras"] <= 1, f"{nome_mod}/{nome} leu a planilha {contagem['leituras']} vezes"
+
+
+def bench_projecao(pasta: str):
+    """Planilha larga: consulta que usa 2 colunas vs. carga completa (sem snapshot)."""
+    rng = np.random.default_rng(1)
+    linhas, largura = 5_000, 60
+    df = pd.DataFrame({f"Col{i}": rng.random(linhas) for i in range(largura)})
+    df["Sex"] = rng.choice(["male", "female"], linhas)
+    arquivo = os.path.join(pasta, "larga.xlsx")
+    df.to_excel(arquivo, index=False)
+    entrada = {"operation": "mean", "column_operation": "Col1", "data": [{"column_name": "Sex", "value": "female"}]}
+    pesquisa = modulos()["pesquisa"]
+    # no Excel (openpyxl) a projeção economiza memória; com o snapshot economiza também tempo
+    for usar_snapshot in [False, True] if pesquisa.pa is not None else [False]:
+        pesquisa.USAR_SNAPSHOT = usar_snapshot
+        origem = "snapshot" if usar_snapshot else "xlsx"
+        if usar_snapshot:
+            pesquisa.ler_planilha(arquivo)  # gera o snapshot
+        for nome, colunas in [("completa", None), ("projetada", ["Col1", "Sex"])]:
+            pesquisa.cache_planilhas.invalidar()
+            tempo = cronometrar(lambda: pesquisa.carregar_planilha(arquivo, colunas=colunas))
+            memoria = pesquisa.cache_planilhas.estatisticas()["bytes"]
+            print(f"[{origem}] carga {nome}: {tempo * 1000:.1f} ms, {memoria / 1e6:.2f} MB em cache")
+        pesquisa.cache_planilhas.invalidar()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tempo = cronometrar(lambda: pesquisa.executar_pesquisa(dict(entrada), arquivo_excel=arquivo))
+        print(f"[{origem}] consulta (mean com filtro): {tempo * 1000:.1f} ms, "
+              f"{pesquisa.cache_planilhas.estatisticas()['bytes'] / 1e6:.2f} MB em cache")
+    pesquisa.USAR_SNAPSHOT = True
+
+
+def mapear_coluna_linear(coluna, df_map, colunas, semantico):
+    """Versão original (varredura linear) de mapear_coluna, usada como referência."""
+    key = str(coluna).strip().lower()
+    if key in semantico:
+        target = semantico[key]
+        for col in colunas:
+            if col.lower() == target.lower():
+                return col
+        return target
+    if key in df_map:
+        return df_map[key]
+    for k, v in df_map.items():
+        if key in k:
+            return v
+    for col in colunas:
+        if col.lower() == key:
+            return col
+    return None
+
+
+def bench_resolvedor(pasta: str):
+    """Resolução de nomes de colunas em um esquema com 600 colunas."""
+    pesquisa = modulos()["pesquisa"]
+    colunas = [f"Indicador {i} Regiao {i % 27}" for i in range(600)] + ["Fare", "Sex", "Age"]
+    semantico = {"tarifa": "fare", "sexo": "Sex", "idade": "age"}
+    df_map = {c.strip().lower(): c for c in colunas}
+    termos = ["tarifa", "sexo", "Fare", "age", "regiao 3", "indicador 599", "inexistente", "INDICADOR 42 REGIAO 15"] * 25
+
+    for termo in set(termos):
+        esperado = mapear_coluna_linear(termo, df_map, colunas, semantico)
+        obtido = pesquisa.ResolvedorColunas(colunas, semantico).resolver(termo)
+        assert esperado == obtido, f"{termo!r}: {esperado!r} != {obtido!r}"
+
+    def linear():
+        for termo in termos:
+            mapear_coluna_linear(termo, df_map, colunas, semantico)
+
+    def resolvedor():
+        r = pesquisa.obter_resolvedor(colunas, semantico)
+        for termo in termos:
+            r.resolver(termo)
+
+    t_linear = cronometrar(linear, 20)
+    t_resolvedor = cronometrar(resolvedor, 20)
+    t_construcao = cronometrar(lambda: pesquisa.ResolvedorColunas(colunas, semantico), 20)
+    print(f"{len(termos)} resoluções: linear {t_linear * 1000:.2f} ms, "
+          f"resolvedor {t_resolvedor * 1000:.3f} ms ({t_linear / t_resolvedor:.0f}x); "
+          f"construção do resolvedor {t_construcao * 1000:.2f} ms")
+
+
+def filtro_termos_em_laco(serie: pd.Series, termos) -> pd.Series:
+    """Implementação anterior: um str.contains (regex sem escape) por termo."""
+    col_text = serie.astype(str).str.lower()
+    filtro = pd.Series(False, index=serie.index)
+    for t in termos:
+        filtro |= col_text.str.contains(str(t).lower(), na=False)
+    return filtro
+
+
+def bench_termos(pasta: str):
+    """Filtro textual com 20 termos sobre 1M de linhas (baixa e alta cardinalidade)."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(2)
+    linhas = 1_000_000
+    termos = [f"cidade{i:03d}" for i in range(0, 400, 20)]
+    colunas = {
+        "baixa cardinalidade (2k valores)": pd.Series(np.array([f"Cidade{i:03d} Norte" for i in range(2_000)], dtype=object)[rng.integers(0, 2_000, linhas)]),
+        "alta cardinalidade (1M valores)": pd.Series([f"Cidade{i % 1000:03d} rua {i}" for i in range(linhas)]),
+    }
+    for nome, serie in colunas.items():
+        esperado = filtro_termos_em_laco(serie, termos)
+        obtido = pesquisa.mascara_contem_termos(serie, termos)
+        assert esperado.equals(obtido)
+        t_laco = cronometrar(lambda: filtro_termos_em_laco(serie, termos))
+        t_novo = cronometrar(lambda: pesquisa.mascara_contem_termos(serie, termos))
+        print(f"{nome}: laço {t_laco * 1000:.0f} ms, regex combinada {t_novo * 1000:.0f} ms "
+              f"({t_laco / t_novo:.1f}x), {int(obtido.sum())} linhas")
+
+
+def bench_categorias(pasta: str):
+    """5M de linhas em memória (acima do limite de linhas do Excel): texto vs. 'category'."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(3)
+    linhas = 5_000_000
+    base = pd.DataFrame({
+        "Sex": pd.Series(np.array(["male", "female"], dtype=object)[rng.integers(0, 2, linhas)], dtype=object),
+        "Embarked": pd.Series(np.array(["S", "C", "Q"], dtype=object)[rng.integers(0, 3, linhas)], dtype=object),
+        "Status": pd.Series(np.array([f"status {i}" for i in range(40)], dtype=object)[rng.integers(0, 40, linhas)], dtype=object),
+        "Pclass": rng.integers(1, 4, linhas),
+        "Fare": rng.random(linhas) * 100,
+    })
+    categorica = base.copy()
+    economia = pesquisa.converter_categorias(categorica)
+    antes = base.memory_usage(deep=True).sum()
+    print(f"memória: texto {antes / 1e6:.0f} MB, category {(antes - economia) / 1e6:.0f} MB "
+          f"(economia de {economia / 1e6:.0f} MB)")
+
+    def consulta(df):
+        filtro = pesquisa.mascara_contem_termos(df["Sex"], ["female"]) & pesquisa.mascara_contem_termos(df["Status"], ["status 1"])
+        filtrado = df.loc[filtro]
+        contagem = filtrado.groupby(["Embarked"], observed=True).size()
+        media = filtrado.groupby(["Embarked"], observed=True)["Fare"].mean()
+        porcentagem = contagem / df.groupby(["Embarked"], observed=True).size() * 100
+        return contagem, media, porcentagem
+
+    r_texto, r_cat = consulta(base), consulta(categorica)
+    assert list(r_texto[0]) == list(r_cat[0])
+    t_texto = cronometrar(lambda: consulta(base))
+    t_cat = cronometrar(lambda: consulta(categorica))
+    print(f"filtro textual + count/mean/percent por grupo: texto {t_texto * 1000:.0f} ms, "
+          f"category {t_cat * 1000:.0f} ms ({t_texto / t_cat:.1f}x)")
+
+
+def bench_lote(pasta: str):
+    """12 consultas sobre a mesma planilha: uma a uma (cache frio) vs. executar_pesquisas."""
+    arquivo = gerar_planilha(os.path.join(pasta, "lote.xlsx"), 20_000)
+    base = [
+        {"operation": "count", "data": [{"column_name": "Sex", "value": "female"}]},
+        {"operation": "mean", "column_operation": "Fare", "group_by": ["Pclass"],
+         "data": [{"column_name": "Sex", "value": "female"}]},
+        {"operation": "percent", "group_by": ["Pclass"], "data": [{"column_name": "Survived", "value": "1"}]},
+        {"operation": "max", "column_operation": "Age", "data": [{"column_name": "Age", "value": "> 40"}]},
+    ]
+    entradas = base * 3
+    for nome_mod, mod in modulos().items():
+        def uma_a_uma():
+            for entrada in entradas:
+                mod.cache_planilhas.invalidar()
+                mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo)
+
+        def em_lote():
+            mod.cache_planilhas.invalidar()
+            return mod.executar_pesquisas([dict(e) for e in entradas], arquivo_excel=arquivo)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with contar_leituras() as contagem:
+                resultados = em_lote()
+            assert contagem["leituras"] <= 1, f"{nome_mod}: lote leu a planilha {contagem['leituras']} vezes"
+            assert len(resultados) == len(entradas)
+            t_individual = cronometrar(uma_a_uma)
+            t_lote = cronometrar(em_lote)
+        print(f"[{nome_mod}] {len(entradas)} consultas: uma a uma {t_individual * 1000:.0f} ms, "
+              f"lote {t_lote * 1000:.0f} ms ({t_individual / t_lote:.1f}x)")
+
+
+def bench_mascaras(pasta: str):
+    """Filtro composto (texto + 2 numéricos) repetido sobre 2M de linhas: cálculo vs. máscaras em cache."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(4)
+    linhas = 2_000_000
+    df = pd.DataFrame({
+        "Name": pd.Series(np.array([f"nome {i}" for i in range(50_000)], dtype=object)[rng.integers(0, 50_000, linhas)]),
+        "Age": rng.random(linhas) * 80,
+        "Fare": rng.random(linhas) * 100,
+    })
+    planilha = pesquisa.PlanilhaCarregada(list(df.columns), df)
+    visoes = planilha.visoes
+
+    def filtro(mascaras):
+        calcular = [
+            (("contem", "Name", ("nome 1",)), lambda: pesquisa.mascara_contem_termos(df["Name"], ["nome 1"], visoes.fatorada("Name"))),
+            (("num", "Age", ">", 30.0), lambda: pesquisa.conjuncao_numerica(visoes, [("Age", ">", 30.0)])),
+            (("num", "Fare", "<=", 50.0), lambda: pesquisa.conjuncao_numerica(visoes, [("Fare", "<=", 50.0)])),
+        ]
+        resultado = pd.Series(True, index=df.index)
+        for chave, func in calcular:
+            resultado &= mascaras.obter(chave, func) if mascaras is not None else func()
+        return resultado
+
+    assert filtro(None).equals(filtro(planilha.mascaras))
+    t_calculo = cronometrar(lambda: filtro(None), repeticoes=3)
+    t_cache = cronometrar(lambda: filtro(planilha.mascaras), repeticoes=3)
+    est = planilha.mascaras
+    print(f"filtro composto: calculado {t_calculo * 1000:.0f} ms, em cache {t_cache * 1000:.0f} ms "
+          f"({t_calculo / t_cache:.1f}x); {est.bytes / 1e6:.2f} MB em máscaras, "
+          f"taxa de acerto {est.acertos / (est.acertos + est.faltas):.2f}")
+
+
+def condicao_por_eval(df: pd.DataFrame, cond: str, colunas, semantico) -> pd.Series:
+    """Caminho anterior de special_conditions: regex com todos os nomes + df.eval."""
+    padrao = re.compile(r"\b(" + "|".join(re.escape(str(c)) for c in list(colunas) + list(semantico)) + r")\b",
+                        re.IGNORECASE)
+    df_map = {c.strip().lower(): c for c in colunas}
+    cond_limpa = padrao.sub(lambda m: mapear_coluna_linear(m.group(0), df_map, colunas, semantico) or m.group(0), cond)
+    return df.eval(cond_limpa)
+
+
+def bench_condicoes(pasta: str):
+    """special_conditions num esquema com 600 colunas e 1M de linhas: regex + df.eval vs. condição compilada."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(5)
+    linhas = 1_000_000
+    df = pd.DataFrame({
+        "Pclass": rng.integers(1, 4, linhas),
+        "Fare": rng.random(linhas) * 100,
+        "Age": np.where(rng.random(linhas) < 0.2, np.nan, rng.random(linhas) * 80),
+        "Sex": pd.Series(np.array(["male", "female"], dtype=object)[rng.integers(0, 2, linhas)], dtype=object),
+    })
+    colunas = [f"Indicador {i} Regiao {i % 27}" for i in range(600)] + list(df.columns)
+    semantico = {"tarifa": "Fare", "idade": "Age", "classe": "Pclass"}
+    condicoes = ["Pclass == 1 and Fare > 50", "classe >= 2 and idade < 30", "Sex == 'female' and Age > 40",
+                 # '&' e '|' sem parênteses: no df.eval ficam abaixo das comparações
+                 "Pclass == 1 & Fare > 50", "Age > 30 | Fare < 10"]
+    planilha = pesquisa.PlanilhaCarregada(list(df.columns), df)
+
+    for mod in modulos().values():
+        for cond in condicoes:
+            esperado = condicao_por_eval(df, cond, colunas, semantico).to_numpy(bool)
+            obtido = mod.compilar_condicao(cond, mod.obter_resolvedor(colunas, semantico)).mascara(
+                mod.PlanilhaCarregada(list(df.columns), df).visoes)
+            assert (esperado == obtido).all(), cond
+
+    def por_eval():
+        for cond in condicoes:
+            condicao_por_eval(df, cond, colunas, semantico)
+
+    def compilada():
+        resolvedor = pesquisa.obter_resolvedor(colunas, semantico)
+        for cond in condicoes:
+            pesquisa.compilar_condicao(cond, resolvedor).mascara(planilha.visoes)
+
+    t_eval = cronometrar(por_eval, 3)
+    t_compilada = cronometrar(compilada, 3)
+    t_compilacao = cronometrar(lambda: [pesquisa.compilar_condicao(c, pesquisa.ResolvedorColunas(colunas, semantico))
+                                        for c in condicoes], 20)
+    print(f"{len(condicoes)} condições: regex + df.eval {t_eval * 1000:.0f} ms, compiladas {t_compilada * 1000:.0f} ms "
+          f"({t_eval / t_compilada:.1f}x); compilação a frio {t_compilacao * 1000:.2f} ms")
+
+
+def medir_pico(func) -> Tuple[float, float]:
+    """Tempo (s) e pico de memória alocada (bytes, via tracemalloc) de uma chamada."""
+    tracemalloc.start()
+    try:
+        inicio = time.perf_counter()
+        func()
+        tempo = time.perf_counter() - inicio
+        return tempo, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def filtro_em_cadeia(df: pd.DataFrame, comparacoes) -> pd.Series:
+    """Caminho anterior: uma Series booleana temporária por comparação, acumulada com &=."""
+    operadores = {">": pd.Series.gt, ">=": pd.Series.ge, "<": pd.Series.lt, "<=": pd.Series.le,
+                  "==": pd.Series.eq, "!=": pd.Series.ne}
+    filtro = pd.Series(True, index=df.index)
+    for coluna, op, num in comparacoes:
+        filtro &= operadores[op](pd.to_numeric(df[coluna], errors="coerce"), num)
+    return filtro
+
+
+def bench_numexpr(pasta: str):
+    """Conjunção de 3 comparações numéricas sobre 10M de linhas: cadeia de Series vs. expressão fundida."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(6)
+    linhas = 10_000_000
+    df = pd.DataFrame({
+        "Pclass": rng.integers(1, 4, linhas),
+        "Fare": rng.random(linhas) * 100,
+        "Age": np.where(rng.random(linhas) < 0.2, np.nan, rng.random(linhas) * 80),
+    })
+    planilha = pesquisa.PlanilhaCarregada(list(df.columns), df)
+    comparacoes = [("Pclass", "==", 1.0), ("Fare", ">", 50.0), ("Age", "<", 30.0)]
+    condicao = pesquisa.compilar_condicao("Pclass == 1 and Fare > 50 and Age < 30",
+                                          pesquisa.ResolvedorColunas(list(df.columns)))
+    esperado = filtro_em_cadeia(df, comparacoes).to_numpy()
+    assert (pesquisa.conjuncao_numerica(planilha.visoes, comparacoes) == esperado).all()
+    assert (condicao.mascara(planilha.visoes) == esperado).all()
+
+    usar_numexpr = pesquisa.USAR_NUMEXPR
+    casos = [("cadeia de Series", lambda: filtro_em_cadeia(df, comparacoes))]
+    if pesquisa.numexpr is not None:
+        casos.append(("numexpr", lambda: pesquisa.conjuncao_numerica(planilha.visoes, comparacoes)))
+        print(f"numexpr com {pesquisa.numexpr.detect_number_of_cores()} núcleo(s); USAR_NUMEXPR={usar_numexpr}")
+    casos.append(("NumPy (buffer reaproveitado)", lambda: pesquisa.conjuncao_numerica(planilha.visoes, comparacoes)))
+    for nome, func in casos:
+        pesquisa.USAR_NUMEXPR = nome == "numexpr"
+        try:
+            func()  # aquece
+            tempo = min(cronometrar(func) for _ in range(3))
+            _, pico = medir_pico(func)
+        finally:
+            pesquisa.USAR_NUMEXPR = usar_numexpr
+        print(f"{nome}: {tempo * 1000:.0f} ms ({linhas / tempo / 1e6:.0f} M linhas/s), pico {pico / 1e6:.0f} MB")
+
+
+def verificar_contagem_filtrada(pasta: str):
+    """count/percent só com filtros (sem column_operation) com a planilha fora do cache: só as colunas
+    dos filtros são carregadas e o recorte não pode parecer vazio quando há linhas selecionadas."""
+    arquivo = gerar_planilha(os.path.join(pasta, "contagem_filtrada.xlsx"), 2_000)
+    referencia = pd.read_excel(arquivo)
+    casos = [
+        ({"data": [{"column_name": "Sex", "value": "female"}], "operation": "count"},
+         int((referencia["Sex"] == "female").sum())),
+        ({"special_conditions": ["Age > 30"], "operation": "count"}, int((referencia["Age"] > 30).sum())),
+        ({"data": [{"column_name": "Sex", "value": "female"}], "operation": "percent"},
+         int((referencia["Sex"] == "female").sum())),
+    ]
+    for nome_mod, mod in modulos().items():
+        for entrada, esperado in casos:
+            mod.cache_planilhas.invalidar()
+            saida = io.StringIO()
+            with contextlib.redirect_stdout(saida):
+                resultado = mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo)
+            # pesquisa.py mostra o resultado no console; langflow.py devolve a tabela do resultado
+            if nome_mod == "pesquisa":
+                rotulo = "Contagem total de registros" if entrada["operation"] == "count" else "Total filtrado"
+                numeros = re.findall(rf"{rotulo}: (\d+)", saida.getvalue())
+                obtido = int(numeros[0]) if numeros else saida.getvalue().strip()
+            else:
+                obtido = int(resultado.iloc[0]["contagem" if entrada["operation"] == "count" else "total_filtrado"])
+            assert obtido == esperado, f"{nome_mod} {entrada}: {obtido} != {esperado}"
+
+
+def bench_recorte(pasta: str):
+    """Planilha larga (1M x 60) em cache: df.loc[filtro].copy() vs. recorte só das colunas usadas."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(7)
+    linhas = 1_000_000
+    df = pd.DataFrame({f"Indicador {i}": rng.random(linhas) for i in range(57)})
+    df["Sex"] = pd.Categorical(np.array(["male", "female"])[rng.integers(0, 2, linhas)])
+    df["Pclass"] = rng.integers(1, 4, linhas)
+    df["Fare"] = rng.random(linhas) * 100
+    filtro = pd.Series((df["Sex"] == "female").to_numpy() & (df["Pclass"] == 1).to_numpy(), index=df.index)
+
+    def copia_completa():
+        return df.loc[filtro].copy()["Fare"].mean()
+
+    def recorte():
+        return pesquisa.recortar(df, filtro, ["Fare"])["Fare"].mean()
+
+    assert copia_completa() == recorte()
+    verificar_contagem_filtrada(pasta)
+    for nome, func in (("df.loc[filtro].copy()", copia_completa), ("recortar (1 coluna)", recorte)):
+        tempo = min(cronometrar(func) for _ in range(3))
+        _, pico = medir_pico(func)
+        print(f"{nome}: {tempo * 1000:.0f} ms, pico {pico / 1e6:.0f} MB")
+
+
+def bench_top(pasta: str):
+    """top 5 por uma coluna numérica em 10M de linhas: ordenação completa vs. seleção parcial."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(8)
+    linhas = 10_000_000
+    fare = np.round(rng.random(linhas) * 100, 2)
+    fare[rng.random(linhas) < 0.05] = np.nan
+    df = pd.DataFrame({"Fare": fare, "Pclass": rng.integers(1, 4, linhas)})
+    planilha = pesquisa.PlanilhaCarregada(list(df.columns), df)
+    todas = pd.Series(True, index=df.index)
+    primeira = pd.Series(df["Pclass"].to_numpy() == 1, index=df.index)
+
+    for nome, filtro in (("sem filtro", todas), ("Pclass == 1", primeira)):
+        df_filtrado = pesquisa.recortar(df, filtro)
+        ordenacao = lambda: df_filtrado.sort_values(by="Fare", ascending=False, kind="stable").head(5)
+        # visões novas a cada chamada: mede a seleção parcial, sem o índice ordenado
+        selecao = lambda: pesquisa.top_linhas(df_filtrado, pesquisa.PlanilhaCarregada(list(df.columns), df).visoes,
+                                              filtro, "Fare", 5, False)
+        esperado = ordenacao()
+        assert selecao().index.tolist() == esperado.index.tolist()
+        t_ordenacao = cronometrar(ordenacao)
+        t_selecao = cronometrar(selecao)
+        print(f"{nome}: sort_values + head {t_ordenacao * 1000:.0f} ms, seleção parcial {t_selecao * 1000:.0f} ms "
+              f"({t_ordenacao / t_selecao:.0f}x)")
+
+    # a partir do segundo pedido a planilha guarda o índice ordenado da coluna
+    pesquisa.top_linhas(df, planilha.visoes, todas, "Fare", 5, False)
+    t_montagem = cronometrar(lambda: pesquisa.top_linhas(df, planilha.visoes, todas, "Fare", 5, False))
+    assert planilha.visoes.ordenada("Fare", False) is not None
+    t_indice = cronometrar(lambda: pesquisa.top_linhas(df, planilha.visoes, todas, "Fare", 5, False), 20)
+    t_indice_filtrado = cronometrar(lambda: pesquisa.top_linhas(df, planilha.visoes, primeira, "Fare", 5, False), 20)
+    print(f"índice ordenado: montagem {t_montagem * 1000:.0f} ms, top 5 sem filtro {t_indice * 1000:.2f} ms, "
+          f"com filtro {t_indice_filtrado * 1000:.2f} ms")
+
+
+def bench_cubo(pasta: str):
+    """Contagem e média por grupo (Pclass, Sex) em 5M de linhas: groupby vs. cubo de agregados."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(9)
+    linhas = 5_000_000
+    df = pd.DataFrame({"Pclass": rng.integers(1, 4, linhas),
+                       "Sex": pd.Categorical(rng.choice(["male", "female"], linhas)),
+                       "Fare": np.round(rng.random(linhas) * 100, 2)})
+    planilha = pesquisa.PlanilhaCarregada(list(df.columns), df)
+    grupos = ["Pclass", "Sex"]
+    todas = pd.Series(True, index=df.index)
+    caras = pd.Series(df["Fare"].to_numpy() > 50, index=df.index)
+
+    t_montagem = cronometrar(lambda: pesquisa.PlanilhaCarregada(list(df.columns), df).cubos.obter(grupos), 1)
+    for nome, filtro in (("sem filtro", todas), ("Fare > 50", caras)):
+        df_filtrado = pesquisa.recortar(df, filtro)
+        contagem_groupby = lambda: df_filtrado.groupby(grupos, observed=True).size()
+        contagem_cubo = lambda: pesquisa.contagem_por_grupo(planilha, filtro, grupos, df_filtrado)
+        media_groupby = lambda: df_filtrado.groupby(grupos, observed=True)["Fare"].mean()
+        media_cubo = lambda: pesquisa.media_por_grupo(planilha, filtro, grupos, "Fare", df_filtrado)
+        pd.testing.assert_series_equal(contagem_cubo(), contagem_groupby(), check_names=False)
+        pd.testing.assert_series_equal(media_cubo(), media_groupby(), check_names=False)
+        t_contagem = (cronometrar(contagem_groupby), cronometrar(contagem_cubo))
+        t_media = (cronometrar(media_groupby), cronometrar(media_cubo))
+        print(f"{nome}: contagem groupby {t_contagem[0] * 1000:.1f} ms, cubo {t_contagem[1] * 1000:.2f} ms; "
+              f"média groupby {t_media[0] * 1000:.1f} ms, cubo {t_media[1] * 1000:.2f} ms")
+    estado = planilha.cubos
+    print(f"montagem do cubo {t_montagem * 1000:.0f} ms; acertos {estado.acertos}, faltas {estado.faltas} "
+          f"(taxa {estado.acertos / (estado.acertos + estado.faltas):.2%})")
+    verificar_desvio_cubo()
+
+
+def verificar_desvio_cubo():
+    """Desvio padrão por grupo tirado do cubo numa coluna de valores grandes (1e9 + ruído), em que
+    Σx² - n·média² perde todos os dígitos: tem de bater com o groupby do pandas."""
+    rng = np.random.default_rng(12)
+    linhas = 200_000
+    df = pd.DataFrame({"Grupo": rng.choice(["a", "b", "c"], linhas), "Valor": 1e9 + rng.random(linhas)})
+    esperado = df.groupby("Grupo")["Valor"].std().to_numpy()
+    for nome_mod, mod in modulos().items():
+        planilha = mod.PlanilhaCarregada(list(df.columns), df)
+        obtido = mod.agregar_no_cubo(planilha, None, ["Valor"], ["std"], ["Grupo"], df)
+        assert obtido is not None and np.allclose(obtido["std_Valor"].to_numpy(), esperado, rtol=1e-6), \
+            f"[{nome_mod}] std do cubo {obtido} != {esperado}"
+
+
+def bench_streaming(pasta: str):
+    """CSV de 3M de linhas: leitura inteira + pandas vs. execução em blocos (tempo e pico de memória)."""
+    pesquisa = modulos()["pesquisa"]
+    rng = np.random.default_rng(10)
+    linhas = 3_000_000
+    arquivo = os.path.join(pasta, "grande.csv")
+    pd.DataFrame({"Pclass": rng.integers(1, 4, linhas), "Sex": rng.choice(["male", "female"], linhas),
+                  "Age": np.round(rng.random(linhas) * 80, 1), "Fare": np.round(rng.random(linhas) * 100, 2)}
+                 ).to_csv(arquivo, index=False)
+    entrada = {"operation": ["mean", "std", "max"], "column_operation": ["Fare"], "group_by": ["Pclass", "Sex"],
+               "data": [{"column_name": "Age", "value": "> 30"}]}
+
+    def inteira():
+        df = pd.read_csv(arquivo)
+        filtrado = df[df["Age"] > 30]
+        return filtrado.groupby(["Pclass", "Sex"])["Fare"].agg(["mean", "std", "max"]).reset_index()
+
+    def em_blocos():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pesquisa.executar_pesquisa_streaming(entrada, arquivo, linhas_por_bloco=200_000)
+
+    esperado, obtido = inteira(), em_blocos()
+    assert np.allclose(esperado[["mean", "std", "max"]].to_numpy(), obtido[["mean_Fare", "std_Fare", "max_Fare"]].to_numpy())
+    t_inteira, pico_inteira = medir_pico(inteira)
+    t_blocos, pico_blocos = medir_pico(em_blocos)
+    print(f"leitura inteira: {t_inteira:.2f} s, pico {pico_inteira / 2**20:.0f} MiB")
+    print(f"em blocos de 200k linhas: {t_blocos:.2f} s, pico {pico_blocos / 2**20:.0f} MiB")
+    verificar_blocos_excel(pasta)
+
+
+def verificar_blocos_excel(pasta: str):
+    """.xlsx em blocos como a leitura inteira: linhas vazias no meio contam (as do fim, não) e cada
+    coluna sai com um só tipo em todos os blocos, mesmo quando um bloco seguinte traz texto."""
+    from openpyxl import Workbook
+    arquivo = os.path.join(pasta, "blocos_vazias.xlsx")
+    livro = Workbook()
+    aba = livro.active
+    aba.append(["Id", "Grupo", "Codigo"])
+    for i in range(500):
+        aba.append([None, None, None] if i % 50 == 7 else [i, "abc"[i % 3], i if i < 300 else f"X{i}"])
+    for _ in range(3):
+        aba.append([None, None, None])
+    livro.save(arquivo)
+    entrada = {"operation": "count", "group_by": ["Grupo"], "cache": False}
+    for nome_mod, mod in modulos().items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            blocos = list(mod.ler_blocos(arquivo, 0, 0, None, 100))
+            obtido = mod.executar_pesquisa_streaming(dict(entrada), arquivo, linhas_por_bloco=100)
+        esperado = pd.read_excel(arquivo).groupby("Grupo")["Id"].size()
+        assert sum(len(b) for b in blocos) == len(pd.read_excel(arquivo)), f"[{nome_mod}] linhas vazias"
+        assert obtido.set_index("Grupo")["contagem"].to_dict() == esperado.to_dict(), f"[{nome_mod}] {obtido}"
+        assert len({str(b["Codigo"].dtype) for b in blocos}) == 1, f"[{nome_mod}] tipos por bloco"
+
+
+def bench_paralelo(pasta: str):
+    """Consulta filtrada e agrupada sobre um .parquet de 4M de linhas (16 row groups) com 1, 2, 4 e 8 processos."""
+    pesquisa = modulos()["pesquisa"]
+    if pesquisa.pq is None:
+        print("pyarrow não instalado: benchmark ignorado")
+        return
+    rng = np.random.default_rng(11)
+    linhas = 4_000_000
+    arquivo = os.path.join(pasta, "grande.parquet")
+    pd.DataFrame({"Pclass": rng.integers(1, 4, linhas), "Sex": rng.choice(["male", "female"], linhas),
+                  "Age": np.round(rng.random(linhas) * 80, 1), "Fare": np.round(rng.random(linhas) * 100, 2)}
+                 ).to_parquet(arquivo, row_group_size=linhas // 16)
+    entrada = {"operation": ["mean", "std", "max"], "column_operation": ["Fare"], "group_by": ["Pclass", "Sex"],
+               "data": [{"column_name": "Age", "value": "> 30"}], "special_conditions": ["Fare < 90"]}
+    print(f"núcleos disponíveis: {os.cpu_count()}")
+    referencia, t_base = None, None
+    for processos in (1, 2, 4, 8):
+        executar = lambda: pesquisa.executar_pesquisa_paralela(entrada, arquivo, processos=processos)
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = executar()  # também cria o pool de processos
+            tempo = cronometrar(executar, 3)
+        if referencia is None:
+            referencia, t_base = resultado, tempo
+        pd.testing.assert_frame_equal(resultado, referencia, check_exact=False, rtol=1e-9)
+        print(f"{processos} processo(s): {tempo * 1000:.0f} ms ({t_base / tempo:.2f}x)")
+
+
+def bench_planilhas(pasta: str):
+    """6 planilhas por glob: read_excel + concat vs. carga por fonte (fria, em cache, e com uma planilha nova)."""
+    sub = os.path.join(pasta, "planilhas")
+    os.makedirs(sub, exist_ok=True)
+    arquivos = [gerar_planilha(os.path.join(sub, f"mes{i:02d}.xlsx"), 20_000, seed=i) for i in range(6)]
+    padrao = os.path.join(sub, "*.xlsx")
+    entrada = {"operation": "mean", "column_operation": "Fare", "group_by": ["origem"],
+               "data": [{"column_name": "Sex", "value": "female"}]}
+
+    def concatenando():
+        df = pd.concat([pd.read_excel(a).assign(origem=os.path.basename(a)) for a in arquivos], ignore_index=True)
+        return df[df["Sex"] == "female"].groupby("origem")["Fare"].mean()
+
+    t_concat = cronometrar(concatenando)
+    print(f"read_excel + concat: {t_concat * 1000:.0f} ms")
+    for nome_mod, mod in modulos().items():
+        for snapshot in glob.glob(os.path.join(sub, "*.arrow")):
+            os.remove(snapshot)
+        mod.cache_planilhas.invalidar()
+        consultar = lambda: mod.executar_pesquisa(dict(entrada), arquivo_excel=padrao)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t_frio = cronometrar(consultar)
+            t_cache = cronometrar(consultar, 5)
+            gerar_planilha(os.path.join(sub, "mes06.xlsx"), 20_000, seed=6)
+            with contar_leituras() as contagem:
+                t_nova = cronometrar(consultar)
+        assert contagem["leituras"] <= 1, f"{nome_mod}: a planilha nova causou {contagem['leituras']} leituras"
+        os.remove(os.path.join(sub, "mes06.xlsx"))
+        print(f"[{nome_mod}] fria {t_frio * 1000:.0f} ms, em cache {t_cache * 1000:.1f} ms, "
+              f"+1 planilha {t_nova * 1000:.0f} ms ({contagem['leituras']} leitura(s))")
+
+
+TAMANHOS_MOTORES = (10_000, 100_000, 1_000_000)
+
+
+def ler_com_motor(motor: str, arquivo: str) -> Tuple[float, Optional[float]]:
+    """Executada num processo novo: tempo (s) da leitura com o motor e quanto ela aumentou o pico
+    de memória residente do processo (bytes; None onde o módulo resource não existe)."""
+    pesquisa = carregar_modulo("pesquisa_bench", "pesquisa.py")
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    tempo = cronometrar(lambda: pesquisa.MOTORES_LEITURA[motor](arquivo, 0, 0, None))
+    if resource is None:
+        return tempo, None
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return tempo, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - antes) * (1 if sys.platform == "darwin" else 1024)
+
+
+def bench_motores(pasta: str):
+    """Planilhas de 10k, 100k e 1M linhas lidas por cada motor disponível (cada leitura num processo novo)."""
+    pesquisa = modulos()["pesquisa"]
+    motores = [m for m in pesquisa.MOTORES_LEITURA if m != "calamine" or pesquisa.python_calamine is not None]
+    if pesquisa.python_calamine is None:
+        print("python-calamine não instalado: motor 'calamine' ignorado")
+    # cada leitura roda num processo novo, criado a partir de um servidor iniciado antes de gerar as
+    # planilhas: no Linux o pico de memória do pai é herdado pelo filho e esconderia o da leitura
+    metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    contexto = multiprocessing.get_context(metodo)
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+        executor.submit(int).result()
+    for linhas in TAMANHOS_MOTORES:
+        arquivo = gerar_planilha(os.path.join(pasta, f"motores_{linhas}.xlsx"), linhas)
+        if linhas == TAMANHOS_MOTORES[0]:
+            referencia = pesquisa.MOTORES_LEITURA["pandas"](arquivo, 0, 0, None)
+            for motor in motores:
+                pd.testing.assert_frame_equal(pesquisa.MOTORES_LEITURA[motor](arquivo, 0, 0, None), referencia)
+        automatico = pesquisa.motores_leitura(arquivo)[0]
+        print(f"{linhas} linhas ({os.path.getsize(arquivo) / 2 ** 20:.1f} MB), auto -> {automatico}")
+        for motor in motores:
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                tempo, pico = executor.submit(ler_com_motor, motor, arquivo).result()
+            memoria = "n/d" if pico is None else f"+{pico / 2 ** 20:.0f} MB"
+            print(f"  {motor:<20} {tempo:7.2f} s  pico {memoria}")
+
+
+def serializar_registros_anterior(obj):
+    """Versão original de to_serializable: to_dict(orient="records") e recursão elemento a elemento."""
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict(orient="records")
+    if isinstance(obj, pd.Series):
+        return obj.to_list()
+    if isinstance(obj, (np.integer, np.floating)):
+        return obj.item()
+    if isinstance(obj, (np.ndarray, list, tuple)):
+        return [serializar_registros_anterior(x) for x in obj]
+    if isinstance(obj, dict):
+        return {k: serializar_registros_anterior(v) for k, v in obj.items()}
+    return obj
+
+
+def bench_serializacao(pasta: str):
+    """Resultado de 1M linhas (números com NaN, texto, categorias, datas): versão original vs. conversão por coluna."""
+    mods = modulos()
+    if "langflow" not in mods:
+        print("langflow.py não carregado: benchmark ignorado")
+        return
+    componente = mods["langflow"]
+    rng = np.random.default_rng(5)
+    linhas = 1_000_000
+    df = pd.DataFrame({
+        "PassengerId": np.arange(linhas),
+        "Name": [f"Passenger {i}" for i in range(linhas)],
+        "Sex": pd.Categorical(rng.choice(["male", "female"], linhas)),
+        "Age": np.where(rng.random(linhas) < 0.2, np.nan, rng.integers(1, 80, linhas)),
+        "Fare": (rng.random(linhas) * 100).round(2),
+        "Embarked": pd.to_datetime(rng.integers(1_500_000_000, 1_600_000_000, linhas), unit="s"),
+    })
+    registros = componente.to_serializable(df)
+    json.dumps(registros[:1000], allow_nan=False)  # JSON válido: NaN e datas já convertidos
+    t_anterior = cronometrar(lambda: serializar_registros_anterior(df))
+    t_registros = cronometrar(lambda: componente.to_serializable(df))
+    t_colunas = cronometrar(lambda: componente.to_serializable(df, "colunas"))
+    print(f"orjson: {'sim' if componente.orjson is not None else 'não'}")
+    print(f"to_dict + recursão: {t_anterior * 1000:.0f} ms")
+    print(f"por coluna, registros: {t_registros * 1000:.0f} ms ({t_anterior / t_registros:.1f}x)")
+    print(f"por coluna, formato colunas: {t_colunas * 1000:.0f} ms ({t_anterior / t_colunas:.1f}x)")
+
+
+def bench_paginacao(pasta: str):
+    """Listagem de 1M linhas devolvida pelo componente: resultado inteiro vs. primeira página e página por cursor."""
+    mods = modulos()
+    if "langflow" not in mods:
+        print("langflow.py não carregado: benchmark ignorado")
+        return
+    componente = mods["langflow"]
+    rng = np.random.default_rng(6)
+    linhas = 1_000_000
+    df = pd.DataFrame({
+        "PassengerId": np.arange(linhas),
+        "Name": [f"Passenger {i}" for i in range(linhas)],
+        "Age": np.where(rng.random(linhas) < 0.2, np.nan, rng.integers(1, 80, linhas)),
+        "Fare": (rng.random(linhas) * 100).round(2),
+    })
+    entrada = {"operation": "list"}
+    inteiro = componente.paginar(dict(entrada, limit=0, max_chars=0), df)
+    pagina = componente.paginar(entrada, df)
+    cursor = pagina["paginacao"]["proximo_cursor"]
+    t_inteiro = cronometrar(lambda: json.dumps(componente.paginar(dict(entrada, limit=0, max_chars=0), df)))
+    t_pagina = cronometrar(lambda: json.dumps(componente.paginar(entrada, df)))
+    t_cursor = cronometrar(lambda: json.dumps(componente.continuar_paginacao({"cursor": cursor})))
+    print(f"resultado inteiro: {t_inteiro * 1000:.0f} ms, {len(json.dumps(inteiro)) / 1e6:.0f} MB de JSON")
+    print(f"primeira página: {t_pagina * 1000:.1f} ms, {len(json.dumps(pagina))} caracteres")
+    print(f"página pelo cursor: {t_cursor * 1000:.1f} ms")
+    verificar_cursor_planilha_alterada(componente, pasta)
+
+
+def verificar_cursor_planilha_alterada(componente, pasta: str):
+    """O cursor de uma planilha alterada depois da primeira página tem de ser recusado."""
+    arquivo = gerar_planilha(os.path.join(pasta, "cursor.xlsx"), 300)
+    entrada = {"operation": "list", "limit": 50, "arquivo_excel": arquivo}
+    cursor = componente.executar_entrada(dict(entrada))["paginacao"]["proximo_cursor"]
+    assert "erro" not in componente.executar_entrada({"cursor": cursor}), "cursor válido recusado"
+    gerar_planilha(arquivo, 400, seed=1)
+    assert "erro" in componente.executar_entrada({"cursor": cursor}), "cursor aceito com a planilha alterada"
+
+
+def verificar_chaves_ignoradas(arquivo: str):
+    """Pedidos que só diferem numa chave que o módulo não avalia não podem dividir o resultado em cache:
+    o segundo de cada par, depois do primeiro, tem de sair igual ao calculado sem cache."""
+    pares = [
+        ({"operation": "count", "data": [{"column_name": "Sex", "value": "female"}]},
+         {"operation": "count", "filters": [{"column_name": "Sex", "value": "female"}]}),
+        ({"operation": "count", "special_conditions": ["Age > 30"]},
+         {"operation": "count", "special_conditions": "Age > 30"}),
+    ]
+    for nome_mod, mod in modulos(cache_resultados=True).items():
+        def executar(entrada: dict):
+            saida = io.StringIO()
+            with contextlib.redirect_stdout(saida):
+                resultado = mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo)
+            return resultado, saida.getvalue()
+
+        for primeiro, segundo in pares:
+            mod.cache_resultados = mod.CacheResultados()
+            executar(primeiro)
+            resultado, texto = executar(segundo)
+            esperado, texto_esperado = executar(dict(segundo, cache=False))
+            assert texto == texto_esperado, f"[{nome_mod}] {segundo} reaproveitou o resultado de {primeiro}"
+            assert (resultado is None and esperado is None) or resultado.equals(esperado), \
+                f"[{nome_mod}] {segundo} reaproveitou o resultado de {primeiro}"
+
+
+def bench_resultados(pasta: str):
+    """Mesmas 6 consultas reenviadas 10 vezes com outra ordem de chaves, maiúsculas e sinônimos:
+    cálculo a cada pedido vs. cache de resultados."""
+    arquivo = gerar_planilha(os.path.join(pasta, "resultados.xlsx"), 200_000)
+    variantes = [
+        ({"operation": "mean", "column_operation": "Fare", "group_by": ["Pclass"],
+          "data": [{"column_name": "Sex", "value": "female"}, {"column_name": "Survived", "value": "1"}]},
+         {"data": [{"column_name": "survived", "value": "1"}, {"column_name": "sex", "value": "female"}],
+          "group_by": ["pclass"], "column_operation": "fare", "operation": "media"}),
+        ({"operation": "count", "data": [{"column_name": "Age", "value": "> 40"}]},
+         {"operation": "Contagem", "data": [{"column": "age", "value": "> 40"}]}),
+        ({"operation": "percent", "group_by": ["Pclass"], "data": [{"column_name": "Survived", "value": "1"}]},
+         {"group_by": ["PCLASS"], "operation": "porcentagem", "data": [{"column_name": "Survived", "value": "1"}]}),
+        ({"operation": ["mean", "max"], "column_operation": ["Fare", "Age"]},
+         {"operation": ["media", "max"], "column_operation": ["fare", "age"]}),
+        ({"operation": "top", "column_operation": "Fare", "limit": 10},
+         {"limit": 10, "operation": "ranking", "column_operation": "FARE"}),
+        ({"operation": "sum", "column_operation": "Fare", "special_conditions": ["Pclass == 1 and Age > 30"]},
+         {"special_conditions": "Pclass == 1 and Age > 30", "column_operation": "fare", "operation": "soma"}),
+    ]
+    pedidos = [variantes[i % len(variantes)][(i // len(variantes)) % 2] for i in range(10 * len(variantes))]
+    verificar_chaves_ignoradas(arquivo)
+    for nome_mod, mod in modulos(cache_resultados=True).items():
+        def todos(sem_cache: bool):
+            for entrada in pedidos:
+                mod.executar_pesquisa(dict(entrada, cache=False) if sem_cache else dict(entrada), arquivo_excel=arquivo)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            todos(sem_cache=True)  # planilha, máscaras e cubos já em cache nas duas medições
+            t_calculo = cronometrar(lambda: todos(sem_cache=True))
+            mod.cache_resultados = mod.CacheResultados()
+            t_cache = cronometrar(lambda: todos(sem_cache=False))
+        estatisticas = mod.cache_resultados.estatisticas()
+        print(f"[{nome_mod}] {len(pedidos)} pedidos: calculando {t_calculo * 1000:.0f} ms, "
+              f"com cache {t_cache * 1000:.1f} ms ({t_calculo / t_cache:.0f}x); "
+              f"{estatisticas['hits']} hits, {estatisticas['misses']} misses, {estatisticas['entradas']} resultados")
+
+
+def bench_metricas(pasta: str):
+    """Etapas de uma consulta em 100k linhas (cache de planilha frio e quente) e custo de medir a memória
+    (com tracemalloc ligado, a leitura do Excel fica dezenas de vezes mais lenta: só a consulta quente o usa)."""
+    arquivo = gerar_planilha(os.path.join(pasta, "metricas.xlsx"), 100_000)
+    entrada = {"operation": "mean", "column_operation": "Fare", "group_by": ["Pclass"],
+               "data": [{"column_name": "Sex", "value": "female"}, {"column_name": "Age", "value": "> 30"}]}
+    for nome_mod, mod in modulos().items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            mod.cache_planilhas.invalidar()
+            with mod.medir() as fria:
+                mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo)
+            with mod.medir(memoria=True) as quente:
+                mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo)
+            t_sem = cronometrar(lambda: mod.executar_pesquisa(dict(entrada), arquivo_excel=arquivo), 10)
+            t_com = cronometrar(lambda: mod.executar_pesquisa(dict(entrada, medir_memoria=True), arquivo_excel=arquivo), 10)
+        for rotulo, metricas in (("fria", fria), ("quente", quente)):
+            etapas = ", ".join(f"{nome} {ms:.1f}" for nome, ms in metricas.como_dict()["etapas_ms"].items())
+            print(f"[{nome_mod}] {rotulo}: {metricas.total * 1000:.1f} ms ({etapas})")
+        print(f"[{nome_mod}] consulta quente {t_sem * 1000:.1f} ms, com tracemalloc {t_com * 1000:.1f} ms "
+              f"(pico {quente.pico_memoria_bytes / 1e6:.1f} MB)")
+
+BENCHMARKS = {
+    "leitura_unica": bench_leitura_unica,
+    "projecao": bench_projecao,
+    "resolvedor": bench_resolvedor,
+    "termos": bench_termos,
+    "categorias": bench_categorias,
+    "lote": bench_lote,
+    "mascaras": bench_mascaras,
+    "condicoes": bench_condicoes,
+    "numexpr": bench_numexpr,
+    "recorte": bench_recorte,
+    "top": bench_top,
+    "cubo": bench_cubo,
+    "streaming": bench_streaming,
+    "paralelo": bench_paralelo,
+    "planilhas": bench_planilhas,
+    "motores": bench_motores,
+    "serializacao": bench_serializacao,
+    "paginacao": bench_paginacao,
+    "resultados": bench_resultados,
+    "metricas": bench_metricas,
+}
+
+
+if __name__ == "__main__":
+    selecionados = sys.argv[1:] or list(BENCHMARKS)
+    with tempfile.TemporaryDirectory() as pasta:
+        for nome in selecionados:
+            print(f"=== {nome} ===")
+            BENCHMARKS[nome](pasta)
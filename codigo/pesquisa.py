@@ -1,7 +1,45 @@
 import pandas as pd
 import re
+import os
+import io
+import ast
+import tokenize
+import functools
+import json
+import sys
+import time
+import tracemalloc
+import contextlib
+import glob
+import bisect
+import threading
 import numpy as np
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # opcional: sem pyarrow não há snapshot colunar nem leitura de .parquet
+    pa = feather = pq = None
+
+try:
+    import numexpr
+except ImportError:  # opcional: sem numexpr as condições numéricas são avaliadas com NumPy
+    numexpr = None
+
+try:
+    import python_calamine
+except ImportError:  # opcional: sem python-calamine o Excel é lido pelo openpyxl
+    python_calamine = None
+# o numexpr compensa quando divide a expressão entre núcleos; com um só, o caminho NumPy
+# (comparações escritas num buffer reaproveitado) é mais rápido
+USAR_NUMEXPR = numexpr is not None and numexpr.detect_number_of_cores() > 1
 
 # --- MAPEAMENTO DE TERMOS ---
 COLUNAS_MAPEAMENTO = {
@@ -10,6 +48,869 @@ COLUNAS_MAPEAMENTO = {
 }
 COLUNAS_MAPEAMENTO_LOWER = {k.lower(): v for k, v in COLUNAS_MAPEAMENTO.items()}
 
+# --- OPERAÇÕES ---
+OPERACOES_CONHECIDAS = {
+    "", "count", "contagem", "porcentagem", "percent", "percentage", "percentual", "mean", "media",
+    "sum", "soma", "max", "min", "std", "describe", "top", "ranking", "list", "listar",
+    "correlacao", "correlation", "compare_mean", "comparar_media",
+}
+# operações que devolvem linhas inteiras quando 'columns_to_show' não é informado
+OPERACOES_LINHAS = {"", "top", "ranking", "list", "listar"}
+# operações que podem ser pedidas juntas (lista em 'operation') e calculadas numa única passada
+AGREGACOES = {"count": "count", "contagem": "count", "mean": "mean", "media": "mean", "sum": "sum",
+              "soma": "sum", "max": "max", "min": "min", "std": "std"}
+# apelidos que executar_pesquisa trata exatamente como a operação da direita
+OPERACOES_EQUIVALENTES = {"contagem": "count", "percent": "porcentagem", "percentage": "porcentagem",
+                          "percentual": "porcentagem", "media": "mean", "soma": "sum", "ranking": "top",
+                          "listar": "list", "correlation": "correlacao", "comparar_media": "compare_mean"}
+# chaves da entrada que não mudam o resultado de executar_pesquisa
+CHAVES_FORA_DO_RESULTADO = ("cache", "arquivo_excel", "aba", "header_linha", "debug", "medir_memoria")
+
+
+# --- CACHE DE PLANILHAS ---
+# Limite de memória (em bytes) ocupado pelos DataFrames mantidos em cache
+CACHE_PLANILHAS_MAX_BYTES = 512 * 1024 * 1024
+# Colunas de texto com poucos valores distintos (sexo, porto de embarque, status...) ficam
+# como 'category': ocupam menos memória e filtros/agrupamentos trabalham sobre códigos inteiros
+CONVERTER_CATEGORIAS = True
+LIMITE_CATEGORIAS = 1000
+# Máscaras de filtros guardadas por planilha (1 bit por linha cada)
+MAX_MASCARAS = 256
+# Cubos de agregados por combinação de colunas de agrupamento de baixa cardinalidade
+USAR_CUBOS = True
+MAX_CUBOS = 32
+MAX_CELULAS_CUBO = 100_000
+
+
+class VisoesColunas:
+    """Versões normalizadas das colunas de uma planilha em cache, calculadas uma única vez:
+    numérica (pd.to_numeric com coerção) e texto fatorado (códigos + valores distintos em
+    minúsculas). O tamanho ocupado entra na contabilidade de memória do cache."""
+
+    def __init__(self, df: pd.DataFrame, herdar: Optional["VisoesColunas"] = None):
+        self.df = df
+        self.bytes = 0
+        self.ao_crescer = None  # chamado quando uma visão nova aumenta o uso de memória
+        self._visoes: Dict[Tuple, Any] = {}
+        self._pedidos: Dict[Tuple, int] = {}  # pedidos de índices ordenados ainda não montados
+        if herdar is not None:
+            self._visoes.update(herdar._visoes)
+            self.bytes = herdar.bytes
+
+    def numerica(self, coluna: str) -> pd.Series:
+        visao = self._visoes.get(("numerica", coluna))
+        if visao is None:
+            serie = self.df[coluna]
+            if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+                visao, tamanho = serie, 0  # já é numérica: reaproveita a própria coluna
+            elif isinstance(serie.dtype, pd.CategoricalDtype):
+                # converte só as categorias e expande pelos códigos
+                valores = pd.to_numeric(pd.Series(serie.cat.categories), errors="coerce").to_numpy(float)
+                visao = pd.Series(np.append(valores, np.nan)[serie.cat.codes.to_numpy()], index=serie.index)
+                tamanho = int(visao.memory_usage(index=False))
+            else:
+                visao = pd.to_numeric(serie, errors="coerce")
+                tamanho = int(visao.memory_usage(index=False))
+            self._guardar(("numerica", coluna), visao, tamanho)
+        return visao
+
+    def fatorada(self, coluna: str) -> Tuple[np.ndarray, pd.Series]:
+        visao = self._visoes.get(("fatorada", coluna))
+        if visao is None:
+            visao = fatorar_texto(self.df[coluna])
+            codigos, distintos = visao
+            self._guardar(("fatorada", coluna), visao, int(codigos.nbytes + distintos.memory_usage(index=False, deep=True)))
+        return visao
+
+    def ordenada(self, coluna: str, ascendente: bool) -> Optional[np.ndarray]:
+        """Posições das linhas na ordem estável da visão numérica (NaN por último), para
+        top-N em O(limite). Custa O(n log n) e 8 bytes por linha, então só é montada no
+        segundo pedido para a mesma coluna e direção (antes disso devolve None)."""
+        chave = ("ordenada", coluna, ascendente)
+        visao = self._visoes.get(chave)
+        if visao is None:
+            self._pedidos[chave] = self._pedidos.get(chave, 0) + 1
+            if self._pedidos[chave] >= 2:
+                valores = self.numerica(coluna).to_numpy(dtype=float, na_value=np.nan)
+                visao = np.argsort(valores if ascendente else -valores, kind="stable")
+                self._guardar(chave, visao, int(visao.nbytes))
+        return visao
+
+    def _guardar(self, chave: Tuple, visao: Any, tamanho: int) -> None:
+        if self._visoes.setdefault(chave, visao) is visao:
+            self.bytes += tamanho
+            if tamanho and self.ao_crescer is not None:
+                self.ao_crescer()
+
+
+class MascarasPredicados:
+    """Máscaras booleanas dos predicados atômicos já avaliados sobre uma planilha em cache.
+    A chave é o predicado canônico (tipo, coluna real, operador, valor), então filtros
+    repetidos entre consultas viram apenas ANDs de máscaras prontas. Cada máscara fica
+    compactada (np.packbits, 1 bit por linha) num LRU limitado por MAX_MASCARAS."""
+
+    def __init__(self, linhas: int, herdar: Optional["MascarasPredicados"] = None):
+        self.linhas = linhas
+        self.bytes = 0
+        self.acertos = 0
+        self.faltas = 0
+        self.ao_crescer = None  # chamado quando uma máscara nova aumenta o uso de memória
+        self._itens: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        if herdar is not None:
+            self._itens.update(herdar._itens)
+            self.bytes, self.acertos, self.faltas = herdar.bytes, herdar.acertos, herdar.faltas
+
+    def obter(self, chave: Tuple, calcular) -> Any:
+        """Máscara do predicado 'chave'; 'calcular' só é chamado se ela ainda não estiver guardada."""
+        with self._lock:
+            compacta = self._itens.get(chave)
+            if compacta is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+            else:
+                self.faltas += 1
+        if compacta is not None:
+            return np.unpackbits(compacta, count=self.linhas).view(bool)
+        valor = calcular()
+        mascara = np.asarray(valor)
+        if mascara.dtype != bool or mascara.shape != (self.linhas,):
+            return valor  # não é uma máscara por linha (ex.: expressão com NA): não guarda
+        compacta = np.packbits(mascara)
+        with self._lock:
+            if chave not in self._itens:
+                self._itens[chave] = compacta
+                self.bytes += compacta.nbytes
+            while len(self._itens) > MAX_MASCARAS:
+                self.bytes -= self._itens.popitem(last=False)[1].nbytes
+        if self.ao_crescer is not None:
+            self.ao_crescer()
+        return mascara
+
+
+class CuboAgregado:
+    """Agregados pré-calculados de uma planilha por célula (combinação de valores) de algumas
+    colunas de agrupamento: linhas por célula e, para cada coluna numérica já pedida, contagem
+    de valores, soma e soma dos quadrados dos desvios (m2). Também guarda a célula de cada
+    linha, então a contagem por grupo de uma consulta filtrada vira np.bincount sobre a máscara."""
+
+    def __init__(self, df: pd.DataFrame, dimensoes: Tuple[str, ...]):
+        grupos = df.groupby(list(dimensoes), observed=True, sort=True)
+        tamanhos = grupos.size()
+        self.indice = tamanhos.index
+        self.linhas = tamanhos.to_numpy()
+        # célula + 1 de cada linha; 0 = alguma dimensão vazia (fica fora dos grupos, como no groupby)
+        self.celula = (grupos.ngroup().fillna(-1).to_numpy() + 1).astype(np.int32)
+        self.medidas: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self.bytes = int(self.celula.nbytes + self.linhas.nbytes)
+
+    def serie(self, valores: np.ndarray, presentes: Optional[np.ndarray] = None) -> pd.Series:
+        """Valores por célula como uma Series com o mesmo índice que o groupby devolveria."""
+        if presentes is None or presentes.all():
+            return pd.Series(valores, index=self.indice)
+        return pd.Series(valores[presentes], index=self.indice[presentes])
+
+    def contagem(self, mascara: Optional[np.ndarray] = None) -> np.ndarray:
+        """Linhas por célula (só as da máscara, se houver)."""
+        if mascara is None:
+            return self.linhas
+        return np.bincount(self.celula[mascara], minlength=len(self.linhas) + 1)[1:]
+
+    def momentos(self, coluna: str, valores) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(valores válidos, soma, m2) por célula da coluna numérica, sobre todas as linhas; m2 é a
+        soma dos quadrados dos desvios em relação à média da célula, calculada em duas passadas (a
+        fórmula Σx² - n·média² perde precisão por cancelamento em colunas de valores grandes).
+        'valores' é chamado só na primeira vez, para obter o array float da coluna; depois o
+        resultado sai do cubo sem tocar nas linhas."""
+        medida = self.medidas.get(coluna)
+        if medida is None:
+            v = valores()
+            validos = ~np.isnan(v)
+            celula, v = self.celula[validos], v[validos]
+            k = len(self.linhas) + 1
+            n = np.bincount(celula, minlength=k)
+            soma = np.bincount(celula, weights=v, minlength=k)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                desvios = v - np.where(n > 0, soma / n, 0.0)[celula]
+            m2 = np.bincount(celula, weights=desvios * desvios, minlength=k)
+            medida = (n[1:], soma[1:], m2[1:])
+            self.medidas[coluna] = medida
+            self.bytes += sum(a.nbytes for a in medida)
+        return medida
+
+
+class CubosPlanilha:
+    """Cubos de agregados de uma planilha em cache, um por tupla de colunas de agrupamento,
+    montados na primeira consulta que os usa. Só colunas de baixa cardinalidade viram
+    dimensão. Como a planilha em cache é trocada quando o arquivo muda, os cubos também."""
+
+    def __init__(self, df: pd.DataFrame, herdar: Optional["CubosPlanilha"] = None):
+        self.df = df
+        self.acertos = 0
+        self.faltas = 0
+        self.ao_crescer = None  # chamado quando um cubo novo aumenta o uso de memória
+        self._itens: "OrderedDict[Tuple[str, ...], CuboAgregado]" = OrderedDict()
+        self._cardinalidade: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if herdar is not None:
+            self._itens.update(herdar._itens)
+            self._cardinalidade.update(herdar._cardinalidade)
+            self.acertos, self.faltas = herdar.acertos, herdar.faltas
+
+    @property
+    def bytes(self) -> int:
+        return sum(c.bytes for c in list(self._itens.values()))
+
+    def cardinalidade(self, coluna: str) -> int:
+        if coluna not in self._cardinalidade:
+            self._cardinalidade[coluna] = int(self.df[coluna].nunique(dropna=True))
+        return self._cardinalidade[coluna]
+
+    def obter(self, dimensoes: List[str]) -> Optional[CuboAgregado]:
+        """Cubo das colunas 'dimensoes' (na ordem dada), ou None se ele não se aplica
+        (cubos desligados, coluna ausente, repetida ou com valores distintos demais)."""
+        chave = tuple(dimensoes)
+        if not USAR_CUBOS or not chave or len(set(chave)) != len(chave) \
+                or any(d not in self.df.columns for d in chave):
+            return None
+        with self._lock:
+            cubo = self._itens.get(chave)
+            if cubo is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return cubo
+        celulas = 1
+        for d in chave:
+            distintos = self.cardinalidade(d)
+            if distintos > LIMITE_CATEGORIAS:
+                return None
+            celulas *= max(distintos, 1)
+        if celulas > MAX_CELULAS_CUBO:
+            return None
+        cubo = CuboAgregado(self.df, chave)
+        with self._lock:
+            self.faltas += 1
+            self._itens[chave] = cubo
+            while len(self._itens) > MAX_CUBOS:
+                self._itens.popitem(last=False)
+        if self.ao_crescer is not None:
+            self.ao_crescer()
+        return cubo
+
+
+class PlanilhaCarregada:
+    """O que já foi lido de uma planilha: a lista completa de colunas (esquema) e um
+    DataFrame só com as colunas carregadas até agora (None se só o cabeçalho foi lido)."""
+
+    def __init__(self, esquema: List[str], df: Optional[pd.DataFrame] = None,
+                 visoes: Optional[VisoesColunas] = None, mascaras: Optional[MascarasPredicados] = None,
+                 cubos: Optional[CubosPlanilha] = None):
+        self.esquema = esquema
+        self.df = df
+        self.visoes = VisoesColunas(df, herdar=visoes) if df is not None else None
+        self.mascaras = MascarasPredicados(len(df), herdar=mascaras) if df is not None else None
+        self.cubos = CubosPlanilha(df, herdar=cubos) if df is not None else None
+        self.economia_categorias = 0  # bytes poupados pela conversão para 'category'
+        self._bytes_df = int(df.memory_usage(index=True, deep=True).sum()) if df is not None else 0
+
+    def faltando(self, colunas: Optional[List[str]] = None) -> List[str]:
+        """Colunas pedidas (todas, se None) que ainda não estão carregadas."""
+        carregadas = set(self.df.columns) if self.df is not None else set()
+        pedidas = self.esquema if colunas is None else [c for c in self.esquema if c in set(colunas)]
+        return [c for c in pedidas if c not in carregadas]
+
+    def tamanho_bytes(self) -> int:
+        if self.df is None:
+            return self._bytes_df
+        return self._bytes_df + self.visoes.bytes + self.mascaras.bytes + self.cubos.bytes
+
+
+class CachePlanilhas:
+    """Cache LRU de planilhas já lidas, limitado pelo total de memória ocupada.
+
+    A chave inclui mtime e tamanho do arquivo, então uma planilha alterada no disco
+    gera uma entrada nova (a versão antiga é descartada ao guardar a nova)."""
+
+    def __init__(self, max_bytes: int = CACHE_PLANILHAS_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._itens: "OrderedDict[Tuple, Tuple[PlanilhaCarregada, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        # chave -> (trava, usuários) das cargas em andamento (ver carregando)
+        self._carregando: Dict[Tuple, Tuple[threading.Lock, int]] = {}
+        self.cargas_aguardadas = 0
+
+    @staticmethod
+    def chave(arquivo_excel: str, aba: Any, header_linha: int) -> Tuple:
+        caminho = os.path.abspath(arquivo_excel)
+        st = os.stat(caminho)  # FileNotFoundError se o arquivo não existir
+        return (caminho, aba, header_linha, CONVERTER_CATEGORIAS, st.st_mtime_ns, st.st_size)
+
+    def obter(self, chave: Tuple) -> Optional[PlanilhaCarregada]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            self._itens.move_to_end(chave)
+            return item[0]
+
+    def contar(self, acerto: bool) -> None:
+        with self._lock:
+            if acerto:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def guardar(self, chave: Tuple, planilha: PlanilhaCarregada) -> None:
+        tamanho = planilha.tamanho_bytes()
+        with self._lock:
+            # remove versões antigas do mesmo arquivo/aba/cabeçalho/configuração
+            for antiga in [k for k in self._itens if k[:4] == chave[:4]]:
+                self._remover(antiga)
+            if tamanho > self.max_bytes:
+                return
+            self._itens[chave] = (planilha, tamanho)
+            self._total_bytes += tamanho
+            while self._total_bytes > self.max_bytes and self._itens:
+                self._remover(next(iter(self._itens)))
+
+    @contextlib.contextmanager
+    def carregando(self, chave: Tuple) -> Iterator[None]:
+        """Uma carga por vez para cada chave: quem chega enquanto a mesma versão da planilha
+        está sendo lida espera por ela e depois a encontra no cache, em vez de lê-la de novo."""
+        with self._lock:
+            trava, usuarios = self._carregando.get(chave, (None, 0))
+            if trava is None:
+                trava = threading.Lock()
+            else:
+                self.cargas_aguardadas += 1
+            self._carregando[chave] = (trava, usuarios + 1)
+        try:
+            with trava:
+                yield
+        finally:
+            with self._lock:
+                trava, usuarios = self._carregando[chave]
+                if usuarios == 1:
+                    del self._carregando[chave]
+                else:
+                    self._carregando[chave] = (trava, usuarios - 1)
+
+    def recontar(self, chave: Tuple) -> None:
+        """Atualiza o tamanho de uma entrada que cresceu (ex.: visões de colunas novas)."""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return
+            tamanho = item[0].tamanho_bytes()
+            self._itens[chave] = (item[0], tamanho)
+            self._total_bytes += tamanho - item[1]
+            while self._total_bytes > self.max_bytes and self._itens:
+                self._remover(next(iter(self._itens)))
+
+    def invalidar(self, arquivo_excel: Optional[str] = None) -> None:
+        """Remove as entradas de um arquivo (ou todas, se nenhum for informado)."""
+        with self._lock:
+            if arquivo_excel is None:
+                self._itens.clear()
+                self._total_bytes = 0
+                return
+            caminho = os.path.abspath(arquivo_excel)
+            # inclui as entradas de várias planilhas (obter_planilhas) que contêm o arquivo
+            for k in [k for k in self._itens if k[0] == caminho
+                      or isinstance(k[0], tuple) and any(f[0] == caminho for f in k[0])]:
+                self._remover(k)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            mascaras = [p.mascaras for p, _ in self._itens.values() if p.mascaras is not None]
+            acertos = sum(m.acertos for m in mascaras)
+            faltas = sum(m.faltas for m in mascaras)
+            cubos = [p.cubos for p, _ in self._itens.values() if p.cubos is not None]
+            cubos_acertos = sum(c.acertos for c in cubos)
+            cubos_faltas = sum(c.faltas for c in cubos)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": round(self.hits / total, 4) if total else 0.0,
+                "cargas_aguardadas": self.cargas_aguardadas,
+                "entradas": len(self._itens),
+                "bytes": self._total_bytes,
+                "economia_categorias_bytes": sum(p.economia_categorias for p, _ in self._itens.values()),
+                "mascaras_acertos": acertos,
+                "mascaras_faltas": faltas,
+                "mascaras_taxa_acerto": round(acertos / (acertos + faltas), 4) if acertos + faltas else 0.0,
+                "cubos_acertos": cubos_acertos,
+                "cubos_faltas": cubos_faltas,
+                "cubos_taxa_acerto": round(cubos_acertos / (cubos_acertos + cubos_faltas), 4)
+                if cubos_acertos + cubos_faltas else 0.0,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remover(self, chave: Tuple) -> None:
+        _, tamanho = self._itens.pop(chave)
+        self._total_bytes -= tamanho
+
+
+cache_planilhas = CachePlanilhas()
+
+
+# --- SNAPSHOT COLUNAR (Arrow IPC / Feather) ---
+# Na primeira leitura de uma planilha é gravado um arquivo .arrow ao lado dela, com as
+# colunas já limpas e tipadas. As leituras seguintes usam esse arquivo (memory-mapped),
+# que carrega em milissegundos, e ele é refeito sempre que a planilha de origem muda.
+# Requer pyarrow; sem ele a planilha é lida normalmente.
+USAR_SNAPSHOT = True
+EXTENSOES_PLANILHA = (".xlsx", ".xlsm", ".xls")
+
+
+def caminho_snapshot(arquivo_excel: str, aba: Any = 0, header_linha: int = 0) -> str:
+    sufixo = re.sub(r"[^\w-]+", "_", str(aba))
+    return f"{arquivo_excel}.aba-{sufixo}.h{header_linha}.arrow"
+
+
+def coagir_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """Uniformiza colunas 'object' de tipo misto: só números -> numérico, demais -> texto.
+    Colunas de texto puro ficam como estão."""
+    for i in np.flatnonzero((df.dtypes == object).to_numpy()):
+        serie = df.iloc[:, i]
+        valores = serie.dropna()
+        tipos = set(map(type, valores))
+        if len(tipos) <= 1 and not tipos & {int, float}:
+            continue
+        if all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in valores):
+            df.isetitem(i, pd.to_numeric(serie, errors="coerce"))
+        else:
+            df.isetitem(i, serie.where(serie.isna(), serie.astype(str)))
+    return df
+
+
+def converter_categorias(df: pd.DataFrame) -> int:
+    """Converte para 'category' as colunas de texto com poucos valores distintos
+    (até LIMITE_CATEGORIAS e no máximo metade das linhas). Retorna os bytes economizados."""
+    economia = 0
+    texto = [dt == object or isinstance(dt, pd.StringDtype) for dt in df.dtypes]
+    for i in np.flatnonzero(texto):
+        serie = df.iloc[:, i]
+        distintos = serie.nunique(dropna=True)
+        if distintos > LIMITE_CATEGORIAS or distintos > len(serie) // 2:
+            continue
+        categorica = serie.astype("category")
+        economia += int(serie.memory_usage(index=False, deep=True) - categorica.memory_usage(index=False, deep=True))
+        df.isetitem(i, categorica)
+    return economia
+
+
+def snapshot_valido(caminho: str, st_origem: os.stat_result) -> bool:
+    """Confere (só pelo cabeçalho do arquivo) se o snapshot corresponde à versão atual da planilha."""
+    if pa is None or not os.path.exists(caminho):
+        return False
+    try:
+        with pa.memory_map(caminho) as origem:
+            meta = pa.ipc.open_file(origem).schema.metadata or {}
+    except Exception:
+        return False
+    return (meta.get(b"origem_mtime_ns") == str(st_origem.st_mtime_ns).encode()
+            and meta.get(b"origem_tamanho") == str(st_origem.st_size).encode())
+
+
+def ler_snapshot(caminho: str, st_origem: os.stat_result, colunas: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    if not snapshot_valido(caminho, st_origem):
+        return None
+    try:
+        return feather.read_table(caminho, columns=colunas, memory_map=True).to_pandas(split_blocks=True)
+    except Exception:
+        return None
+
+
+def gravar_snapshot(caminho: str, df: pd.DataFrame, st_origem: os.stat_result) -> bool:
+    if pa is None:
+        return False
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(tabela.schema.metadata or {})
+        meta[b"origem_mtime_ns"] = str(st_origem.st_mtime_ns).encode()
+        meta[b"origem_tamanho"] = str(st_origem.st_size).encode()
+        tabela = tabela.replace_schema_metadata(meta)
+        # sem compressão, para que a leitura possa mapear o arquivo direto na memória
+        feather.write_feather(tabela, temporario, compression="uncompressed")
+        os.replace(temporario, caminho)
+        return True
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        return False
+
+
+# --- MOTORES DE LEITURA DO EXCEL ---
+# "calamine" (python-calamine, em Rust), "openpyxl_read_only" (linhas lidas direto do openpyxl
+# em modo leitura, sem a conversão célula a célula do pd.read_excel) e "pandas" (pd.read_excel
+# com o motor padrão). Em "auto" a escolha é pelo tipo e tamanho do arquivo; se o motor
+# escolhido falhar, os seguintes são tentados. Ver o benchmark "motores".
+MOTOR_LEITURA = "auto"
+LIMITE_READ_ONLY_BYTES = 256 * 1024  # arquivos pequenos são lidos em menos de 1 s por qualquer motor
+EXTENSOES_CALAMINE = (".xlsx", ".xlsm", ".xlsb", ".xls", ".ods")
+EXTENSOES_READ_ONLY = (".xlsx", ".xlsm")
+ERROS_EXCEL = frozenset({"#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A", "#GETTING_DATA"})
+
+
+def motores_leitura(arquivo_excel: str, motor: Optional[str] = None) -> List[str]:
+    """Motores a tentar, em ordem, para o arquivo: o pedido (ou o escolhido em "auto") primeiro."""
+    motor = motor or MOTOR_LEITURA
+    extensao = os.path.splitext(arquivo_excel)[1].lower()
+    motores = []
+    if python_calamine is not None and extensao in EXTENSOES_CALAMINE:
+        motores.append("calamine")
+    if extensao in EXTENSOES_READ_ONLY:
+        motores.append("openpyxl_read_only")
+    motores.append("pandas")
+    if motor != "auto":
+        return [motor] + [m for m in motores if m != motor]
+    if motores[0] == "openpyxl_read_only" and os.path.getsize(arquivo_excel) < LIMITE_READ_ONLY_BYTES:
+        motores.remove("openpyxl_read_only")
+    return motores
+
+
+def _ler_pandas(arquivo_excel: str, aba: Any, header_linha: int, colunas: Optional[List[str]],
+                engine: Optional[str] = None) -> pd.DataFrame:
+    usecols = None
+    if colunas is not None:
+        conjunto = set(colunas)
+        usecols = lambda c: str(c).strip() in conjunto
+    return pd.read_excel(arquivo_excel, sheet_name=aba, header=header_linha, usecols=usecols, engine=engine)
+
+
+def _ler_calamine(arquivo_excel: str, aba: Any, header_linha: int, colunas: Optional[List[str]]) -> pd.DataFrame:
+    if python_calamine is None:
+        raise ImportError("python-calamine não está instalado")
+    return _ler_pandas(arquivo_excel, aba, header_linha, colunas, engine="calamine")
+
+
+def _ler_read_only(arquivo_excel: str, aba: Any, header_linha: int, colunas: Optional[List[str]]) -> pd.DataFrame:
+    """Mesmas linhas e conversões do leitor openpyxl do pandas (vazio -> "", número inteiro ->
+    int, erro -> NaN, linhas vazias do fim removidas), mas com iter_rows(values_only=True), que
+    não cria um objeto por célula. A inferência de tipos é a do próprio read_excel (TextParser)."""
+    livro, planilha = _abrir_aba(arquivo_excel, aba)
+    try:
+        planilha.reset_dimensions()
+        dados: List[List[Any]] = []
+        ultima = 0
+        for linha in planilha.iter_rows(values_only=True):
+            convertida = ["" if v is None else int(v) if v.__class__ is float and v.is_integer()
+                          else np.nan if v.__class__ is str and v in ERROS_EXCEL else v for v in linha]
+            while convertida and convertida[-1] == "":
+                convertida.pop()
+            dados.append(convertida)
+            if convertida:
+                ultima = len(dados)
+    finally:
+        livro.close()
+    del dados[ultima:]
+    largura = max(map(len, dados), default=0)
+    for linha in dados:
+        linha.extend([""] * (largura - len(linha)))
+    usecols = None
+    if colunas is not None:
+        conjunto = set(colunas)
+        usecols = lambda c: str(c).strip() in conjunto
+    try:
+        return TextParser(dados, header=header_linha, usecols=usecols, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+MOTORES_LEITURA = {"calamine": _ler_calamine, "openpyxl_read_only": _ler_read_only, "pandas": _ler_pandas}
+
+
+def ler_excel(arquivo_excel: str, aba: Any = 0, header_linha: int = 0, colunas: Optional[List[str]] = None,
+              motor: Optional[str] = None) -> pd.DataFrame:
+    """Lê a aba com o primeiro motor de motores_leitura que funcionar (nomes de colunas limpos,
+    tipos ainda não coagidos). Com `colunas`, lê só essas colunas."""
+    erro: Optional[Exception] = None
+    for nome in motores_leitura(arquivo_excel, motor):
+        try:
+            df = MOTORES_LEITURA[nome](arquivo_excel, aba, header_linha, colunas)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            erro = erro or e  # o erro do motor preferido é o mais informativo
+            continue
+        df.columns = [str(c).strip() for c in df.columns]
+        return df
+    raise erro
+
+
+def ler_esquema(arquivo_excel: str, aba: Any = 0, header_linha: int = 0) -> List[str]:
+    """Lê apenas os nomes (limpos) das colunas: do snapshot, se válido, ou do cabeçalho do Excel."""
+    snapshot = caminho_snapshot(arquivo_excel, aba, header_linha)
+    if USAR_SNAPSHOT and snapshot_valido(snapshot, os.stat(arquivo_excel)):
+        with pa.memory_map(snapshot) as origem:
+            return list(pa.ipc.open_file(origem).schema.names)
+    cabecalho = pd.read_excel(arquivo_excel, sheet_name=aba, header=header_linha, nrows=0)
+    return [str(c).strip() for c in cabecalho.columns]
+
+
+def ler_planilha(arquivo_excel: str, aba: Any = 0, header_linha: int = 0, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """Lê a planilha do disco (snapshot, se válido, ou o próprio Excel), sem passar pelo cache.
+    Com `colunas`, lê só essas colunas sempre que possível (o resultado pode trazer outras)."""
+    st = os.stat(arquivo_excel)
+    snapshot = caminho_snapshot(arquivo_excel, aba, header_linha)
+    if USAR_SNAPSHOT:
+        df = ler_snapshot(snapshot, st, colunas)
+        if df is not None:
+            return df
+        if pa is not None:
+            # sem snapshot válido: lê tudo uma vez para gerá-lo; as próximas leituras projetam nele
+            colunas = None
+    df = coagir_tipos(ler_excel(arquivo_excel, aba, header_linha, colunas))
+    if USAR_SNAPSHOT and colunas is None:
+        gravar_snapshot(snapshot, df, st)
+    return df
+
+
+def gerar_snapshots(pasta: str, aba: Any = 0, header_linha: int = 0) -> List[str]:
+    """Pré-gera os snapshots de todas as planilhas de uma pasta. Retorna os arquivos gerados."""
+    if pa is None:
+        print("pyarrow não está instalado: execute 'pip install pyarrow' para gerar snapshots.")
+        return []
+    gerados = []
+    for nome in sorted(os.listdir(pasta)):
+        arquivo = os.path.join(pasta, nome)
+        if nome.startswith("~$") or not nome.lower().endswith(EXTENSOES_PLANILHA):
+            continue
+        snapshot = caminho_snapshot(arquivo, aba, header_linha)
+        try:
+            if snapshot_valido(snapshot, os.stat(arquivo)):
+                print(f"Snapshot já atualizado: {snapshot}")
+                continue
+            ler_planilha(arquivo, aba, header_linha)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler {arquivo}: {e}")
+            continue
+        if snapshot_valido(snapshot, os.stat(arquivo)):
+            gerados.append(snapshot)
+            print(f"Snapshot gerado: {snapshot}")
+        else:
+            print(f"⚠️ Não foi possível gravar o snapshot de {arquivo}")
+    return gerados
+
+
+# --- VÁRIAS PLANILHAS (arquivos e abas) ---
+# 'arquivo_excel' aceita um padrão glob ("dados/vendas-*.xlsx") ou uma lista de arquivos, e
+# 'aba' uma lista de abas ou "all" (todas). Cada (arquivo, aba) tem a sua entrada no cache,
+# então incluir um mês novo só lê esse mês; as partes são carregadas em paralelo e empilhadas
+# (só com as colunas pedidas) com uma coluna que identifica a origem de cada linha.
+COLUNA_ORIGEM = "origem"
+EXTENSOES_FONTES = (".xlsx", ".xlsm", ".xls", ".csv", ".parquet")
+LEITURAS_PARALELAS = 8
+
+
+@functools.lru_cache(maxsize=256)
+def _abas_arquivo(caminho: str, mtime_ns: int) -> Tuple[str, ...]:
+    with pd.ExcelFile(caminho) as livro:
+        return tuple(livro.sheet_names)
+
+
+def abas_planilha(arquivo_excel: str) -> List[str]:
+    """Nomes de todas as abas do arquivo (lidos uma vez por versão do arquivo)."""
+    if str(arquivo_excel).lower().endswith(EXTENSOES_BLOCOS):
+        return [0]
+    caminho = os.path.abspath(arquivo_excel)
+    return list(_abas_arquivo(caminho, os.stat(caminho).st_mtime_ns))
+
+
+def expandir_fontes(arquivo_excel: Any, aba: Any = None) -> List[Tuple[str, Any]]:
+    """(arquivo, aba) de cada planilha pedida, na ordem: padrões glob são expandidos em ordem
+    alfabética e "all"/"todas" em 'aba' vira a lista de abas de cada arquivo."""
+    caminhos = arquivo_excel if isinstance(arquivo_excel, (list, tuple)) else [arquivo_excel]
+    arquivos: List[str] = []
+    for caminho in map(str, caminhos):
+        if re.search(r"[*?\[]", caminho):
+            achados = [a for a in sorted(glob.glob(caminho)) if a.lower().endswith(EXTENSOES_FONTES)
+                       and not os.path.basename(a).startswith("~$")]
+            if not achados:
+                raise FileNotFoundError(caminho)
+            arquivos.extend(achados)
+        else:
+            arquivos.append(caminho)
+    fontes = []
+    for arquivo in dict.fromkeys(arquivos):
+        if isinstance(aba, str) and aba.strip().lower() in ("all", "todas"):
+            abas = abas_planilha(arquivo)
+        elif isinstance(aba, (list, tuple)):
+            abas = list(aba) or [0]
+        else:
+            abas = [aba or 0]
+        fontes.extend((arquivo, a) for a in abas)
+    return fontes
+
+
+def rotulos_fontes(fontes: List[Tuple[str, Any]]) -> List[str]:
+    """Valor da coluna de origem de cada fonte: o nome do arquivo, a aba, ou os dois."""
+    arquivos = {a for a, _ in fontes}
+    if len(arquivos) == len(fontes):
+        return [os.path.basename(a) for a, _ in fontes]
+    if len(arquivos) == 1:
+        return [str(aba) for _, aba in fontes]
+    return [f"{os.path.basename(a)}:{aba}" for a, aba in fontes]
+
+
+def esquema_fontes(fontes: List[Tuple[str, Any]], header_linha: int = 0) -> List[str]:
+    """União dos esquemas das fontes (na ordem em que aparecem) mais a coluna de origem."""
+    esquemas = [esquema_planilha(a, aba, header_linha) for a, aba in fontes]
+    return list(dict.fromkeys(c for e in esquemas for c in e if c != COLUNA_ORIGEM)) + [COLUNA_ORIGEM]
+
+
+def obter_planilhas(fontes: List[Tuple[str, Any]], header_linha: int = 0,
+                    colunas: Optional[List[str]] = None) -> PlanilhaCarregada:
+    """Entrada do cache com as fontes empilhadas (mais a coluna de origem). Cada fonte vem da
+    sua própria entrada do cache; só as que faltam são lidas, em paralelo."""
+    chaves = [CachePlanilhas.chave(a, aba, header_linha) for a, aba in fontes]
+    # os 4 primeiros campos identificam o conjunto (versões antigas são trocadas), o último as versões
+    chave = (tuple((c[0], c[1]) for c in chaves), "fontes", header_linha, CONVERTER_CATEGORIAS,
+             tuple((c[4], c[5]) for c in chaves))
+    esquema = esquema_fontes(fontes, header_linha)
+    # leituras simultâneas do mesmo conjunto viram uma só
+    with cache_planilhas.carregando(chave):
+        if colunas is not None and len(set(esquema)) != len(esquema):
+            colunas = None
+        planilha = cache_planilhas.obter(chave)
+        if planilha is not None and planilha.df is not None and not planilha.faltando(colunas):
+            cache_planilhas.contar(True)
+            return planilha
+        cache_planilhas.contar(False)
+
+        pedidas = None if colunas is None else [c for c in colunas if c != COLUNA_ORIGEM]
+        if pedidas is not None and planilha is not None and planilha.df is not None:
+            pedidas = list(dict.fromkeys(list(planilha.df.columns) + pedidas))  # mantém o que já estava carregado
+        if pedidas is not None:
+            pedidas = [c for c in pedidas if c != COLUNA_ORIGEM] or esquema[:1]
+        preparar_fontes(fontes, header_linha)
+        with ThreadPoolExecutor(max_workers=max(1, min(len(fontes), LEITURAS_PARALELAS))) as executor:
+            partes = list(executor.map(lambda f: obter_planilha(f[0], f[1], header_linha, colunas=pedidas), fontes))
+
+        usar = [c for c in esquema if c != COLUNA_ORIGEM and (pedidas is None or c in set(pedidas))]
+        df = pd.concat([p.df.reindex(columns=usar) for p in partes], ignore_index=True)
+        tamanhos = [len(p.df) for p in partes]
+        rotulos = rotulos_fontes(fontes)
+        categorias = list(dict.fromkeys(rotulos))
+        codigos = np.repeat([categorias.index(r) for r in rotulos], tamanhos).astype(np.int32)
+        df[COLUNA_ORIGEM] = pd.Categorical.from_codes(codigos, categories=categorias)
+        economia = converter_categorias(df) if CONVERTER_CATEGORIAS else 0
+        planilha = PlanilhaCarregada(esquema, df)
+        planilha.economia_categorias = economia
+        planilha.visoes.ao_crescer = planilha.mascaras.ao_crescer = planilha.cubos.ao_crescer = \
+            lambda: cache_planilhas.recontar(chave)
+        cache_planilhas.guardar(chave, planilha)
+        return planilha
+
+
+def gravar_snapshot_fonte(arquivo_excel: str, aba: Any, header_linha: int) -> None:
+    ler_planilha(arquivo_excel, aba, header_linha)
+
+
+def preparar_fontes(fontes: List[Tuple[str, Any]], header_linha: int = 0) -> None:
+    """Lê em processos separados as planilhas que ainda não estão no cache nem têm snapshot,
+    gravando os snapshots. A leitura do Excel (openpyxl) segura o GIL e não se beneficiaria de
+    threads; com os snapshots gravados, as threads de obter_planilhas só os mapeiam."""
+    if pa is None or not USAR_SNAPSHOT or PROCESSOS_PARALELOS < 2:
+        return
+    faltam = []
+    for arquivo, aba in fontes:
+        if not arquivo.lower().endswith(EXTENSOES_PLANILHA):
+            continue
+        carregada = cache_planilhas.obter(CachePlanilhas.chave(arquivo, aba, header_linha))
+        if (carregada is None or carregada.df is None) and \
+                not snapshot_valido(caminho_snapshot(arquivo, aba, header_linha), os.stat(arquivo)):
+            faltam.append((arquivo, aba))
+    if len(faltam) > 1:
+        executor = obter_executor(min(len(faltam), PROCESSOS_PARALELOS))
+        list(executor.map(gravar_snapshot_fonte, [a for a, _ in faltam], [aba for _, aba in faltam],
+                          [header_linha] * len(faltam)))
+
+
+def esquema_planilha(arquivo_excel: str, aba: Optional[int] = None, header_linha: int = 0) -> List[str]:
+    """Nomes (limpos) de todas as colunas da planilha, sem carregar as linhas."""
+    fontes = expandir_fontes(arquivo_excel, aba)
+    if len(fontes) > 1:
+        return esquema_fontes(fontes, header_linha)
+    arquivo_excel, aba = fontes[0]
+    chave = CachePlanilhas.chave(arquivo_excel, aba or 0, header_linha)
+    planilha = cache_planilhas.obter(chave)
+    if planilha is None:
+        planilha = PlanilhaCarregada(ler_esquema(arquivo_excel, aba or 0, header_linha))
+        cache_planilhas.guardar(chave, planilha)
+    return planilha.esquema
+
+
+def obter_planilha(arquivo_excel: str, aba: Optional[int] = None, header_linha: int = 0,
+                   colunas: Optional[List[str]] = None) -> PlanilhaCarregada:
+    """Devolve a entrada do cache da planilha (lendo do disco o que faltar), com o DataFrame
+    de colunas limpas e as visões normalizadas. Com `colunas`, garante apenas que essas
+    colunas estejam carregadas; as que faltam são lidas e somadas à entrada do cache.
+    Com várias planilhas (glob/lista em 'arquivo_excel', lista ou "all" em 'aba'), ver obter_planilhas."""
+    fontes = expandir_fontes(arquivo_excel, aba)
+    if len(fontes) > 1:
+        return obter_planilhas(fontes, header_linha, colunas)
+    arquivo_excel, aba = fontes[0]
+    aba = aba or 0
+    chave = CachePlanilhas.chave(arquivo_excel, aba, header_linha)
+    # leituras simultâneas da mesma planilha viram uma só
+    with cache_planilhas.carregando(chave):
+        planilha = cache_planilhas.obter(chave) or PlanilhaCarregada(ler_esquema(arquivo_excel, aba, header_linha))
+        if colunas is not None and len(set(planilha.esquema)) != len(planilha.esquema):
+            colunas = None  # nomes repetidos: a projeção não é confiável
+        elif colunas is not None and not [c for c in colunas if c in planilha.esquema]:
+            colunas = planilha.esquema[:1]  # ao menos uma coluna, para saber o número de linhas
+        faltando = planilha.faltando(colunas)
+        cache_planilhas.contar(not faltando and planilha.df is not None)
+        if planilha.df is not None and not faltando:
+            return planilha
+
+        economia = 0
+        if colunas is None:
+            df = ler_planilha(arquivo_excel, aba, header_linha)
+            economia = converter_categorias(df) if CONVERTER_CATEGORIAS else 0
+        else:
+            pedidas = set(faltando)
+            novo = ler_planilha(arquivo_excel, aba, header_linha, faltando)
+            novo = novo[[c for c in novo.columns if c in pedidas]]
+            economia = converter_categorias(novo) if CONVERTER_CATEGORIAS else 0
+            if planilha.df is None:
+                df = novo
+            elif len(planilha.df) == len(novo):
+                df = pd.concat([planilha.df, novo], axis=1)
+                carregadas = set(df.columns)
+                df = df[[c for c in planilha.esquema if c in carregadas]]
+                economia += planilha.economia_categorias
+            else:
+                # leituras parciais divergentes (não deveria ocorrer): recarrega a planilha inteira
+                df = ler_planilha(arquivo_excel, aba, header_linha)
+                economia = converter_categorias(df) if CONVERTER_CATEGORIAS else 0
+        # as visões, máscaras e cubos já calculados continuam válidos se as linhas são as mesmas
+        mesmas_linhas = planilha.df is not None and len(planilha.df) == len(df)
+        planilha = PlanilhaCarregada(planilha.esquema, df,
+                                     visoes=planilha.visoes if mesmas_linhas else None,
+                                     mascaras=planilha.mascaras if mesmas_linhas else None,
+                                     cubos=planilha.cubos if mesmas_linhas else None)
+        planilha.economia_categorias = economia
+        planilha.visoes.ao_crescer = planilha.mascaras.ao_crescer = planilha.cubos.ao_crescer = \
+            lambda: cache_planilhas.recontar(chave)
+        cache_planilhas.guardar(chave, planilha)
+        return planilha
+
+
+def carregar_planilha(arquivo_excel: str, aba: Optional[int] = None, header_linha: int = 0,
+                      colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """Lê a planilha (ou devolve a versão em cache) já com os nomes de colunas limpos.
+    Com `colunas`, o DataFrame tem ao menos essas colunas (pode trazer outras já em cache).
+    Ele é compartilhado entre consultas: não deve ser alterado."""
+    return obter_planilha(arquivo_excel, aba, header_linha, colunas).df
+
 
 # --- Funções auxiliares ---
 def normalizar_colunas(df: pd.DataFrame) -> Dict[str, str]:
@@ -26,46 +927,133 @@ def normalizar_coluna_para_busca(df: pd.DataFrame, coluna: str) -> Optional[str]
             return col
     return None
 
-def mapear_coluna(coluna: Any, df_map: Dict[str, str], df: Optional[pd.DataFrame] = None) -> Optional[str]:
-    """Mapeia nomes livres/português para a coluna real do DataFrame.
-       Aceita strings e listas (retorna o primeiro elemento útil)."""
-    if coluna is None:
-        return None
-    if isinstance(coluna, list):
-        coluna = coluna[0] if coluna else None
-    if coluna is None:
-        return None
-    key = str(coluna).strip().lower()
+class ResolvedorColunas:
+    """Resolve nomes livres/português para colunas reais de um esquema.
 
-    # se existir no dicionário semântico
-    if key in COLUNAS_MAPEAMENTO_LOWER:
-        target = COLUNAS_MAPEAMENTO_LOWER[key]
-        if df is not None:
-            real = normalizar_coluna_para_busca(df, target)
-            if real:
-                return real
-        return target
-
-    # se corresponde diretamente ao mapeamento de colunas do df
-    if key in df_map:
-        return df_map[key]
-
-    # busca por substring nas colunas normalizadas
-    for k, v in df_map.items():
-        if key in k:
-            return v
-
-    # tenta achar coluna igual no df (caso user passe nome já real)
-    if df is not None:
-        col_real = normalizar_coluna_para_busca(df, key)
-        if col_real:
-            return col_real
+    Segue as mesmas regras (e precedência) de mapear_coluna: dicionário semântico,
+    nome exato normalizado, primeira coluna que contém o termo e, por fim, igualdade
+    sem diferenciar maiúsculas. Os índices são montados uma única vez por esquema e
+    cada termo resolvido fica memorizado."""
 
-    return None
+    def __init__(self, colunas: List[str], semantico: Optional[Dict[str, str]] = None):
+        self.colunas = list(colunas)
+        self.semantico = dict(semantico or {})
+        self.df_map = {str(c).strip().lower(): c for c in self.colunas}
+        self.reais = set(self.colunas)
+        # igualdade sem diferenciar maiúsculas (a primeira coluna vence, como em normalizar_coluna_para_busca)
+        self._por_lower: Dict[str, str] = {}
+        for c in self.colunas:
+            self._por_lower.setdefault(str(c).lower(), c)
+        # índice de substring: chaves normalizadas concatenadas com um separador que não
+        # aparece nos termos; str.find devolve a primeira chave (na ordem do df_map) que contém o termo
+        self._chaves = list(self.df_map)
+        self._texto_chaves = "\x00".join(self._chaves)
+        self._inicios: List[int] = []
+        pos = 0
+        for k in self._chaves:
+            self._inicios.append(pos)
+            pos += len(k) + 1
+        self._memo: Dict[Any, Optional[str]] = {}
+        self._padrao_nomes = None
+        # condições de special_conditions já compiladas para este esquema (ver compilar_condicao)
+        self.condicoes: "OrderedDict[str, Any]" = OrderedDict()
+
+    def resolver(self, coluna: Any) -> Optional[str]:
+        if isinstance(coluna, list):
+            coluna = coluna[0] if coluna else None
+        if coluna is None:
+            return None
+        try:
+            return self._memo[coluna]
+        except (KeyError, TypeError):
+            pass
+        resultado = self._resolver(str(coluna).strip().lower())
+        try:
+            self._memo[coluna] = resultado
+        except TypeError:  # valor não hashable
+            pass
+        return resultado
+
+    def _resolver(self, key: str) -> Optional[str]:
+        # dicionário semântico
+        if key in self.semantico:
+            target = self.semantico[key]
+            return self._por_lower.get(str(target).lower(), target)
+        # correspondência direta
+        if key in self.df_map:
+            return self.df_map[key]
+        # substring nas colunas normalizadas
+        if self._chaves and "\x00" not in key:
+            pos = self._texto_chaves.find(key)
+            if pos >= 0:
+                return self.df_map[self._chaves[bisect.bisect_right(self._inicios, pos) - 1]]
+        # nome real informado com outra capitalização
+        return self._por_lower.get(key)
+
+    @property
+    def padrao_nomes(self) -> "re.Pattern":
+        """Regex que encontra nomes de colunas e chaves semânticas dentro de expressões."""
+        if self._padrao_nomes is None:
+            nomes_possiveis = self.colunas + list(self.semantico.keys())
+            self._padrao_nomes = re.compile(r"\b(" + "|".join(re.escape(str(c)) for c in nomes_possiveis) + r")\b",
+                                            re.IGNORECASE)
+        return self._padrao_nomes
+
+
+_RESOLVEDORES: "OrderedDict[Tuple, ResolvedorColunas]" = OrderedDict()
+_RESOLVEDORES_MAX = 32
+_RESOLVEDORES_LOCK = threading.Lock()
+
+
+def obter_resolvedor(colunas: List[str], semantico: Optional[Dict[str, str]] = None) -> ResolvedorColunas:
+    """Devolve o resolvedor do esquema (criado na primeira vez e reaproveitado depois)."""
+    chave = (tuple(colunas), tuple(sorted((semantico or {}).items())))
+    with _RESOLVEDORES_LOCK:
+        resolvedor = _RESOLVEDORES.get(chave)
+        if resolvedor is not None:
+            _RESOLVEDORES.move_to_end(chave)
+            return resolvedor
+    resolvedor = ResolvedorColunas(colunas, semantico)
+    with _RESOLVEDORES_LOCK:
+        _RESOLVEDORES[chave] = resolvedor
+        while len(_RESOLVEDORES) > _RESOLVEDORES_MAX:
+            _RESOLVEDORES.popitem(last=False)
+    return resolvedor
+
+
+def mapear_coluna(coluna: Any, df_map: Dict[str, str], df: Optional[pd.DataFrame] = None) -> Optional[str]:
+    """Mapeia nomes livres/português para a coluna real do DataFrame.
+       Aceita strings e listas (retorna o primeiro elemento útil).
+       Para muitas buscas no mesmo esquema, use obter_resolvedor(...).resolver."""
+    colunas = list(df.columns) if df is not None else list(df_map.values())
+    return obter_resolvedor(colunas, COLUNAS_MAPEAMENTO_LOWER).resolver(coluna)
 
 def parse_termos_texto(valor: Any) -> List[str]:
     return [t for t in re.split(r'[\s,;]+', str(valor).strip()) if t]
 
+def fatorar_texto(serie: pd.Series) -> Tuple[np.ndarray, pd.Series]:
+    """Códigos por linha + valores distintos em minúsculas (ausentes ficam com código -1)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # colunas categóricas já têm os códigos: o texto é tratado só nas categorias
+        return serie.cat.codes.to_numpy(), pd.Series(serie.cat.categories).astype(str).str.lower()
+    codigos, distintos = pd.factorize(serie)
+    if len(distintos) < np.iinfo(np.int32).max:
+        codigos = codigos.astype(np.int32)
+    return codigos, pd.Series(distintos).astype(str).str.lower()
+
+def mascara_contem_termos(serie: pd.Series, termos: List[str],
+                          fatorada: Optional[Tuple[np.ndarray, pd.Series]] = None) -> pd.Series:
+    """Marca as linhas cujo texto (em minúsculas) contém algum dos termos.
+    Os termos viram uma única regex (escapada) aplicada aos valores distintos da coluna,
+    em vez de um str.contains por termo sobre todas as linhas."""
+    if not termos:
+        return pd.Series(False, index=serie.index)
+    padrao = "|".join(re.escape(str(t).lower()) for t in termos)
+    codigos, distintos = fatorada if fatorada is not None else fatorar_texto(serie)
+    achou = distintos.str.contains(padrao, regex=True, na=False).to_numpy(bool)
+    # código -1 (valor ausente) aponta para o False acrescentado no fim
+    return pd.Series(np.append(achou, False)[codigos], index=serie.index)
+
 def detectar_comparacao_numerica(s: Any):
     s = str(s).strip().lower()
     m = re.match(r'^(>=|<=|==|!=|>|<|=)\s*([-+]?\d+(\.\d+)?)$', s)
@@ -88,316 +1076,2180 @@ def detectar_comparacao_numerica(s: Any):
         return "<=", float(m6.group(1))
     return None
 
+OPERADORES_NUMERICOS = {"==": np.equal, "!=": np.not_equal, ">": np.greater, ">=": np.greater_equal,
+                        "<": np.less, "<=": np.less_equal}
 
-# === Função principal ===
-def executar_pesquisa(entrada: dict, arquivo_excel: str = "Planilha.xlsx", aba: Optional[int] = None, header_linha: int = 0) -> pd.DataFrame:
-    """
-    Executa a query definida pela 'entrada' sobre o arquivo Excel.
-    Mostra resultados no console e retorna o DataFrame (ou subset) usado.
-    """
-    try:
-        df = pd.read_excel(arquivo_excel, sheet_name=aba or 0, header=header_linha)
-    except FileNotFoundError:
-        print(f"Arquivo não encontrado: {arquivo_excel}. Verifique o caminho e tente novamente.")
-        return pd.DataFrame()
-    except Exception as e:
-        print(f"Erro ao abrir o arquivo: {e}")
-        return pd.DataFrame()
 
-    # limpeza básica de colunas
-    df.columns = [str(c).strip() for c in df.columns]
-    df_map = normalizar_colunas(df)
+def valores_numericos(visoes: "VisoesColunas", coluna: str) -> np.ndarray:
+    """Visão numérica da coluna como array NumPy (sem cópia quando a coluna já é int/float)."""
+    serie = visoes.numerica(coluna)
+    if isinstance(serie.dtype, np.dtype) and serie.dtype.kind in "iuf":
+        return serie.to_numpy()
+    return serie.to_numpy(dtype=float, na_value=np.nan)
 
-    # filtro inicial (todas as linhas)
-    filtro = pd.Series(True, index=df.index)
 
-    # --- FILTROS SIMPLES via entrada['data'] ---
-    for item in entrada.get("data", []):
-        coluna_input = item.get("column_name") or item.get("column")
-        valor_input = item.get("value", "")
-        coluna_real = mapear_coluna(coluna_input, df_map, df)
-        if not coluna_real:
-            # sem coluna mapeada, nada a aplicar
-            continue
+def avaliar_numexpr(expressao: str, variaveis: Dict[str, str], visoes: "VisoesColunas") -> np.ndarray:
+    """Avalia numa só passada uma expressão numexpr cujas variáveis são colunas numéricas."""
+    return numexpr.evaluate(expressao, local_dict={var: valores_numericos(visoes, coluna)
+                                                   for coluna, var in variaveis.items()})
 
-        v = valor_input
-        comp = detectar_comparacao_numerica(v)
-        if comp:
-            op, num = comp
-            col_num = pd.to_numeric(df[coluna_real], errors="coerce")
-            if op == "==":
-                filtro &= col_num == num
-            elif op == "!=":
-                filtro &= col_num != num
-            elif op == ">":
-                filtro &= col_num > num
-            elif op == ">=":
-                filtro &= col_num >= num
-            elif op == "<":
-                filtro &= col_num < num
-            elif op == "<=":
-                filtro &= col_num <= num
-            continue
 
-        # texto / termos
-        termos = parse_termos_texto(v)
-        col_text = df[coluna_real].astype(str).str.lower()
-        filtro_termos = pd.Series(False, index=df.index)
-        for t in termos:
-            filtro_termos |= col_text.str.contains(str(t).lower(), na=False)
-        filtro &= filtro_termos
+def conjuncao_numerica(visoes: "VisoesColunas", comparacoes: List[Tuple[str, str, float]]) -> np.ndarray:
+    """Máscara de várias comparações numéricas unidas por 'and'. Com numexpr vira uma única
+    expressão; sem ele (ou com USAR_NUMEXPR desligado), cada comparação é escrita num mesmo buffer e acumulada no resultado,
+    em vez de uma Series temporária por filtro."""
+    if USAR_NUMEXPR and all(np.isfinite(num) for _, _, num in comparacoes):
+        variaveis: Dict[str, str] = {}
+        termos = []
+        for coluna, op, num in comparacoes:
+            termos.append(f"({variaveis.setdefault(coluna, f'c{len(variaveis)}')} {op} {num!r})")
+        return avaliar_numexpr(" & ".join(termos), variaveis, visoes)
+    resultado = np.ones(len(visoes.df), dtype=bool)
+    buffer = np.empty_like(resultado)
+    for coluna, op, num in comparacoes:
+        OPERADORES_NUMERICOS[op](valores_numericos(visoes, coluna), num, out=buffer)
+        resultado &= buffer
+    return resultado
 
-    # --- SPECIAL CONDITIONS (expressões) ---
-    specials = entrada.get("special_conditions", []) or []
-    if specials:
-        # nomes possíveis: colunas reais + chaves do dicionário semântico
-        nomes_possiveis = list(df.columns) + list(COLUNAS_MAPEAMENTO_LOWER.keys())
-        # padrão que captura palavras (case-insensitive)
-        padrao = r"\b(" + "|".join(re.escape(c) for c in nomes_possiveis) + r")\b"
-        for cond in specials:
-            try:
-                cond_str = str(cond)
-
-                def substituir_coluna(match):
-                    token = match.group(0)
-                    # tenta mapear token (pode ser sinônimo em pt ou nome real)
-                    mapped = mapear_coluna(token, df_map, df)
-                    # se mapeou, devolve o nome real (preserva case do df)
-                    if mapped:
-                        return mapped
-                    return token
-
-                cond_limpa = re.sub(padrao, substituir_coluna, cond_str, flags=re.IGNORECASE)
-                # avalia cond_limpa no contexto do DataFrame
-                # usamos try/except para evitar quebra total se expressão inválida
-                try:
-                    filtro &= df.eval(cond_limpa)
-                except Exception as e:
-                    print(f"⚠️ Não foi possível avaliar condição '{cond}': expressão convertida '{cond_limpa}'. Erro: {e}")
-            except Exception as e:
-                print(f"⚠️ Erro ao processar special_condition '{cond}': {e}")
 
-    df_filtrado = df.loc[filtro].copy()
+# --- EXPRESSÕES (special_conditions) ---
+# Condições como "Pclass == 1 and Fare > 50" são analisadas com o módulo ast (nada é
+# executado), validadas contra as operações permitidas abaixo e compiladas uma única vez
+# por esquema + texto em funções vetorizadas (NumPy) sobre as visões das colunas.
+MAX_CONDICOES = 256
 
-    if df_filtrado.empty:
-        print("Nenhum resultado encontrado após aplicar filtros.")
-        return df_filtrado
+_COMPARADORES = {
+    ast.Eq: ("==", np.equal), ast.NotEq: ("!=", np.not_equal),
+    ast.Gt: (">", np.greater), ast.GtE: (">=", np.greater_equal),
+    ast.Lt: ("<", np.less), ast.LtE: ("<=", np.less_equal),
+}
+_COMPARADORES_INVERTIDOS = {ast.Eq: ast.Eq, ast.NotEq: ast.NotEq, ast.Gt: ast.Lt, ast.GtE: ast.LtE,
+                            ast.Lt: ast.Gt, ast.LtE: ast.GtE}
+_ARITMETICOS = {
+    ast.Add: ("+", np.add), ast.Sub: ("-", np.subtract), ast.Mult: ("*", np.multiply),
+    ast.Div: ("/", np.true_divide), ast.FloorDiv: ("//", np.floor_divide),
+    ast.Mod: ("%", np.mod), ast.Pow: ("**", np.power),
+}
+_LOGICOS = {ast.And: ("and", np.logical_and), ast.Or: ("or", np.logical_or),
+            ast.BitAnd: ("and", np.logical_and), ast.BitOr: ("or", np.logical_or)}
+_NUMERICOS = ("coluna", "numero", "valores")
 
-    # --- OPERAÇÕES ---
-    col_op = entrada.get("column_operation")
-    oper = entrada.get("operation")
 
-    # desfazer listas onde aplicável
-    if isinstance(col_op, list):
-        col_op = col_op[0] if col_op else None
-    if isinstance(oper, list):
-        oper = oper[0] if oper else None
+class _No:
+    """Nó compilado: tipo ('coluna', 'texto', 'numero', 'nulo', 'lista', 'valores' ou
+    'mascara'), valor (nome da coluna, constante ou função das visões), texto canônico e,
+    se o nó for puramente numérico, a expressão equivalente para o numexpr."""
 
-    col_op_real = mapear_coluna(col_op, df_map, df) if col_op else None
+    __slots__ = ("tipo", "valor", "chave", "ne")
 
-    # columns_to_show mapeadas
-    cols_to_show = entrada.get("columns_to_show") or []
-    cols_to_show_mapped = [mapear_coluna(c, df_map, df) for c in cols_to_show] if cols_to_show else []
-    cols_to_show_mapped = [c for c in cols_to_show_mapped if c]
+    def __init__(self, tipo: str, valor: Any, chave: str, ne: Optional[str] = None):
+        self.tipo, self.valor, self.chave = tipo, valor, chave
+        self.ne = ne  # mesma expressão em sintaxe numexpr, quando só envolve números
 
-    op_low = str(oper).strip().lower() if oper else ""
 
-    try:
-        # Se nenhuma operação foi informada: retorna colunas solicitadas (se houver) ou todo df_filtrado
-        if not op_low:
-            if cols_to_show_mapped:
-                print("Nenhuma operação especificada — retornando apenas as colunas solicitadas:")
-                print(df_filtrado[cols_to_show_mapped].to_string(index=False))
-                return df_filtrado[cols_to_show_mapped]
-            else:
-                print("Nenhuma operação especificada — retornando DataFrame filtrado completo:")
-                print(df_filtrado.to_string(index=False))
-                return df_filtrado
+def _numerico(no: _No):
+    if no.tipo == "coluna":
+        coluna = no.valor
+        return lambda visoes: valores_numericos(visoes, coluna)
+    if no.tipo == "numero":
+        constante = float(no.valor)
+        return lambda visoes: constante
+    if no.tipo == "valores":
+        return no.valor
+    if no.tipo == "mascara":
+        func = no.valor
+        return lambda visoes: func(visoes).astype(float)
+    raise ValueError(f"'{no.chave}' não é numérico")
 
-        # CONTAGEM (count)
-        if op_low in ["count", "contagem"]:
-            if col_op_real and col_op_real in df_filtrado.columns:
-                total = int(df_filtrado[col_op_real].notna().sum())
-                print(f"Contagem de '{col_op_real}': {total}")
-            else:
-                total = len(df_filtrado)
-                print(f"Contagem total de registros: {total}")
-            return df_filtrado
 
-        # PORCENTAGEM (percent)
-        if op_low in ["porcentagem", "percent", "percentage"]:
-            total_geral = len(df)
-            total_filtrado = len(df_filtrado)
-            # se não há group_by -> porcentagem do total geral
-            group_by = entrada.get("group_by", []) or []
-            if not group_by:
-                pct = (total_filtrado / total_geral) * 100 if total_geral else 0
-                print(f"Total geral: {total_geral}")
-                print(f"Total filtrado: {total_filtrado}")
-                print(f"Porcentagem (do total geral): {pct:.2f}%")
-                return df_filtrado
-            # se há group_by -> calcular taxa por grupo corretamente (ex: survivors_in_group / total_in_group)
-            gb_cols = [mapear_coluna(c, df_map, df) for c in group_by]
-            gb_cols = [c for c in gb_cols if c]
-            if not gb_cols:
-                print("group_by informado, mas não foi possível mapear colunas.")
-                return df_filtrado
-            # contagens totais por grupo (no df original)
-            tot_por_grupo = df.groupby(gb_cols).size().rename("total_no_grupo")
-            # contagens filtradas por grupo (após aplicar special_conditions/data)
-            filt_por_grupo = df_filtrado.groupby(gb_cols).size().rename("filtrados_no_grupo")
-            res = pd.concat([tot_por_grupo, filt_por_grupo], axis=1).fillna(0)
-            res["porcentagem_no_grupo"] = (res["filtrados_no_grupo"] / res["total_no_grupo"] * 100).round(2)
-            res = res.reset_index()
-            print("Porcentagem/taxa por grupo (filtrados / total do grupo):")
-            print(res.to_string(index=False))
-            return df_filtrado
+def _booleano(no: _No):
+    if no.tipo == "mascara":
+        return no.valor
+    if no.tipo in ("coluna", "valores", "numero"):
+        func = _numerico(no)
+        return lambda visoes: np.nan_to_num(func(visoes), nan=0.0) != 0
+    raise ValueError(f"'{no.chave}' não é uma condição")
 
-        # MÉDIA
-        if op_low in ["mean", "media"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'mean' não encontrada.")
-                return df_filtrado
-            if entrada.get("group_by"):
-                gb = [mapear_coluna(c, df_map, df) for c in entrada.get("group_by")]
-                gb = [c for c in gb if c]
-                if gb:
-                    res = df_filtrado.groupby(gb)[col_op_real].mean().reset_index(name=f"mean_{col_op_real}")
-                    print(f"Média de {col_op_real} por {gb}:")
-                    print(res.to_string(index=False))
-                    return df_filtrado
-            mean_val = df_filtrado[col_op_real].dropna().mean()
-            print(f"Média ({col_op_real}): {mean_val}")
-            return df_filtrado
 
-        # SUM
-        if op_low in ["sum", "soma"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'sum' não encontrada.")
-                return df_filtrado
-            total = df_filtrado[col_op_real].dropna().sum()
-            print(f"Soma ({col_op_real}): {total}")
-            return df_filtrado
+def _comparar_texto(coluna: str, op: type, texto: str):
+    """Comparação sem diferenciar maiúsculas, feita só sobre os valores distintos da coluna."""
+    texto = texto.lower()
+    _, funcao = _COMPARADORES[op]
 
-        # MAX
-        if op_low in ["max"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'max' não encontrada.")
-                return df_filtrado
-            val = df_filtrado[col_op_real].dropna().max()
-            print(f"Máximo ({col_op_real}): {val}")
-            return df_filtrado
+    def avaliar(visoes):
+        codigos, distintos = visoes.fatorada(coluna)
+        achou = funcao(distintos.to_numpy(dtype=object), texto).astype(bool)
+        # valor ausente: só '!=' é verdadeiro (como no pandas)
+        return np.append(achou, op is ast.NotEq)[codigos]
+    return avaliar
 
-        # MIN
-        if op_low in ["min"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'min' não encontrada.")
-                return df_filtrado
-            val = df_filtrado[col_op_real].dropna().min()
-            print(f"Mínimo ({col_op_real}): {val}")
-            return df_filtrado
 
-        # STD
-        if op_low in ["std"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'std' não encontrada.")
-                return df_filtrado
-            val = df_filtrado[col_op_real].dropna().std()
-            print(f"Desvio padrão ({col_op_real}): {val}")
-            return df_filtrado
+def _comparar_nulo(coluna: str, op: type):
+    if op not in (ast.Eq, ast.NotEq):
+        raise ValueError("None só pode ser comparado com == ou !=")
+    return lambda visoes: pd.isna(visoes.df[coluna]).to_numpy() == (op is ast.Eq)
 
-        # DESCRIBE
-        if op_low in ["describe"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'describe' não encontrada.")
-                return df_filtrado
-            desc = df_filtrado[col_op_real].describe()
-            print(f"Describe ({col_op_real}):")
-            print(desc.to_string() if hasattr(desc, "to_string") else str(desc))
-            return df_filtrado
 
-        # TOP / RANKING
-        if op_low in ["top", "ranking"]:
-            if not col_op_real or col_op_real not in df_filtrado.columns:
-                print("Coluna para operação 'top' não encontrada.")
-                return df_filtrado
-            order = entrada.get("ranking", [])
-            order = str(order[0]).lower() if isinstance(order, list) and order else (str(order).lower() if order else "desc")
-            ascending = order in ["asc", "cresc", "ascending"]
-            limit = int(entrada.get("limit") or entrada.get("n") or 5)
-            cols_show = cols_to_show_mapped if cols_to_show_mapped else df_filtrado.columns.tolist()
-            res = df_filtrado.sort_values(by=col_op_real, ascending=ascending).head(limit)
-            print(f"Top {limit} por {col_op_real} (ascending={ascending}):")
-            print(res[cols_show].to_string(index=False))
-            return df_filtrado
+def _comparar(esquerda: _No, op: type, direita: _No):
+    if type(op) in (ast.In, ast.NotIn):
+        if direita.tipo != "lista" or esquerda.tipo != "coluna":
+            raise ValueError("'in' exige uma coluna à esquerda e uma lista de valores à direita")
+        return _pertence(esquerda.valor, direita.valor, type(op) is ast.NotIn)
+    if type(op) not in _COMPARADORES:
+        raise ValueError(f"comparação não permitida: {type(op).__name__}")
+    op = type(op)
+    if esquerda.tipo in ("texto", "nulo") and direita.tipo == "coluna":
+        esquerda, direita, op = direita, esquerda, _COMPARADORES_INVERTIDOS[op]
+    if esquerda.tipo == "coluna" and direita.tipo == "texto":
+        return _comparar_texto(esquerda.valor, op, direita.valor)
+    if esquerda.tipo == "coluna" and direita.tipo == "nulo":
+        return _comparar_nulo(esquerda.valor, op)
+    if esquerda.tipo == "coluna" and direita.tipo == "coluna" and op in (ast.Eq, ast.NotEq):
+        a, b = esquerda.valor, direita.valor
 
-        # LISTAR colunas
-        if op_low in ["list", "listar"]:
-            if cols_to_show_mapped:
-                print("Listando colunas solicitadas:")
-                print(df_filtrado[cols_to_show_mapped].to_string(index=False))
-                return df_filtrado[cols_to_show_mapped]
-            else:
-                print("Listando todas as colunas do DataFrame filtrado:")
-                print(df_filtrado.to_string(index=False))
-                return df_filtrado
+        def colunas(visoes):
+            df = visoes.df
+            if all(pd.api.types.is_numeric_dtype(df[c]) for c in (a, b)):
+                return _COMPARADORES[op][1](visoes.numerica(a).to_numpy(dtype=float, na_value=np.nan),
+                                            visoes.numerica(b).to_numpy(dtype=float, na_value=np.nan))
+            iguais = (df[a].astype(str).str.lower() == df[b].astype(str).str.lower()).to_numpy()
+            return iguais if op is ast.Eq else ~iguais
+        return colunas
+    a, b = _numerico(esquerda), _numerico(direita)
+    funcao = _COMPARADORES[op][1]
+    return lambda visoes: funcao(a(visoes), b(visoes))
 
-        # CORRELAÇÃO
-        if op_low in ["correlacao", "correlation"]:
-            corr_cols = entrada.get("correlation") or entrada.get("comparisons") or []
-            if isinstance(corr_cols, list) and len(corr_cols) >= 2:
-                c1 = mapear_coluna(corr_cols[0], df_map, df)
-                c2 = mapear_coluna(corr_cols[1], df_map, df)
-                if c1 in df_filtrado.columns and c2 in df_filtrado.columns:
-                    # força numérico quando possível
-                    s1 = pd.to_numeric(df_filtrado[c1], errors="coerce")
-                    s2 = pd.to_numeric(df_filtrado[c2], errors="coerce")
-                    corr_val = s1.corr(s2)
-                    print(f"Correlação entre {c1} e {c2}: {corr_val}")
-                else:
-                    print("Colunas para correlação não encontradas no DataFrame filtrado.")
-            else:
-                print("Forneça duas colunas para calcular correlação (em 'correlation' ou 'comparisons').")
-            return df_filtrado
 
-        # COMPARE_MEAN (média de col_val por col_group)
-        if op_low in ["compare_mean", "comparar_media"]:
-            comps = entrada.get("comparisons") or []
-            if isinstance(comps, list) and len(comps) >= 2:
-                col_val = mapear_coluna(comps[0], df_map, df)
-                col_group = mapear_coluna(comps[1], df_map, df)
-                if col_val and col_group and col_val in df_filtrado.columns and col_group in df_filtrado.columns:
-                    res = df_filtrado.groupby(col_group)[col_val].mean().reset_index(name=f"mean_{col_val}")
-                    print(f"Média de {col_val} por {col_group}:")
-                    print(res.to_string(index=False))
-                else:
-                    print("Colunas para compare_mean não encontradas.")
-            else:
-                print("Passe duas colunas em 'comparisons', ex: [\"Fare\", \"Survived\"]")
-            return df_filtrado
+def _pertence(coluna: str, valores: List[Any], negar: bool):
+    if all(isinstance(v, str) for v in valores):
+        textos = [v.lower() for v in valores]
 
-        # MÉDIA POR GRUPO (quando 'group_by' presente mesmo sem 'operation' específica)
-        if entrada.get("group_by") and not op_low:
-            gb = [mapear_coluna(c, df_map, df) for c in entrada.get("group_by")]
-            gb = [c for c in gb if c]
-            if gb:
-                if cols_to_show_mapped:
-                    print(df_filtrado.groupby(gb)[cols_to_show_mapped].mean().reset_index().to_string(index=False))
-                else:
-                    print(df_filtrado.groupby(gb).mean().reset_index().to_string(index=False))
-            return df_filtrado
+        def avaliar(visoes):
+            codigos, distintos = visoes.fatorada(coluna)
+            achou = distintos.isin(textos).to_numpy(bool)
+            return np.append(achou != negar, negar)[codigos]
+        return avaliar
+    numeros = [float(v) for v in valores]
+    return lambda visoes: np.isin(visoes.numerica(coluna).to_numpy(dtype=float, na_value=np.nan), numeros) != negar
 
-        # fallback
-        print("Operação não reconhecida.")
-        return df_filtrado
 
-    except Exception as e:
-        print(f"Erro ao executar operação '{oper}': {e}")
-        return df_filtrado
+class CompiladorCondicao:
+    """Traduz a árvore sintática de uma condição em funções vetorizadas. Só os nós
+    tratados aqui são aceitos; qualquer outro (chamadas, atributos, índices...) é recusado."""
 
+    def __init__(self, resolvedor: "ResolvedorColunas", apelidos: Dict[str, str]):
+        self.resolvedor = resolvedor
+        self.apelidos = apelidos  # identificadores provisórios -> nomes com espaços/crase
+        self.colunas: List[str] = []
+        self.variaveis: Dict[str, str] = {}  # coluna -> nome da variável na expressão numexpr
+
+    def coluna(self, nome: str) -> str:
+        nome = self.apelidos.get(nome, nome)
+        chave = nome.strip().lower()
+        # como no padrão de nomes: só nomes de coluna ou chaves semânticas completos
+        coluna = self.resolvedor.resolver(nome) if chave in self.resolvedor.df_map or chave in self.resolvedor.semantico else None
+        if coluna not in self.resolvedor.reais:
+            raise ValueError(f"coluna desconhecida: {nome}")
+        if coluna not in self.colunas:
+            self.colunas.append(coluna)
+        return coluna
+
+    def compilar(self, no: ast.AST) -> _No:
+        if isinstance(no, ast.Name):
+            coluna = self.coluna(no.id)
+            return _No("coluna", coluna, f"`{coluna}`", self.variaveis.setdefault(coluna, f"c{len(self.variaveis)}"))
+        if isinstance(no, ast.Constant):
+            valor = no.value
+            if valor is None:
+                return _No("nulo", None, "None")
+            if isinstance(valor, str):
+                return _No("texto", valor, repr(valor.lower()))
+            if isinstance(valor, (bool, int, float)):
+                return _No("numero", float(valor), repr(float(valor)), repr(float(valor)) if np.isfinite(valor) else None)
+            raise ValueError(f"constante não permitida: {valor!r}")
+        if isinstance(no, (ast.List, ast.Tuple, ast.Set)):
+            itens = [self.compilar(e) for e in no.elts]
+            if not all(i.tipo in ("texto", "numero") for i in itens):
+                raise ValueError("listas só podem conter constantes")
+            return _No("lista", [i.valor for i in itens], "[" + ", ".join(sorted(i.chave for i in itens)) + "]")
+        if isinstance(no, ast.UnaryOp):
+            operando = self.compilar(no.operand)
+            if isinstance(no.op, (ast.Not, ast.Invert)):
+                func = _booleano(operando)
+                ne = f"(~{operando.ne})" if operando.tipo == "mascara" and operando.ne else None
+                return _No("mascara", lambda visoes: ~func(visoes), f"(not {operando.chave})", ne)
+            if isinstance(no.op, (ast.USub, ast.UAdd)):
+                sinal = -1.0 if isinstance(no.op, ast.USub) else 1.0
+                if operando.tipo == "numero":
+                    return _No("numero", sinal * operando.valor, repr(sinal * operando.valor),
+                               f"({sinal!r} * {operando.ne})" if operando.ne else None)
+                func = _numerico(operando)
+                ne = f"({sinal!r} * {operando.ne})" if operando.tipo in _NUMERICOS and operando.ne else None
+                return _No("valores", lambda visoes: sinal * func(visoes), f"({sinal:+.0f} * {operando.chave})", ne)
+        if isinstance(no, ast.BoolOp) or (isinstance(no, ast.BinOp) and type(no.op) in _LOGICOS):
+            operandos = [self.compilar(v) for v in (no.values if isinstance(no, ast.BoolOp) else [no.left, no.right])]
+            nome, funcao = _LOGICOS[type(no.op)]
+            funcs = [_booleano(o) for o in operandos]
+            ne = None
+            if all(o.tipo == "mascara" and o.ne for o in operandos):
+                ne = "(" + (" & " if nome == "and" else " | ").join(o.ne for o in operandos) + ")"
+            return _No("mascara", lambda visoes: functools.reduce(funcao, [f(visoes) for f in funcs]),
+                       "(" + f" {nome} ".join(o.chave for o in operandos) + ")", ne)
+        if isinstance(no, ast.BinOp) and type(no.op) in _ARITMETICOS:
+            esquerda, direita = self.compilar(no.left), self.compilar(no.right)
+            nome, funcao = _ARITMETICOS[type(no.op)]
+            a, b = _numerico(esquerda), _numerico(direita)
+            ne = None
+            if nome != "//" and all(o.tipo in _NUMERICOS and o.ne for o in (esquerda, direita)):
+                ne = f"({esquerda.ne} {nome} {direita.ne})"
+            return _No("valores", lambda visoes: funcao(a(visoes), b(visoes)),
+                       f"({esquerda.chave} {nome} {direita.chave})", ne)
+        if isinstance(no, ast.Compare):
+            termos = [self.compilar(no.left)] + [self.compilar(c) for c in no.comparators]
+            partes = []
+            chaves = []
+            nes = []
+            for esquerda, op, direita in zip(termos, no.ops, termos[1:]):
+                partes.append(_comparar(esquerda, op, direita))
+                simbolo = _COMPARADORES.get(type(op), (type(op).__name__.lower(),))[0]
+                chaves.append(f"({esquerda.chave} {simbolo} {direita.chave})")
+                # comparação numérica (coluna == coluna pode ser textual, decidido só na avaliação)
+                numerica = (type(op) in _COMPARADORES and esquerda.tipo in _NUMERICOS and direita.tipo in _NUMERICOS
+                            and not (esquerda.tipo == direita.tipo == "coluna" and type(op) in (ast.Eq, ast.NotEq)))
+                nes.append(f"({esquerda.ne} {simbolo} {direita.ne})" if numerica and esquerda.ne and direita.ne else None)
+            ne = " & ".join(nes) if all(nes) else None
+            if len(partes) == 1:
+                return _No("mascara", partes[0], chaves[0], ne)
+            return _No("mascara", lambda visoes: functools.reduce(np.logical_and, [p(visoes) for p in partes]),
+                       "(" + " and ".join(chaves) + ")", f"({ne})" if ne else None)
+        raise ValueError(f"operação não permitida: {type(no).__name__}")
+
+    def conjuncao(self, no: ast.AST) -> List[ast.AST]:
+        """Separa os termos unidos por 'and' no nível de cima (cada um vira uma máscara em cache)."""
+        if isinstance(no, ast.BoolOp) and isinstance(no.op, ast.And):
+            return [t for v in no.values for t in self.conjuncao(v)]
+        if isinstance(no, ast.BinOp) and isinstance(no.op, ast.BitAnd):
+            return self.conjuncao(no.left) + self.conjuncao(no.right)
+        return [no]
+
+
+def _fundir(nos: List[_No], variaveis: Dict[str, str]):
+    """Une termos numéricos ligados por 'and' numa única expressão numexpr, avaliada numa
+    passada sobre os arrays das colunas; sem numexpr (ou se ele recusar a expressão), as
+    máscaras dos termos são acumuladas no mesmo array."""
+    expressao = " & ".join(no.ne for no in nos)
+    usadas = {coluna: var for coluna, var in variaveis.items() if re.search(rf"\b{var}\b", expressao)}
+    funcs = [no.valor for no in nos]
+
+    def avaliar(visoes):
+        if USAR_NUMEXPR:
+            try:
+                return avaliar_numexpr(expressao, usadas, visoes)
+            except Exception:
+                pass
+        resultado = np.array(funcs[0](visoes), dtype=bool)
+        for func in funcs[1:]:
+            resultado &= func(visoes)
+        return resultado
+    return avaliar
+
+
+class CondicaoCompilada:
+    """Condição pronta para avaliar: colunas reais usadas e as partes unidas por 'and',
+    cada uma com seu texto canônico (chave da máscara em cache)."""
+
+    def __init__(self, partes: List[Tuple[str, Any]], colunas: List[str]):
+        self.partes = partes
+        self.colunas = colunas
+
+    def mascara(self, visoes: "VisoesColunas", mascaras: Optional["MascarasPredicados"] = None) -> np.ndarray:
+        linhas = len(visoes.df)
+        resultado = np.ones(linhas, dtype=bool)
+        for chave, func in self.partes:
+            def calcular(func=func):
+                with np.errstate(all="ignore"):
+                    return np.broadcast_to(np.asarray(func(visoes), dtype=bool), (linhas,))
+            resultado &= mascaras.obter(("expr", chave), calcular) if mascaras is not None else calcular()
+        return resultado
+
+
+def _normalizar_condicao(texto: str, resolvedor: "ResolvedorColunas") -> Tuple[str, Dict[str, str]]:
+    """Troca nomes entre crases (ou com espaços) por identificadores provisórios e ajusta
+    a escrita comum vinda do LLM ('=' por '==', AND/OR/NOT em maiúsculas). Como no df.eval,
+    '&' e '|' viram 'and'/'or': ficam abaixo das comparações ("Pclass == 1 & Fare > 50")."""
+    apelidos: Dict[str, str] = {}
+
+    def apelidar(nome: str) -> str:
+        apelido = f"__coluna_{len(apelidos)}__"
+        apelidos[apelido] = nome
+        return apelido
+
+    texto = re.sub(r"`([^`]+)`", lambda m: apelidar(m.group(1)), texto.strip())
+    try:
+        ast.parse(texto, mode="eval")
+    except SyntaxError:
+        # nomes de coluna com espaços escritos sem crase
+        texto = resolvedor.padrao_nomes.sub(
+            lambda m: apelidar(m.group(0)) if not m.group(0).isidentifier() else m.group(0), texto)
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(texto).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return texto, apelidos
+    saida = []
+    for tok in tokens:
+        valor = tok.string
+        if tok.type == tokenize.OP and valor == "=":
+            valor = "=="
+        elif tok.type == tokenize.OP and valor in ("&", "|"):
+            saida.append((tokenize.NAME, "and" if valor == "&" else "or"))
+            continue
+        elif tok.type == tokenize.NAME and valor.lower() in ("and", "or", "not", "in"):
+            valor = valor.lower()
+        elif tok.type == tokenize.NAME and valor.lower() in ("true", "false", "none"):
+            valor = valor.capitalize()
+        saida.append((tok.type, valor))
+    return tokenize.untokenize(saida).strip(), apelidos
+
+
+def compilar_condicao(texto: str, resolvedor: "ResolvedorColunas") -> CondicaoCompilada:
+    """Compila (ou devolve do cache do resolvedor, por texto) uma condição de special_conditions.
+    Lança ValueError se a expressão não puder ser interpretada com segurança."""
+    condicoes = resolvedor.condicoes
+    try:
+        resultado = condicoes[texto]
+        condicoes.move_to_end(texto)
+    except KeyError:
+        try:
+            normalizado, apelidos = _normalizar_condicao(texto, resolvedor)
+            arvore = ast.parse(normalizado, mode="eval").body
+            compilador = CompiladorCondicao(resolvedor, apelidos)
+            partes = []
+            numericos = []
+            for termo in compilador.conjuncao(arvore):
+                no = compilador.compilar(termo)
+                if no.tipo == "mascara" and no.ne:
+                    numericos.append(no)
+                else:
+                    partes.append((no.chave, _booleano(no)))
+            if numericos:
+                # os termos só numéricos viram uma única máscara (uma expressão numexpr)
+                chave = numericos[0].chave if len(numericos) == 1 else "(" + " and ".join(sorted(n.chave for n in numericos)) + ")"
+                partes.insert(0, (chave, _fundir(numericos, compilador.variaveis)))
+            resultado = CondicaoCompilada(partes, compilador.colunas)
+        except (SyntaxError, ValueError, RecursionError) as e:
+            resultado = ValueError(f"condição inválida '{texto}': {e}")
+        condicoes[texto] = resultado
+        while len(condicoes) > MAX_CONDICOES:
+            condicoes.popitem(last=False)
+    if isinstance(resultado, ValueError):
+        raise resultado
+    return resultado
+
+
+def recortar(df: pd.DataFrame, filtro: Any, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """Linhas selecionadas por 'filtro' só com as 'colunas' pedidas (todas, se None).
+    As posições vêm de np.flatnonzero e apenas essas colunas são copiadas; sem filtro
+    algum, devolve a própria planilha em cache (não deve ser alterada)."""
+    indices = (np.arange(df.shape[1]) if colunas is None
+               else np.flatnonzero(df.columns.isin(colunas)))
+    if not len(indices) and df.shape[1]:
+        # nenhuma das colunas pedidas foi carregada (ex.: a coluna "coringa" de planejar_colunas
+        # num count só com filtros): mantém uma coluna carregada, senão o recorte N x 0 fica
+        # .empty mesmo com linhas selecionadas
+        indices = np.arange(1)
+    mascara = np.asarray(filtro, dtype=bool)
+    if mascara.all():
+        return df if len(indices) == df.shape[1] else df.iloc[:, indices]
+    return df.iloc[np.flatnonzero(mascara), indices]
+
+
+def selecionar_top(valores: np.ndarray, limite: int, ascendente: bool) -> np.ndarray:
+    """Posições das 'limite' primeiras linhas na ordenação estável de 'valores' (NaN por
+    último), sem ordenar tudo: np.partition acha o valor de corte e só as linhas até ele
+    (incluindo empates, na ordem original) são ordenadas."""
+    chave = valores if ascendente else -valores
+    validos = ~np.isnan(chave)
+    n_validos = int(validos.sum())
+    if n_validos <= limite:
+        posicoes = np.flatnonzero(validos)
+        posicoes = posicoes[np.argsort(chave[posicoes], kind="stable")]
+        return np.concatenate([posicoes, np.flatnonzero(~validos)[:limite - n_validos]])
+    corte = np.partition(chave[validos], limite - 1)[limite - 1]
+    candidatos = np.flatnonzero(chave <= corte)  # NaN nunca entra
+    return candidatos[np.argsort(chave[candidatos], kind="stable")][:limite]
+
+
+def top_linhas(df_filtrado: pd.DataFrame, visoes: "VisoesColunas", filtro: Any,
+               coluna: str, limite: int, ascendente: bool) -> pd.DataFrame:
+    """As 'limite' primeiras linhas filtradas ordenadas por 'coluna', como
+    sort_values(kind="stable").head(limite), mas por seleção parcial nas colunas numéricas
+    (ou pelo índice ordenado da planilha, quando já existe)."""
+    df = visoes.df
+    serie = df[coluna]
+    if limite <= 0 or not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+        return df_filtrado.sort_values(by=coluna, ascending=ascendente, kind="stable").head(max(limite, 0))
+    mascara = np.asarray(filtro, dtype=bool)
+    ordem = visoes.ordenada(coluna, ascendente)
+    if ordem is not None:
+        # percorre o índice ordenado em blocos até achar 'limite' linhas que passam no filtro
+        partes, faltam = [], limite
+        for inicio in range(0, len(ordem), max(65536, limite)):
+            parte = ordem[inicio:inicio + max(65536, limite)]
+            parte = parte[mascara[parte]][:faltam]
+            partes.append(parte)
+            faltam -= len(parte)
+            if faltam <= 0:
+                break
+        posicoes = np.concatenate(partes) if partes else np.empty(0, dtype=np.intp)
+    else:
+        valores = visoes.numerica(coluna).to_numpy(dtype=float, na_value=np.nan)
+        if mascara.all():
+            posicoes = selecionar_top(valores, limite, ascendente)
+        else:
+            filtradas = np.flatnonzero(mascara)
+            posicoes = filtradas[selecionar_top(valores[filtradas], limite, ascendente)]
+    linhas = df.iloc[posicoes]
+    return linhas if linhas.shape[1] == df_filtrado.shape[1] else linhas[list(df_filtrado.columns)]
+
+
+def agregacoes_pedidas(oper: Any) -> Optional[List[str]]:
+    """Se 'operation' for uma lista só de agregações (ex.: ["mean", "max", "count"]), devolve
+    os nomes usados pelo pandas, sem repetição; caso contrário, None."""
+    if not isinstance(oper, list) or len(oper) < 2:
+        return None
+    nomes = [AGREGACOES.get(str(o).strip().lower()) for o in oper]
+    if not all(nomes):
+        return None
+    return list(dict.fromkeys(nomes))
+
+
+def agregar(df_filtrado: pd.DataFrame, colunas: List[str], funcoes: List[str],
+            group_by: Optional[List[str]] = None) -> pd.DataFrame:
+    """Todas as agregações pedidas de uma vez, sobre os valores numéricos das colunas: um único
+    groupby().agg() com group_by, ou uma redução NumPy por coluna sem ele. As colunas do
+    resultado seguem o padrão '<funcao>_<coluna>'; sem colunas, só a contagem de linhas."""
+    dados = {}
+    for c in colunas:
+        serie = df_filtrado[c]
+        if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            serie = pd.to_numeric(serie, errors="coerce")
+        dados[c] = serie.to_numpy(dtype=float, na_value=np.nan)
+
+    if group_by:
+        if not dados:
+            return df_filtrado.groupby(group_by, observed=True).size().reset_index(name="contagem")
+        quadro = pd.DataFrame(dados, index=df_filtrado.index)
+        chaves = [df_filtrado[g] for g in group_by]
+        res = quadro.groupby(chaves, observed=True).agg(funcoes)
+        res.columns = [f"{funcao}_{coluna}" for coluna, funcao in res.columns]
+        return res.reset_index()
+
+    linha: Dict[str, Any] = {} if dados else {"contagem": len(df_filtrado)}
+    for coluna, valores in dados.items():
+        validos = valores[~np.isnan(valores)]  # uma compactação por coluna, reaproveitada por todas as funções
+        n = len(validos)
+        calculos = {
+            "count": lambda: n,
+            "sum": lambda: float(validos.sum()),
+            "mean": lambda: float(validos.mean()) if n else np.nan,
+            "max": lambda: float(validos.max()) if n else np.nan,
+            "min": lambda: float(validos.min()) if n else np.nan,
+            "std": lambda: float(validos.std(ddof=1)) if n > 1 else np.nan,
+        }
+        for funcao in funcoes:
+            linha[f"{funcao}_{coluna}"] = calculos[funcao]()
+    return pd.DataFrame([linha])
+
+
+def mascara_do_filtro(filtro: Optional[pd.Series]) -> Optional[np.ndarray]:
+    """Máscara NumPy do filtro, ou None se ele não exclui nenhuma linha."""
+    if filtro is None:
+        return None
+    mascara = filtro.to_numpy(dtype=bool)
+    return None if mascara.all() else mascara
+
+
+def estatistica_celulas(funcao: str, n: np.ndarray, soma: np.ndarray, soma_quadrados: np.ndarray) -> np.ndarray:
+    """count/sum/mean/std por célula a partir da contagem, soma e soma dos quadrados."""
+    if funcao == "count":
+        return n
+    if funcao == "sum":
+        return soma
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = np.where(n > 0, soma / n, np.nan)
+        if funcao == "mean":
+            return media
+        variancia = np.where(n > 1, (soma_quadrados - soma * media) / (n - 1), np.nan)
+    return np.sqrt(np.maximum(variancia, 0.0), where=n > 1, out=np.full(len(n), np.nan))
+
+
+def contagem_por_grupo(planilha: "PlanilhaCarregada", filtro: Optional[pd.Series], grupos: List[str],
+                       df_filtrado: pd.DataFrame) -> pd.Series:
+    """Linhas filtradas por grupo, o mesmo que df_filtrado.groupby(grupos).size(), mas
+    respondida pelo cubo da planilha quando as colunas de grupo têm poucos valores distintos."""
+    cubo = planilha.cubos.obter(grupos) if all(g in df_filtrado.columns for g in grupos) else None
+    if cubo is None:
+        return df_filtrado.groupby(grupos, observed=True).size()
+    contagem = cubo.contagem(mascara_do_filtro(filtro))
+    return cubo.serie(contagem, contagem > 0)
+
+
+def media_por_grupo(planilha: "PlanilhaCarregada", filtro: Optional[pd.Series], grupos: List[str],
+                    coluna: str, df_filtrado: pd.DataFrame) -> pd.Series:
+    """Média de 'coluna' por grupo nas linhas filtradas (df_filtrado.groupby(grupos)[coluna].mean()),
+    pelo cubo quando possível."""
+    cubo = None
+    if all(g in df_filtrado.columns for g in grupos) and pd.api.types.is_numeric_dtype(planilha.df[coluna]):
+        cubo = planilha.cubos.obter(grupos)
+    if cubo is None:
+        return df_filtrado.groupby(grupos, observed=True)[coluna].mean()
+    linhas, n, soma, soma_quadrados = cubo.momentos(
+        coluna, lambda: valores_numericos(planilha.visoes, coluna).astype(float, copy=False),
+        mascara_do_filtro(filtro))
+    return cubo.serie(estatistica_celulas("mean", n, soma, soma_quadrados), linhas > 0)
+
+
+def agregar_no_cubo(planilha: "PlanilhaCarregada", filtro: Optional[pd.Series], colunas: List[str],
+                    funcoes: List[str], group_by: List[str], df_filtrado: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """O mesmo resultado de agregar() com group_by, tirado do cubo da planilha. None quando
+    o cubo não se aplica ou alguma função não sai de contagem/soma/soma dos quadrados (max, min)."""
+    if not group_by or not set(funcoes) <= {"count", "sum", "mean", "std"} \
+            or not all(g in df_filtrado.columns for g in group_by):
+        return None
+    cubo = planilha.cubos.obter(group_by)
+    if cubo is None:
+        return None
+    mascara = mascara_do_filtro(filtro)
+    linhas = cubo.contagem(mascara)
+    presentes = linhas > 0
+    if not colunas:
+        return cubo.serie(linhas, presentes).reset_index(name="contagem")
+    dados = {}
+    for coluna in colunas:
+        _, n, soma, soma_quadrados = cubo.momentos(
+            coluna, lambda c=coluna: valores_numericos(planilha.visoes, c).astype(float, copy=False), mascara)
+        for funcao in funcoes:
+            dados[f"{funcao}_{coluna}"] = cubo.serie(estatistica_celulas(funcao, n, soma, soma_quadrados), presentes)
+    return pd.DataFrame(dados).reset_index()
+
+
+def mascara_do_filtro(filtro: Optional[pd.Series]) -> Optional[np.ndarray]:
+    """Máscara NumPy do filtro, ou None se ele não exclui nenhuma linha."""
+    if filtro is None:
+        return None
+    mascara = filtro.to_numpy(dtype=bool)
+    return None if mascara.all() else mascara
+
+
+def estatistica_celulas(funcao: str, n: np.ndarray, soma: np.ndarray, m2: np.ndarray) -> np.ndarray:
+    """count/sum/mean/std por célula a partir da contagem, soma e soma dos quadrados dos desvios (m2)."""
+    if funcao == "count":
+        return n
+    if funcao == "sum":
+        return soma
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = np.where(n > 0, soma / n, np.nan)
+        if funcao == "mean":
+            return media
+        variancia = np.where(n > 1, m2 / (n - 1), np.nan)
+    return np.sqrt(np.maximum(variancia, 0.0), where=n > 1, out=np.full(len(n), np.nan))
+
+
+def contagem_por_grupo(planilha: "PlanilhaCarregada", filtro: Optional[pd.Series], grupos: List[str],
+                       df_filtrado: pd.DataFrame) -> pd.Series:
+    """Linhas filtradas por grupo, o mesmo que df_filtrado.groupby(grupos).size(), mas
+    respondida pelo cubo da planilha quando as colunas de grupo têm poucos valores distintos."""
+    cubo = planilha.cubos.obter(grupos) if all(g in df_filtrado.columns for g in grupos) else None
+    if cubo is None:
+        return df_filtrado.groupby(grupos, observed=True).size()
+    contagem = cubo.contagem(mascara_do_filtro(filtro))
+    return cubo.serie(contagem, contagem > 0)
+
+
+def media_por_grupo(planilha: "PlanilhaCarregada", filtro: Optional[pd.Series], grupos: List[str],
+                    coluna: str, df_filtrado: pd.DataFrame) -> pd.Series:
+    """Média de 'coluna' por grupo nas linhas filtradas (df_filtrado.groupby(grupos)[coluna].mean()).
+    Sem filtro, sai do cubo da planilha; com filtro, o groupby sobre o recorte é mais barato."""
+    cubo = None
+    if mascara_do_filtro(filtro) is None and all(g in df_filtrado.columns for g in grupos) \
+            and pd.api.types.is_numeric_dtype(planilha.df[coluna]):
+        cubo = planilha.cubos.obter(grupos)
+    if cubo is None:
+        return df_filtrado.groupby(grupos, observed=True)[coluna].mean()
+    n, soma, m2 = cubo.momentos(
+        coluna, lambda: valores_numericos(planilha.visoes, coluna).astype(float, copy=False))
+    return cubo.serie(estatistica_celulas("mean", n, soma, m2))
+
+
+def agregar_no_cubo(planilha: "PlanilhaCarregada", filtro: Optional[pd.Series], colunas: List[str],
+                    funcoes: List[str], group_by: List[str], df_filtrado: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """O mesmo resultado de agregar() com group_by, tirado do cubo da planilha. None quando o
+    cubo não se aplica: consulta filtrada com colunas a agregar, ou alguma função que não sai
+    de contagem/soma/m2 (max, min)."""
+    mascara = mascara_do_filtro(filtro)
+    if not group_by or not all(g in df_filtrado.columns for g in group_by) \
+            or (colunas and (mascara is not None or not set(funcoes) <= {"count", "sum", "mean", "std"})):
+        return None
+    cubo = planilha.cubos.obter(group_by)
+    if cubo is None:
+        return None
+    if not colunas:
+        linhas = cubo.contagem(mascara)
+        return cubo.serie(linhas, linhas > 0).reset_index(name="contagem")
+    dados = {}
+    for coluna in colunas:
+        n, soma, m2 = cubo.momentos(
+            coluna, lambda c=coluna: valores_numericos(planilha.visoes, c).astype(float, copy=False))
+        for funcao in funcoes:
+            dados[f"{funcao}_{coluna}"] = cubo.serie(estatistica_celulas(funcao, n, soma, m2))
+    return pd.DataFrame(dados).reset_index()
+
+
+def planejar_colunas(entrada: dict, resolvedor: ResolvedorColunas, incluir_filtros: bool = True) -> Optional[List[str]]:
+    """Colunas da planilha referenciadas pela entrada (filtros, operação, group_by, etc.).
+    Retorna None quando a consulta devolve linhas inteiras e é preciso carregar todas.
+    Com incluir_filtros=False, só as que a operação lê depois de filtrar."""
+    oper = entrada.get("operation")
+    if isinstance(oper, list):
+        oper = oper[0] if oper else None
+    op_low = str(oper).strip().lower() if oper else ""
+    cols_to_show = entrada.get("columns_to_show") or []
+    if op_low not in OPERACOES_CONHECIDAS or (op_low in OPERACOES_LINHAS and not cols_to_show):
+        return None
+
+    referencias: List[Any] = list(cols_to_show)
+    for item in (entrada.get("data", []) or []) if incluir_filtros else []:
+        referencias.append(item.get("column_name") or item.get("column"))
+    col_op = entrada.get("column_operation")
+    referencias.extend(col_op if isinstance(col_op, list) else [col_op])
+    for chave in ("group_by", "correlation", "comparisons"):
+        valor = entrada.get(chave) or []
+        referencias.extend(valor if isinstance(valor, list) else [valor])
+
+    usadas = []
+    for ref in referencias:
+        if isinstance(ref, (str, int, float)):
+            usadas.append(resolvedor.resolver(ref))
+
+    # colunas citadas dentro das expressões de special_conditions
+    specials = (entrada.get("special_conditions", []) or []) if incluir_filtros else []
+    for cond in specials:
+        try:
+            usadas.extend(compilar_condicao(str(cond), resolvedor).colunas)
+        except ValueError:
+            # expressão inválida: carrega o que o padrão de nomes encontrar
+            for m in resolvedor.padrao_nomes.finditer(str(cond)):
+                usadas.append(resolvedor.resolver(m.group(0)))
+
+    usadas = list(dict.fromkeys(c for c in usadas if c in resolvedor.reais))
+    # ao menos uma coluna, para que o recorte filtrado preserve o número de linhas
+    return usadas or resolvedor.colunas[:1]
+
+
+def montar_filtro(entrada: dict, df: pd.DataFrame, visoes: "VisoesColunas", mascaras: Any,
+                  resolvedor: ResolvedorColunas) -> pd.Series:
+    """Filtro (Series booleana alinhada a df) de 'data' e 'special_conditions' da entrada.
+    'mascaras' guarda os predicados já avaliados (MascarasPredicados da planilha em cache)."""
+    # filtro inicial (todas as linhas)
+    filtro = pd.Series(True, index=df.index)
+
+    # --- FILTROS SIMPLES via entrada['data'] ---
+    # as comparações numéricas são juntadas e avaliadas de uma vez depois do laço
+    comparacoes = set()
+    for item in entrada.get("data", []):
+        coluna_input = item.get("column_name") or item.get("column")
+        valor_input = item.get("value", "")
+        coluna_real = resolvedor.resolver(coluna_input)
+        if not coluna_real:
+            # sem coluna mapeada, nada a aplicar
+            continue
+
+        v = valor_input
+        comp = detectar_comparacao_numerica(v)
+        if comp:
+            op, num = comp
+            comparacoes.add((coluna_real, op, num))
+            continue
+
+        # texto / termos
+        termos = parse_termos_texto(v)
+        filtro &= mascaras.obter(("contem", coluna_real, tuple(sorted({str(t).lower() for t in termos}))),
+                                 lambda: mascara_contem_termos(df[coluna_real], termos, visoes.fatorada(coluna_real)))
+
+    if comparacoes:
+        comparacoes = sorted(comparacoes)
+        filtro &= mascaras.obter(("num", tuple(comparacoes)), lambda: conjuncao_numerica(visoes, comparacoes))
+
+    # --- SPECIAL CONDITIONS (expressões) ---
+    # compiladas uma vez por esquema + texto; cada termo unido por 'and' vira uma máscara em cache
+    specials = entrada.get("special_conditions", []) or []
+    for cond in specials:
+        try:
+            filtro &= compilar_condicao(str(cond), resolvedor).mascara(visoes, mascaras)
+        except Exception as e:
+            print(f"⚠️ Não foi possível avaliar condição '{cond}': {e}")
+    return filtro
+
+
+def usar_streaming(entrada: dict, arquivo_excel: Any) -> bool:
+    """A entrada pede o modo streaming ("streaming": true) ou o arquivo só é lido em blocos (.csv, .parquet)."""
+    arquivos = arquivo_excel if isinstance(arquivo_excel, (list, tuple)) else [arquivo_excel]
+    return bool(entrada.get("streaming")) or any(str(a).lower().endswith(EXTENSOES_BLOCOS) for a in arquivos)
+
+
+# --- MÉTRICAS DE EXECUÇÃO ---
+# Cada pesquisa mede o tempo de cada etapa (cache, leitura, resolucao, filtro, operacao, paralelo),
+# as linhas lidas, filtradas e devolvidas e, se pedido, o pico de memória alocada (tracemalloc).
+# Fora de medir(), etapa() e contar() não fazem nada.
+MEDIR_MEMORIA = False  # tracemalloc deixa as alocações bem mais lentas: ligue só para investigar
+METRICAS_PROMETHEUS: Optional[str] = None  # arquivo .prom (textfile collector do node_exporter)
+METRICAS_JSON: Optional[str] = None  # log com uma linha JSON por pesquisa
+PREFIXO_PROMETHEUS = "ferramenta_pesquisa"
+
+
+class Metricas:
+    """Medição de uma pesquisa (ou de um lote): segundos por etapa, contadores e pico de memória."""
+
+    def __init__(self, memoria: bool = False):
+        self.memoria = memoria
+        self.etapas: Dict[str, float] = {}
+        self.contadores: Dict[str, int] = {}
+        self.pico_memoria_bytes: Optional[int] = None
+        self.inicio = time.perf_counter()
+        self.fim: Optional[float] = None
+
+    def somar(self, etapa: str, segundos: float) -> None:
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + segundos
+
+    def contar(self, nome: str, quantidade: int = 1) -> None:
+        self.contadores[nome] = self.contadores.get(nome, 0) + int(quantidade)
+
+    @property
+    def total(self) -> float:
+        return (self.fim if self.fim is not None else time.perf_counter()) - self.inicio
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round(self.total * 1000, 3),
+            "etapas_ms": {nome: round(segundos * 1000, 3) for nome, segundos in self.etapas.items()},
+            "contadores": dict(self.contadores),
+            "pico_memoria_bytes": self.pico_memoria_bytes,
+        }
+
+
+_medicao_atual = threading.local()
+# tracemalloc é do processo inteiro: ligado enquanto houver alguma medição de memória em andamento
+_estado_memoria = {"trava": threading.Lock(), "usuarios": 0, "proprio": False}
+# funções chamadas com cada medição terminada (além de METRICAS_PROMETHEUS e METRICAS_JSON)
+ganchos_metricas: List[Any] = []
+_totais_prometheus = {"trava": threading.Lock(), "execucoes": 0, "segundos": 0.0, "etapas": {}, "contadores": {}}
+
+
+def metricas_atuais() -> Optional[Metricas]:
+    return getattr(_medicao_atual, "metricas", None)
+
+
+@contextlib.contextmanager
+def medir(memoria: Optional[bool] = None) -> Iterator[Metricas]:
+    """Ativa a medição nesta thread (memoria=None usa MEDIR_MEMORIA). Um medir() dentro de outro
+    (lote, componente) soma na medição de fora, que é exportada quando termina."""
+    atual = metricas_atuais()
+    if atual is not None:
+        yield atual
+        return
+    metricas = Metricas(MEDIR_MEMORIA if memoria is None else bool(memoria))
+    inicial = _ligar_tracemalloc() if metricas.memoria else 0
+    _medicao_atual.metricas = metricas
+    try:
+        yield metricas
+    finally:
+        _medicao_atual.metricas = None
+        metricas.fim = time.perf_counter()
+        if metricas.memoria:
+            # com consultas simultâneas o pico inclui o que as outras alocaram no período
+            metricas.pico_memoria_bytes = max(0, _desligar_tracemalloc() - inicial)
+        exportar_metricas(metricas)
+
+
+@contextlib.contextmanager
+def etapa(nome: str) -> Iterator[None]:
+    """Soma o tempo do bloco na etapa 'nome' da medição ativa."""
+    metricas = metricas_atuais()
+    if metricas is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas.somar(nome, time.perf_counter() - inicio)
+
+
+def contar(nome: str, quantidade: int = 1) -> None:
+    metricas = metricas_atuais()
+    if metricas is not None:
+        metricas.contar(nome, quantidade)
+
+
+def _ligar_tracemalloc() -> int:
+    """Liga o tracemalloc (se ainda não estiver) e devolve a memória rastreada no momento."""
+    with _estado_memoria["trava"]:
+        if _estado_memoria["usuarios"] == 0:
+            _estado_memoria["proprio"] = not tracemalloc.is_tracing()
+            if _estado_memoria["proprio"]:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        _estado_memoria["usuarios"] += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _desligar_tracemalloc() -> int:
+    """Pico de memória rastreada; desliga o tracemalloc se foi ligado aqui e ninguém mais mede."""
+    with _estado_memoria["trava"]:
+        pico = tracemalloc.get_traced_memory()[1]
+        _estado_memoria["usuarios"] -= 1
+        if _estado_memoria["usuarios"] == 0 and _estado_memoria["proprio"]:
+            tracemalloc.stop()
+        return pico
+
+
+def gravar_metricas_json(caminho: str, metricas: Metricas) -> None:
+    """Acrescenta a medição como uma linha JSON ao arquivo."""
+    linha = json.dumps({"instante": round(time.time(), 3), **metricas.como_dict()}, ensure_ascii=False)
+    # uma única escrita por linha em modo "a": linhas de threads diferentes não se misturam
+    with open(caminho, "a", encoding="utf-8") as arquivo:
+        arquivo.write(linha + "\n")
+
+
+def gravar_metricas_prometheus(caminho: str, metricas: Metricas) -> None:
+    """Soma a medição aos totais do processo e regrava o arquivo no formato texto do Prometheus
+    (troca atômica, para o coletor nunca ler um arquivo pela metade)."""
+    p = PREFIXO_PROMETHEUS
+    with _totais_prometheus["trava"]:
+        totais = _totais_prometheus
+        totais["execucoes"] += 1
+        totais["segundos"] += metricas.total
+        for nome, segundos in metricas.etapas.items():
+            totais["etapas"][nome] = totais["etapas"].get(nome, 0.0) + segundos
+        for nome, quantidade in metricas.contadores.items():
+            totais["contadores"][nome] = totais["contadores"].get(nome, 0) + quantidade
+        linhas = [
+            f"# HELP {p}_execucoes_total Pesquisas medidas.",
+            f"# TYPE {p}_execucoes_total counter",
+            f"{p}_execucoes_total {totais['execucoes']}",
+            f"# HELP {p}_segundos_total Tempo total das pesquisas.",
+            f"# TYPE {p}_segundos_total counter",
+            f"{p}_segundos_total {totais['segundos']:.6f}",
+            f"# HELP {p}_etapa_segundos_total Tempo por etapa das pesquisas.",
+            f"# TYPE {p}_etapa_segundos_total counter",
+            *(f'{p}_etapa_segundos_total{{etapa="{nome}"}} {segundos:.6f}'
+              for nome, segundos in sorted(totais["etapas"].items())),
+            f"# HELP {p}_eventos_total Linhas lidas/filtradas/devolvidas, consultas e acertos do cache.",
+            f"# TYPE {p}_eventos_total counter",
+            *(f'{p}_eventos_total{{nome="{nome}"}} {quantidade}'
+              for nome, quantidade in sorted(totais["contadores"].items())),
+            f"# HELP {p}_ultima_execucao_segundos Duração da última pesquisa.",
+            f"# TYPE {p}_ultima_execucao_segundos gauge",
+            f"{p}_ultima_execucao_segundos {metricas.total:.6f}",
+        ]
+        if metricas.pico_memoria_bytes is not None:
+            linhas += [f"# HELP {p}_ultimo_pico_memoria_bytes Pico de memória alocada na última pesquisa medida.",
+                       f"# TYPE {p}_ultimo_pico_memoria_bytes gauge",
+                       f"{p}_ultimo_pico_memoria_bytes {metricas.pico_memoria_bytes}"]
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            arquivo.write("\n".join(linhas) + "\n")
+        os.replace(temporario, caminho)
+
+
+def exportar_metricas(metricas: Metricas) -> None:
+    """Entrega a medição terminada a METRICAS_PROMETHEUS, METRICAS_JSON e ganchos_metricas."""
+    destinos = list(ganchos_metricas)
+    if METRICAS_PROMETHEUS:
+        destinos.append(functools.partial(gravar_metricas_prometheus, METRICAS_PROMETHEUS))
+    if METRICAS_JSON:
+        destinos.append(functools.partial(gravar_metricas_json, METRICAS_JSON))
+    for destino in destinos:
+        try:
+            destino(metricas)
+        except Exception as e:
+            print(f"Erro ao exportar métricas: {e}")
+
+
+# --- CACHE DE RESULTADOS ---
+# Resultados inteiros de executar_pesquisa, para pedidos repetidos (inclusive escritos de outra forma)
+CACHE_RESULTADOS_MAX_ITENS = 256
+CACHE_RESULTADOS_MAX_BYTES = 128 * 1024 * 1024
+CACHE_RESULTADOS_TTL = 300.0  # segundos
+
+
+class CacheResultados:
+    """LRU dos resultados de executar_pesquisa, por (impressão digital das planilhas, entrada canônica).
+
+    Cada resultado vale por CACHE_RESULTADOS_TTL segundos; o cache guarda no máximo
+    CACHE_RESULTADOS_MAX_ITENS resultados e CACHE_RESULTADOS_MAX_BYTES bytes (o resultado
+    menos usado recentemente sai primeiro). Como a impressão digital inclui mtime e tamanho
+    dos arquivos, uma planilha alterada nunca devolve um resultado antigo."""
+
+    def __init__(self, max_itens: int = CACHE_RESULTADOS_MAX_ITENS, max_bytes: int = CACHE_RESULTADOS_MAX_BYTES,
+                 ttl: float = CACHE_RESULTADOS_TTL):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirados = 0
+        self.ignorados = 0  # pedidos com "cache": false
+        # chave -> (valor, bytes, instante em que expira)
+        self._itens: "OrderedDict[Tuple, Tuple[Any, int, float]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def obter(self, chave: Tuple) -> Any:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and item[2] <= time.monotonic():
+                self._remover(chave)
+                self.expirados += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return item[0]
+
+    def guardar(self, chave: Tuple, valor: Any, tamanho: int) -> None:
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            if tamanho > self.max_bytes:
+                return
+            self._itens[chave] = (valor, tamanho, time.monotonic() + self.ttl)
+            self._total_bytes += tamanho
+            while self._itens and (len(self._itens) > self.max_itens or self._total_bytes > self.max_bytes):
+                self._remover(next(iter(self._itens)))
+
+    def ignorar(self) -> None:
+        with self._lock:
+            self.ignorados += 1
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+            self._total_bytes = 0
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": round(self.hits / total, 4) if total else 0.0,
+                "expirados": self.expirados,
+                "ignorados": self.ignorados,
+                "entradas": len(self._itens),
+                "bytes": self._total_bytes,
+                "max_itens": self.max_itens,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+    def _remover(self, chave: Tuple) -> None:
+        _, tamanho, _ = self._itens.pop(chave)
+        self._total_bytes -= tamanho
+
+
+cache_resultados = CacheResultados()
+
+
+def _colunas_canonicas(valores: Any, resolvedor: ResolvedorColunas) -> Any:
+    """Lista de colunas com os nomes reais (None para as que não existem, na mesma posição,
+    porque correlation/comparisons são posicionais); o que não é lista fica como veio."""
+    if not isinstance(valores, list):
+        return valores
+    return [resolvedor.resolver(v) if isinstance(v, str) and v else v for v in valores]
+
+
+def _filtro_canonico(item: Any, resolvedor: ResolvedorColunas) -> Any:
+    if not isinstance(item, dict):
+        return item
+    coluna = item.get("column_name") or item.get("column")
+    # item de coluna que não existe: montar_filtro o ignora
+    return [resolvedor.resolver(coluna) if coluna else None, item.get("value", "")]
+
+
+def entrada_canonica(entrada: dict, resolvedor: ResolvedorColunas) -> str:
+    """JSON canônico da entrada, para o cache de resultados: colunas trocadas pelos nomes reais,
+    apelidos de operação normalizados (media -> mean, contagem -> count...) e os filtros de 'data'
+    ordenados (montar_filtro combina todos com 'and'). Pedidos equivalentes escritos de formas
+    diferentes (ordem das chaves, maiúsculas, sinônimos) dão o mesmo texto."""
+    canonica = {k: v for k, v in entrada.items() if k not in CHAVES_FORA_DO_RESULTADO}
+
+    # montar_filtro lê só 'data' e percorre 'special_conditions' como veio (que fica como está);
+    # 'filter'/'filters'/'filtros' não filtram aqui e ficam como chaves comuns, sem se misturar a 'data'
+    if isinstance(canonica.get("data"), list):
+        filtros = [_filtro_canonico(item, resolvedor) for item in canonica["data"]]
+        canonica["data"] = sorted(filtros, key=lambda f: json.dumps(f, sort_keys=True, default=str))
+    # os termos vêm de COLUNAS_MAPEAMENTO (a entrada não muda o mapeamento)
+    canonica.pop("colunas_mapeamento", None)
+
+    oper = entrada.get("operation")
+    col_op = entrada.get("column_operation")
+    agregacoes = agregacoes_pedidas(oper)
+    if agregacoes:
+        canonica["operation"] = agregacoes
+        canonica["column_operation"] = _colunas_canonicas(col_op if isinstance(col_op, list) else [col_op], resolvedor)
+    else:
+        # mesma regra de executar_pesquisa para listas
+        if isinstance(oper, list):
+            oper = oper[0] if oper else None
+        op_low = str(oper).strip().lower() if oper else ""
+        canonica["operation"] = OPERACOES_EQUIVALENTES.get(op_low, op_low)
+        if isinstance(col_op, list):
+            col_op = col_op[0] if col_op else None
+        canonica["column_operation"] = resolvedor.resolver(col_op) if isinstance(col_op, str) and col_op else col_op
+    for chave in ["columns_to_show", "group_by", "correlation", "comparisons"]:
+        if chave in canonica:
+            canonica[chave] = _colunas_canonicas(canonica[chave], resolvedor)
+    return json.dumps(canonica, sort_keys=True, default=str)
+
+
+@functools.lru_cache(maxsize=64)
+def _esquema_resultado(impressao: Tuple, fontes: Tuple[Tuple[str, Any], ...], header_linha: int,
+                       em_blocos: bool) -> Tuple[str, ...]:
+    # a impressão digital entra na chave do lru_cache: uma planilha alterada relê o cabeçalho
+    if em_blocos:
+        return tuple(esquema_blocos(list(fontes), header_linha))
+    if len(fontes) > 1:
+        return tuple(esquema_fontes(list(fontes), header_linha))
+    return tuple(esquema_planilha(fontes[0][0], fontes[0][1], header_linha))
+
+
+def chave_resultado(entrada: dict, arquivo_excel: Any, aba: Any, header_linha: int) -> Optional[Tuple]:
+    """(impressão digital das planilhas, entrada canônica); None se as planilhas não puderem ser lidas."""
+    try:
+        fontes = tuple(expandir_fontes(arquivo_excel, aba))
+        impressao = tuple(CachePlanilhas.chave(arquivo, aba_fonte, header_linha) for arquivo, aba_fonte in fontes)
+        esquema = _esquema_resultado(impressao, fontes, header_linha, usar_streaming(entrada, arquivo_excel))
+        resolvedor = obter_resolvedor(list(esquema), COLUNAS_MAPEAMENTO_LOWER)
+        return impressao, entrada_canonica(entrada, resolvedor)
+    except Exception:
+        return None
+
+
+def tamanho_resultado(resultado: Any) -> int:
+    """Bytes aproximados do resultado (sem percorrer os textos, que em geral são da planilha em cache)."""
+    return int(resultado.memory_usage(index=True).sum()) if isinstance(resultado, pd.DataFrame) else 0
+
+
+class EcoSaida(io.TextIOBase):
+    """Repete no console o que a pesquisa imprime e guarda uma cópia, que um acerto do cache
+    de resultados reimprime igual."""
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.partes: List[str] = []
+
+    def write(self, texto: str) -> int:
+        self.partes.append(texto)
+        return self.destino.write(texto)
+
+    def flush(self) -> None:
+        self.destino.flush()
+
+    def texto(self) -> str:
+        return "".join(self.partes)
+
+
+# === Função principal ===
+def executar_pesquisa(entrada: dict, arquivo_excel: str = "Planilha.xlsx", aba: Optional[int] = None, header_linha: int = 0,
+                      planilha: Optional[PlanilhaCarregada] = None) -> pd.DataFrame:
+    """
+    Executa a query definida pela 'entrada' sobre o arquivo Excel.
+    Mostra resultados no console e retorna o DataFrame (ou subset) usado.
+    'planilha' é usado por executar_pesquisas para reaproveitar a planilha já carregada.
+    Com "streaming": true na entrada (ou arquivo .csv/.parquet), usa executar_pesquisa_streaming;
+    com "paralelo": true (ou um número de processos), executar_pesquisa_paralela.
+    O resultado (e o que foi mostrado) fica no cache de resultados pela entrada canônica e pela
+    impressão digital das planilhas; "cache": false na entrada recalcula (e atualiza o cache).
+    Tempos por etapa e linhas lidas/filtradas/devolvidas vão para a medição ativa (medir);
+    "medir_memoria": true mede também o pico de memória e "debug": true mostra as métricas.
+    """
+    with medir(entrada.get("medir_memoria")) as metricas:
+        with etapa("cache"):
+            chave = chave_resultado(entrada, arquivo_excel, aba, header_linha)
+            guardado = None
+            if chave is not None:
+                if entrada.get("cache", True) is False:
+                    cache_resultados.ignorar()
+                else:
+                    guardado = cache_resultados.obter(chave)
+        if guardado is not None:
+            contar("acertos_cache")
+            resultado, texto = guardado
+            print(texto, end="")
+        elif chave is None:
+            resultado = _executar_pesquisa(entrada, arquivo_excel, aba, header_linha, planilha)
+        else:
+            eco = EcoSaida(sys.stdout)
+            with contextlib.redirect_stdout(eco):
+                resultado = _executar_pesquisa(entrada, arquivo_excel, aba, header_linha, planilha)
+            texto = eco.texto()
+            cache_resultados.guardar(chave, (resultado, texto), tamanho_resultado(resultado) + len(texto))
+        contar("consultas")
+        contar("linhas_saida", len(resultado))
+    if entrada.get("debug"):
+        print(f"Métricas: {json.dumps(metricas.como_dict(), ensure_ascii=False)}")
+    # cópia rasa: quem recebe pode trocar colunas sem mexer no que está guardado
+    return resultado.copy(deep=False) if chave is not None else resultado
+
+
+def _executar_pesquisa(entrada: dict, arquivo_excel: str = "Planilha.xlsx", aba: Optional[int] = None, header_linha: int = 0,
+                       planilha: Optional[PlanilhaCarregada] = None) -> pd.DataFrame:
+    if entrada.get("paralelo"):
+        processos = entrada["paralelo"] if isinstance(entrada["paralelo"], int) and entrada["paralelo"] is not True else None
+        # leitura, filtro e operação acontecem nos processos: uma etapa só
+        with etapa("paralelo"):
+            return executar_pesquisa_paralela(entrada, arquivo_excel, aba, header_linha, processos)
+    if usar_streaming(entrada, arquivo_excel):
+        return executar_pesquisa_streaming(entrada, arquivo_excel, aba, header_linha)
+    try:
+        # o esquema (só o cabeçalho) basta para decidir quais colunas carregar
+        with etapa("leitura"):
+            esquema = planilha.esquema if planilha is not None else esquema_planilha(arquivo_excel, aba, header_linha)
+        with etapa("resolucao"):
+            resolvedor = obter_resolvedor(esquema, COLUNAS_MAPEAMENTO_LOWER)
+            colunas_usadas = planejar_colunas(entrada, resolvedor)
+        with etapa("leitura"):
+            if planilha is None:
+                planilha = obter_planilha(arquivo_excel, aba, header_linha, colunas=colunas_usadas)
+        df, visoes, mascaras = planilha.df, planilha.visoes, planilha.mascaras
+    except FileNotFoundError:
+        print(f"Arquivo não encontrado: {arquivo_excel}. Verifique o caminho e tente novamente.")
+        return pd.DataFrame()
+    except Exception as e:
+        print(f"Erro ao abrir o arquivo: {e}")
+        return pd.DataFrame()
+    contar("linhas_entrada", len(df))
+
+    with etapa("filtro"):
+        filtro = montar_filtro(entrada, df, visoes, mascaras, resolvedor)
+
+        if colunas_usadas is None:
+            df_filtrado = recortar(df, filtro)
+        else:
+            # só as colunas que a operação/columns_to_show leem (as de filtro já cumpriram seu papel)
+            df_filtrado = recortar(df, filtro, planejar_colunas(entrada, resolvedor, incluir_filtros=False))
+    contar("linhas_filtradas", len(df_filtrado))
+
+    if not len(df_filtrado):
+        print("Nenhum resultado encontrado após aplicar filtros.")
+        return df_filtrado
+
+    with etapa("operacao"):
+        # --- OPERAÇÕES ---
+        col_op = entrada.get("column_operation")
+        oper = entrada.get("operation")
+
+        # várias agregações de uma vez (ex.: ["mean", "max", "count"]) sobre uma ou mais colunas
+        agregacoes = agregacoes_pedidas(oper)
+        if agregacoes:
+            colunas_op = [resolvedor.resolver(c) for c in (col_op if isinstance(col_op, list) else [col_op]) if c]
+            colunas_op = list(dict.fromkeys(c for c in colunas_op if c in df_filtrado.columns))
+            gb = [resolvedor.resolver(c) for c in (entrada.get("group_by") or [])]
+            gb = [c for c in gb if c in df_filtrado.columns]
+            try:
+                res = agregar_no_cubo(planilha, filtro, colunas_op, agregacoes, gb, df_filtrado)
+                if res is None:
+                    res = agregar(df_filtrado, colunas_op, agregacoes, gb)
+                titulo = f"{', '.join(agregacoes)} de {', '.join(colunas_op) or 'registros'}"
+                print(f"{titulo} por {gb}:" if gb else f"{titulo}:")
+                print(res.to_string(index=False))
+            except Exception as e:
+                print(f"Erro ao executar operação '{oper}': {e}")
+            return df_filtrado
+
+        # desfazer listas onde aplicável
+        if isinstance(col_op, list):
+            col_op = col_op[0] if col_op else None
+        if isinstance(oper, list):
+            oper = oper[0] if oper else None
+
+        col_op_real = resolvedor.resolver(col_op) if col_op else None
+
+        # columns_to_show mapeadas
+        cols_to_show = entrada.get("columns_to_show") or []
+        cols_to_show_mapped = [resolvedor.resolver(c) for c in cols_to_show] if cols_to_show else []
+        cols_to_show_mapped = [c for c in cols_to_show_mapped if c]
+
+        op_low = str(oper).strip().lower() if oper else ""
+
+        try:
+            # Se nenhuma operação foi informada: retorna colunas solicitadas (se houver) ou todo df_filtrado
+            if not op_low:
+                if cols_to_show_mapped:
+                    print("Nenhuma operação especificada — retornando apenas as colunas solicitadas:")
+                    print(df_filtrado[cols_to_show_mapped].to_string(index=False))
+                    return df_filtrado[cols_to_show_mapped]
+                else:
+                    print("Nenhuma operação especificada — retornando DataFrame filtrado completo:")
+                    print(df_filtrado.to_string(index=False))
+                    return df_filtrado
+
+            # CONTAGEM (count)
+            if op_low in ["count", "contagem"]:
+                if col_op_real and col_op_real in df_filtrado.columns:
+                    total = int(df_filtrado[col_op_real].notna().sum())
+                    print(f"Contagem de '{col_op_real}': {total}")
+                else:
+                    total = len(df_filtrado)
+                    print(f"Contagem total de registros: {total}")
+                return df_filtrado
+
+            # PORCENTAGEM (percent)
+            if op_low in ["porcentagem", "percent", "percentage", "percentual"]:
+                total_geral = len(df)
+                total_filtrado = len(df_filtrado)
+                # se não há group_by -> porcentagem do total geral
+                group_by = entrada.get("group_by", []) or []
+                if not group_by:
+                    pct = (total_filtrado / total_geral) * 100 if total_geral else 0
+                    print(f"Total geral: {total_geral}")
+                    print(f"Total filtrado: {total_filtrado}")
+                    print(f"Porcentagem (do total geral): {pct:.2f}%")
+                    return df_filtrado
+                # se há group_by -> calcular taxa por grupo corretamente (ex: survivors_in_group / total_in_group)
+                gb_cols = [resolvedor.resolver(c) for c in group_by]
+                gb_cols = [c for c in gb_cols if c]
+                if not gb_cols:
+                    print("group_by informado, mas não foi possível mapear colunas.")
+                    return df_filtrado
+                # contagens totais por grupo (no df original)
+                tot_por_grupo = contagem_por_grupo(planilha, None, gb_cols, df).rename("total_no_grupo")
+                # contagens filtradas por grupo (após aplicar special_conditions/data)
+                filt_por_grupo = contagem_por_grupo(planilha, filtro, gb_cols, df_filtrado).rename("filtrados_no_grupo")
+                res = pd.concat([tot_por_grupo, filt_por_grupo], axis=1).fillna(0)
+                res["porcentagem_no_grupo"] = (res["filtrados_no_grupo"] / res["total_no_grupo"] * 100).round(2)
+                res = res.reset_index()
+                print("Porcentagem/taxa por grupo (filtrados / total do grupo):")
+                print(res.to_string(index=False))
+                return df_filtrado
+
+            # MÉDIA
+            if op_low in ["mean", "media"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'mean' não encontrada.")
+                    return df_filtrado
+                if entrada.get("group_by"):
+                    gb = [resolvedor.resolver(c) for c in entrada.get("group_by")]
+                    gb = [c for c in gb if c]
+                    if gb:
+                        res = media_por_grupo(planilha, filtro, gb, col_op_real, df_filtrado).reset_index(name=f"mean_{col_op_real}")
+                        print(f"Média de {col_op_real} por {gb}:")
+                        print(res.to_string(index=False))
+                        return df_filtrado
+                mean_val = df_filtrado[col_op_real].dropna().mean()
+                print(f"Média ({col_op_real}): {mean_val}")
+                return df_filtrado
+
+            # SUM
+            if op_low in ["sum", "soma"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'sum' não encontrada.")
+                    return df_filtrado
+                total = df_filtrado[col_op_real].dropna().sum()
+                print(f"Soma ({col_op_real}): {total}")
+                return df_filtrado
+
+            # MAX
+            if op_low in ["max"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'max' não encontrada.")
+                    return df_filtrado
+                val = df_filtrado[col_op_real].dropna().max()
+                print(f"Máximo ({col_op_real}): {val}")
+                return df_filtrado
+
+            # MIN
+            if op_low in ["min"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'min' não encontrada.")
+                    return df_filtrado
+                val = df_filtrado[col_op_real].dropna().min()
+                print(f"Mínimo ({col_op_real}): {val}")
+                return df_filtrado
+
+            # STD
+            if op_low in ["std"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'std' não encontrada.")
+                    return df_filtrado
+                val = df_filtrado[col_op_real].dropna().std()
+                print(f"Desvio padrão ({col_op_real}): {val}")
+                return df_filtrado
+
+            # DESCRIBE
+            if op_low in ["describe"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'describe' não encontrada.")
+                    return df_filtrado
+                desc = df_filtrado[col_op_real].describe()
+                print(f"Describe ({col_op_real}):")
+                print(desc.to_string() if hasattr(desc, "to_string") else str(desc))
+                return df_filtrado
+
+            # TOP / RANKING
+            if op_low in ["top", "ranking"]:
+                if not col_op_real or col_op_real not in df_filtrado.columns:
+                    print("Coluna para operação 'top' não encontrada.")
+                    return df_filtrado
+                order = entrada.get("ranking", [])
+                order = str(order[0]).lower() if isinstance(order, list) and order else (str(order).lower() if order else "desc")
+                ascending = order in ["asc", "cresc", "ascending"]
+                limit = int(entrada.get("limit") or entrada.get("n") or 5)
+                cols_show = cols_to_show_mapped if cols_to_show_mapped else df_filtrado.columns.tolist()
+                res = top_linhas(df_filtrado, visoes, filtro, col_op_real, limit, ascending)
+                print(f"Top {limit} por {col_op_real} (ascending={ascending}):")
+                print(res[cols_show].to_string(index=False))
+                return df_filtrado
+
+            # LISTAR colunas
+            if op_low in ["list", "listar"]:
+                if cols_to_show_mapped:
+                    print("Listando colunas solicitadas:")
+                    print(df_filtrado[cols_to_show_mapped].to_string(index=False))
+                    return df_filtrado[cols_to_show_mapped]
+                else:
+                    print("Listando todas as colunas do DataFrame filtrado:")
+                    print(df_filtrado.to_string(index=False))
+                    return df_filtrado
+
+            # CORRELAÇÃO
+            if op_low in ["correlacao", "correlation"]:
+                corr_cols = entrada.get("correlation") or entrada.get("comparisons") or []
+                if isinstance(corr_cols, list) and len(corr_cols) >= 2:
+                    c1 = resolvedor.resolver(corr_cols[0])
+                    c2 = resolvedor.resolver(corr_cols[1])
+                    if c1 in df_filtrado.columns and c2 in df_filtrado.columns:
+                        # força numérico quando possível
+                        s1 = visoes.numerica(c1)[filtro]
+                        s2 = visoes.numerica(c2)[filtro]
+                        corr_val = s1.corr(s2)
+                        print(f"Correlação entre {c1} e {c2}: {corr_val}")
+                    else:
+                        print("Colunas para correlação não encontradas no DataFrame filtrado.")
+                else:
+                    print("Forneça duas colunas para calcular correlação (em 'correlation' ou 'comparisons').")
+                return df_filtrado
+
+            # COMPARE_MEAN (média de col_val por col_group)
+            if op_low in ["compare_mean", "comparar_media"]:
+                comps = entrada.get("comparisons") or []
+                if isinstance(comps, list) and len(comps) >= 2:
+                    col_val = resolvedor.resolver(comps[0])
+                    col_group = resolvedor.resolver(comps[1])
+                    if col_val and col_group and col_val in df_filtrado.columns and col_group in df_filtrado.columns:
+                        res = media_por_grupo(planilha, filtro, [col_group], col_val, df_filtrado).reset_index(name=f"mean_{col_val}")
+                        print(f"Média de {col_val} por {col_group}:")
+                        print(res.to_string(index=False))
+                    else:
+                        print("Colunas para compare_mean não encontradas.")
+                else:
+                    print("Passe duas colunas em 'comparisons', ex: [\"Fare\", \"Survived\"]")
+                return df_filtrado
+
+            # MÉDIA POR GRUPO (quando 'group_by' presente mesmo sem 'operation' específica)
+            if entrada.get("group_by") and not op_low:
+                gb = [resolvedor.resolver(c) for c in entrada.get("group_by")]
+                gb = [c for c in gb if c]
+                if gb:
+                    if cols_to_show_mapped:
+                        print(df_filtrado.groupby(gb, observed=True)[cols_to_show_mapped].mean().reset_index().to_string(index=False))
+                    else:
+                        print(df_filtrado.groupby(gb, observed=True).mean().reset_index().to_string(index=False))
+                return df_filtrado
+
+            # fallback
+            print("Operação não reconhecida.")
+            return df_filtrado
+
+        except Exception as e:
+            print(f"Erro ao executar operação '{oper}': {e}")
+            return df_filtrado
+
+
+def executar_pesquisas(entradas: List[dict], arquivo_excel: str = "Planilha.xlsx", aba: Optional[int] = None, header_linha: int = 0) -> List[pd.DataFrame]:
+    """
+    Executa várias entradas sobre a mesma planilha, carregada uma única vez (com a união
+    das colunas usadas). Colunas resolvidas, visões normalizadas e máscaras de filtros
+    idênticos são compartilhadas entre as consultas. Retorna os resultados na ordem das entradas.
+    """
+    entradas = [e if isinstance(e, dict) else {} for e in entradas]
+    # entradas em streaming ou paralelas leem a planilha em partes, cada uma por conta própria
+    em_memoria = [e for e in entradas if not (usar_streaming(e, arquivo_excel) or e.get("paralelo"))]
+    planilha = None
+    try:
+        if em_memoria:
+            esquema = esquema_planilha(arquivo_excel, aba, header_linha)
+            resolvedor = obter_resolvedor(esquema, COLUNAS_MAPEAMENTO_LOWER)
+            planos = [planejar_colunas(e, resolvedor) for e in em_memoria]
+            colunas = None if any(p is None for p in planos) else list(dict.fromkeys(c for p in planos for c in p))
+            planilha = obter_planilha(arquivo_excel, aba, header_linha, colunas=colunas)
+    except FileNotFoundError:
+        print(f"Arquivo não encontrado: {arquivo_excel}. Verifique o caminho e tente novamente.")
+        return [pd.DataFrame() for _ in entradas]
+    except Exception as e:
+        print(f"Erro ao abrir o arquivo: {e}")
+        return [pd.DataFrame() for _ in entradas]
+
+    resultados = []
+    for i, entrada in enumerate(entradas, 1):
+        print(f"--- Consulta {i} de {len(entradas)} ---")
+        resultados.append(executar_pesquisa(entrada, arquivo_excel, aba, header_linha, planilha=planilha))
+    return resultados
+
+
+# --- STREAMING (planilhas maiores que a memória) ---
+# A consulta é executada bloco a bloco: cada bloco de linhas passa pelos mesmos filtros de
+# executar_pesquisa e só resumos que podem ser juntados ficam em memória (contagens, somas,
+# momentos de Welford, parciais por grupo, top-N). Aceita .xlsx/.xlsm (openpyxl read_only),
+# .csv (pandas em partes) e .parquet (row groups via pyarrow).
+LINHAS_POR_BLOCO = 100_000
+EXTENSOES_BLOCOS = (".csv", ".parquet")
+
+
+def _nomes_cabecalho(valores: List[Any]) -> List[str]:
+    """Nomes limpos das colunas de um cabeçalho lido célula a célula, como o pandas os daria
+    (vazio -> 'Unnamed: i', repetidos -> 'nome.1', 'nome.2'...)."""
+    nomes: List[str] = []
+    vistos: Dict[str, int] = {}
+    for i, valor in enumerate(valores):
+        nome = f"Unnamed: {i}" if valor is None or str(valor).strip() == "" else str(valor).strip()
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        vistos.setdefault(nome, 0)
+        nomes.append(nome)
+    return nomes
+
+
+def _abrir_aba(arquivo: str, aba: Any):
+    from openpyxl import load_workbook
+    livro = load_workbook(arquivo, read_only=True, data_only=True)
+    return livro, (livro.worksheets[aba] if isinstance(aba, int) else livro[aba])
+
+
+def cabecalho_blocos(arquivo: str, aba: Any = 0, header_linha: int = 0) -> List[str]:
+    """Nomes das colunas lendo só o cabeçalho, sem carregar a planilha."""
+    extensao = os.path.splitext(arquivo)[1].lower()
+    if extensao == ".csv":
+        return [str(c).strip() for c in pd.read_csv(arquivo, header=header_linha, nrows=0).columns]
+    if extensao == ".parquet":
+        return [str(c).strip() for c in pq.ParquetFile(arquivo).schema_arrow.names]
+    livro, planilha = _abrir_aba(arquivo, aba or 0)
+    try:
+        for i, linha in enumerate(planilha.iter_rows(values_only=True)):
+            if i == header_linha:
+                return _nomes_cabecalho(list(linha))
+        return []
+    finally:
+        livro.close()
+
+
+def ler_blocos(arquivo: str, aba: Any = 0, header_linha: int = 0, colunas: Optional[List[str]] = None,
+               linhas_por_bloco: int = LINHAS_POR_BLOCO) -> Iterator[pd.DataFrame]:
+    """Lê a planilha em blocos de até 'linhas_por_bloco' linhas, com nomes de colunas limpos e
+    índice igual à posição da linha no arquivo. Com 'colunas', lê só essas (se existirem)."""
+    extensao = os.path.splitext(arquivo)[1].lower()
+    conjunto = set(colunas) if colunas is not None else None
+    inicio = 0
+    if extensao == ".csv":
+        usecols = (lambda c: str(c).strip() in conjunto) if conjunto is not None else None
+        partes = pd.read_csv(arquivo, header=header_linha, usecols=usecols, chunksize=linhas_por_bloco)
+    elif extensao == ".parquet":
+        if pq is None:
+            raise ImportError("leitura de .parquet requer pyarrow")
+        origem = pq.ParquetFile(arquivo)
+        nomes = [n for n in origem.schema_arrow.names if conjunto is None or str(n).strip() in conjunto]
+        partes = (lote.to_pandas() for lote in origem.iter_batches(batch_size=linhas_por_bloco, columns=nomes))
+    elif extensao in (".xlsx", ".xlsm"):
+        partes = _blocos_excel(arquivo, aba or 0, header_linha, conjunto, linhas_por_bloco)
+    else:
+        raise ValueError(f"formato não suportado no modo streaming: {extensao or arquivo}")
+    for bloco in partes:
+        bloco.columns = [str(c).strip() for c in bloco.columns]
+        bloco.index = pd.RangeIndex(inicio, inicio + len(bloco))
+        inicio += len(bloco)
+        yield bloco
+
+
+def ler_blocos_fontes(fontes: List[Tuple[str, Any]], header_linha: int = 0, colunas: Optional[List[str]] = None,
+                      linhas_por_bloco: int = LINHAS_POR_BLOCO) -> Iterator[pd.DataFrame]:
+    """ler_blocos de cada (arquivo, aba), em sequência e com índice contínuo. Com mais de uma
+    fonte, os blocos trazem a coluna de origem e as colunas que faltam numa fonte vêm vazias."""
+    if len(fontes) == 1:
+        yield from ler_blocos(fontes[0][0], fontes[0][1], header_linha, colunas, linhas_por_bloco)
+        return
+    esquema = [c for c in esquema_blocos(fontes, header_linha) if c != COLUNA_ORIGEM]
+    usar = [c for c in esquema if colunas is None or c in set(colunas)]
+    inicio = 0
+    for (arquivo, aba), rotulo in zip(fontes, rotulos_fontes(fontes)):
+        for bloco in ler_blocos(arquivo, aba, header_linha, usar, linhas_por_bloco):
+            bloco = bloco.reindex(columns=usar)
+            bloco.index = pd.RangeIndex(inicio, inicio + len(bloco))
+            bloco[COLUNA_ORIGEM] = rotulo
+            inicio += len(bloco)
+            yield bloco
+
+
+def esquema_blocos(fontes: List[Tuple[str, Any]], header_linha: int = 0) -> List[str]:
+    """Colunas das fontes lidas só pelo cabeçalho (com a coluna de origem, se houver mais de uma)."""
+    nomes = [c for arquivo, aba in fontes for c in cabecalho_blocos(arquivo, aba, header_linha)]
+    if len(fontes) == 1:
+        return nomes
+    return list(dict.fromkeys(c for c in nomes if c != COLUNA_ORIGEM)) + [COLUNA_ORIGEM]
+
+
+def _blocos_excel(arquivo: str, aba: Any, header_linha: int, conjunto: Optional[set],
+                  linhas_por_bloco: int) -> Iterator[pd.DataFrame]:
+    livro, planilha = _abrir_aba(arquivo, aba)
+    try:
+        linhas = planilha.iter_rows(values_only=True)
+        for _ in range(header_linha):
+            next(linhas, None)
+        nomes = _nomes_cabecalho(list(next(linhas, None) or []))
+        indices = [i for i, n in enumerate(nomes) if conjunto is None or n in conjunto]
+        nomes = [nomes[i] for i in indices]
+        largura = max(indices, default=-1) + 1
+        tipos = tipos_snapshot(arquivo, aba, header_linha)
+        vazia = (None,) * len(indices)
+        acumuladas: List[Tuple] = []
+        vazias = 0
+        for linha in linhas:
+            if not any(v is not None for v in linha):
+                # linha totalmente vazia: fica, como na leitura inteira, salvo as do fim da aba
+                vazias += 1
+                continue
+            if vazias:
+                acumuladas.extend([vazia] * vazias)
+                vazias = 0
+            if len(linha) < largura:
+                linha = tuple(linha) + (None,) * (largura - len(linha))
+            acumuladas.append(tuple(linha[i] for i in indices))
+            while len(acumuladas) >= linhas_por_bloco:
+                yield fixar_tipos(pd.DataFrame(acumuladas[:linhas_por_bloco], columns=nomes, dtype=object), tipos)
+                acumuladas = acumuladas[linhas_por_bloco:]
+        if acumuladas:
+            yield fixar_tipos(pd.DataFrame(acumuladas, columns=nomes, dtype=object), tipos)
+    finally:
+        livro.close()
+
+
+def _tipo_coluna(serie: pd.Series) -> Optional[str]:
+    """'numero', 'data', 'texto' ou 'outro' (lógicos, horários...); None se a coluna só tem vazios."""
+    if not serie.notna().any():
+        return None
+    if pd.api.types.is_bool_dtype(serie.dtype):
+        return "outro"
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return "numero"
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return "data"
+    if isinstance(serie.dtype, (pd.StringDtype, pd.CategoricalDtype)) or all(isinstance(v, str) for v in serie.dropna()):
+        return "texto"
+    return "outro"
+
+
+def tipos_snapshot(arquivo: str, aba: Any = 0, header_linha: int = 0) -> Dict[str, Optional[str]]:
+    """Tipo de cada coluna no snapshot colunar da planilha, que foi tipada inteira (vazio sem
+    snapshot válido)."""
+    caminho = caminho_snapshot(arquivo, aba, header_linha)
+    if not USAR_SNAPSHOT or not snapshot_valido(caminho, os.stat(arquivo)):
+        return {}
+    with pa.memory_map(caminho) as origem:
+        esquema = pa.ipc.open_file(origem).schema
+    tipos: Dict[str, Optional[str]] = {}
+    for campo in esquema:
+        tipo = campo.type.value_type if pa.types.is_dictionary(campo.type) else campo.type
+        if pa.types.is_null(tipo):
+            continue
+        if pa.types.is_integer(tipo) or pa.types.is_floating(tipo):
+            tipos[campo.name] = "numero"
+        elif pa.types.is_timestamp(tipo):
+            tipos[campo.name] = "data"
+        elif pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+            tipos[campo.name] = "texto"
+        else:
+            tipos[campo.name] = "outro"
+    return tipos
+
+
+def fixar_tipos(bloco: pd.DataFrame, tipos: Dict[str, Optional[str]]) -> pd.DataFrame:
+    """Converte as colunas de um bloco lido como 'object' para o tipo fixado em 'tipos' (do snapshot
+    ou do primeiro bloco em que a coluna teve valores, inferido por coagir_tipos), para que todos os
+    blocos tenham o mesmo tipo por coluna. Colunas ainda sem tipo o ganham aqui."""
+    for i, nome in enumerate(bloco.columns):
+        serie = bloco.iloc[:, i]
+        tipo = tipos.get(nome)
+        if tipo is None:
+            serie = coagir_tipos(serie.infer_objects().to_frame()).iloc[:, 0]
+            tipos[nome] = _tipo_coluna(serie)
+        elif tipo == "numero":
+            # valores que não são números (a leitura inteira faria a coluna toda de texto) ficam vazios
+            serie = pd.to_numeric(serie, errors="coerce")
+        elif tipo == "data":
+            serie = pd.to_datetime(serie, errors="coerce")
+        elif tipo == "texto":
+            serie = serie.where(serie.isna(), serie.astype(str)).infer_objects()
+        else:
+            serie = serie.infer_objects()
+        bloco.isetitem(i, serie)
+    return bloco
+
+
+class _MascarasDescartaveis:
+    """Substitui MascarasPredicados nos blocos lidos em streaming: cada bloco é visto uma só
+    vez, então os predicados são avaliados sem guardar."""
+
+    @staticmethod
+    def obter(chave: Tuple, calcular) -> Any:
+        return calcular()
+
+
+class Momentos:
+    """Contagem, soma, mínimo, máximo e soma dos quadrados dos desvios (m2) de valores lidos em
+    partes. Os campos são arrays (um elemento por grupo, ou escalares 0-d): cada parte é
+    resumida com NumPy e juntada ao acumulado pela fórmula de Chan (Welford em paralelo)."""
+
+    def __init__(self, n: Any = 0.0, soma: Any = 0.0, m2: Any = 0.0, minimo: Any = np.nan, maximo: Any = np.nan):
+        self.n, self.soma, self.m2 = np.asarray(n, float), np.asarray(soma, float), np.asarray(m2, float)
+        self.minimo, self.maximo = np.asarray(minimo, float), np.asarray(maximo, float)
+
+    @classmethod
+    def de_valores(cls, valores: np.ndarray) -> "Momentos":
+        v = valores[~np.isnan(valores)]
+        if not len(v):
+            return cls()
+        return cls(len(v), v.sum(), np.square(v - v.mean()).sum(), v.min(), v.max())
+
+    def espalhar(self, posicoes: np.ndarray, tamanho: int) -> "Momentos":
+        """Os mesmos momentos nas 'posicoes' de um array de 'tamanho' grupos (os demais vazios)."""
+        novo = Momentos(np.zeros(tamanho), np.zeros(tamanho), np.zeros(tamanho),
+                        np.full(tamanho, np.nan), np.full(tamanho, np.nan))
+        for campo in ("n", "soma", "m2", "minimo", "maximo"):
+            getattr(novo, campo)[posicoes] = getattr(self, campo)
+        return novo
+
+    def juntar(self, outro: "Momentos") -> "Momentos":
+        n = self.n + outro.n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = np.where((self.n > 0) & (outro.n > 0), outro.soma / outro.n - self.soma / self.n, 0.0)
+            self.m2 = self.m2 + outro.m2 + np.where(n > 0, delta * delta * self.n * outro.n / n, 0.0)
+        self.n, self.soma = n, self.soma + outro.soma
+        self.minimo, self.maximo = np.fmin(self.minimo, outro.minimo), np.fmax(self.maximo, outro.maximo)
+        return self
+
+    def valor(self, funcao: str) -> Any:
+        """count/sum/mean/std/max/min (mesmas convenções do pandas: std com ddof=1)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            valores = {
+                "count": self.n,
+                "sum": self.soma,
+                "mean": np.where(self.n > 0, self.soma / self.n, np.nan),
+                "std": np.where(self.n > 1, np.sqrt(self.m2 / (self.n - 1)), np.nan),
+                "max": self.maximo,
+                "min": self.minimo,
+            }
+        resultado = valores[funcao]
+        if funcao == "count":
+            resultado = resultado.astype(np.int64)
+        return resultado.item() if resultado.ndim == 0 else resultado
+
+
+class ParciaisGrupo:
+    """Linhas e Momentos por grupo acumulados parte a parte. Cada parte é resumida por um
+    groupby; juntar duas partes alinha os índices de grupos e soma os momentos."""
+
+    def __init__(self, grupos: List[str], colunas: List[str]):
+        self.grupos = grupos
+        self.colunas = colunas
+        self.indice: Optional[pd.Index] = None
+        self.linhas = np.zeros(0)
+        self.momentos: Dict[str, Momentos] = {}
+
+    def atualizar(self, linhas: pd.DataFrame, valores: Dict[str, np.ndarray]) -> None:
+        """Soma as 'linhas' (já filtradas) de um bloco; 'valores' traz as colunas em float."""
+        if linhas.empty:
+            return
+        chaves = [linhas[g] for g in self.grupos]
+        tamanhos = linhas.groupby(chaves, observed=True, sort=False).size()
+        momentos = {}
+        if self.colunas:
+            quadro = pd.DataFrame({c: valores[c] for c in self.colunas}, index=linhas.index)
+            agrupado = quadro.groupby(chaves, observed=True, sort=False)
+            n, soma, minimo, maximo = agrupado.count(), agrupado.sum(), agrupado.min(), agrupado.max()
+            m2 = np.square(quadro - agrupado.transform("mean")).groupby(chaves, observed=True, sort=False).sum()
+            for c in self.colunas:
+                momentos[c] = Momentos(*(t[c].reindex(tamanhos.index).to_numpy() for t in (n, soma, m2, minimo, maximo)))
+        self._juntar(tamanhos.index, tamanhos.to_numpy(dtype=float), momentos)
+
+    def juntar(self, outra: "ParciaisGrupo") -> None:
+        if outra.indice is not None:
+            self._juntar(outra.indice, outra.linhas, outra.momentos)
+
+    def _juntar(self, indice: pd.Index, linhas: np.ndarray, momentos: Dict[str, Momentos]) -> None:
+        if self.indice is None:
+            self.indice, self.linhas, self.momentos = indice, linhas, momentos
+            return
+        uniao = self.indice.union(indice)
+        atuais, novas = uniao.get_indexer(self.indice), uniao.get_indexer(indice)
+        soma = np.zeros(len(uniao))
+        soma[atuais] += self.linhas
+        soma[novas] += linhas
+        self.momentos = {c: self.momentos[c].espalhar(atuais, len(uniao)).juntar(momentos[c].espalhar(novas, len(uniao)))
+                         for c in self.colunas}
+        self.indice, self.linhas = uniao, soma
+
+    def tabela(self, colunas_resultado: Dict[str, Tuple[str, str]]) -> pd.DataFrame:
+        """DataFrame com as colunas de grupo e, para cada nome de 'colunas_resultado', o valor
+        (coluna, função) pedido ('linhas' como coluna dá a contagem de linhas), em ordem de grupo."""
+        if self.indice is None:
+            return pd.DataFrame(columns=list(self.grupos) + list(colunas_resultado))
+        dados = {}
+        for nome, (coluna, funcao) in colunas_resultado.items():
+            dados[nome] = self.linhas.astype(np.int64) if coluna == "linhas" else self.momentos[coluna].valor(funcao)
+        indice = self.indice.set_names(self.grupos) if self.indice.nlevels == len(self.grupos) else self.indice
+        res = pd.DataFrame(dados, index=indice)
+        try:
+            res = res.sort_index()
+        except TypeError:
+            pass  # chaves de tipos misturados: mantém a ordem em que apareceram
+        return res.reset_index()
+
+
+class Correlacao:
+    """Co-momentos de duas colunas (linhas com as duas preenchidas), juntados parte a parte."""
+
+    def __init__(self):
+        self.n = 0
+        self.media_x = self.media_y = self.m2_x = self.m2_y = self.c_xy = 0.0
+
+    def atualizar(self, x: np.ndarray, y: np.ndarray) -> None:
+        validos = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[validos], y[validos]
+        if not len(x):
+            return
+        parte = Correlacao()
+        parte.n, parte.media_x, parte.media_y = len(x), x.mean(), y.mean()
+        dx, dy = x - parte.media_x, y - parte.media_y
+        parte.m2_x, parte.m2_y, parte.c_xy = float(dx @ dx), float(dy @ dy), float(dx @ dy)
+        self.juntar(parte)
+
+    def juntar(self, outra: "Correlacao") -> None:
+        n = self.n + outra.n
+        if not outra.n:
+            return
+        dx, dy = outra.media_x - self.media_x, outra.media_y - self.media_y
+        peso = self.n * outra.n / n
+        self.m2_x += outra.m2_x + dx * dx * peso
+        self.m2_y += outra.m2_y + dy * dy * peso
+        self.c_xy += outra.c_xy + dx * dy * peso
+        self.media_x += dx * outra.n / n
+        self.media_y += dy * outra.n / n
+        self.n = n
+
+    def valor(self) -> float:
+        if self.n < 2 or self.m2_x <= 0 or self.m2_y <= 0:
+            return np.nan
+        return self.c_xy / np.sqrt(self.m2_x * self.m2_y)
+
+
+class TopN:
+    """As 'limite' primeiras linhas na ordenação estável por 'coluna' entre as já vistas. Cada
+    parte contribui só com o próprio top (seleção parcial) e o acumulado é re-selecionado, então
+    nunca passa de 2 * limite linhas. Partes devem ser juntadas na ordem das linhas no arquivo."""
+
+    def __init__(self, coluna: str, limite: int, ascendente: bool):
+        self.coluna, self.limite, self.ascendente = coluna, max(limite, 0), ascendente
+        self.linhas: Optional[pd.DataFrame] = None
+
+    def _top(self, quadro: pd.DataFrame) -> pd.DataFrame:
+        serie = quadro[self.coluna]
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            valores = serie.to_numpy(dtype=float, na_value=np.nan)
+            return quadro.iloc[selecionar_top(valores, self.limite, self.ascendente)]
+        return quadro.sort_values(by=self.coluna, ascending=self.ascendente, kind="stable").head(self.limite)
+
+    def atualizar(self, linhas: pd.DataFrame) -> None:
+        if not linhas.empty:
+            self._acrescentar(self._top(linhas))
+
+    def juntar(self, outro: "TopN") -> None:
+        if outro.linhas is not None:
+            self._acrescentar(outro.linhas)
+
+    def _acrescentar(self, linhas: pd.DataFrame) -> None:
+        self.linhas = linhas if self.linhas is None else self._top(pd.concat([self.linhas, linhas]))
+
+
+class ConsultaEmBlocos:
+    """Estado de uma consulta executada bloco a bloco. 'atualizar' filtra um bloco com
+    montar_filtro e acumula só o que a operação precisa; 'juntar' soma o estado de outra
+    parte da mesma planilha; 'resultado' monta o DataFrame final."""
+
+    def __init__(self, entrada: dict, resolvedor: ResolvedorColunas):
+        self.entrada = entrada
+        self.resolvedor = resolvedor
+        self.total_linhas = 0
+        self.filtradas = 0
+        self.nao_nulos = 0
+        self.partes: Dict[str, Any] = {}
+
+        oper = entrada.get("operation")
+        self.agregacoes = agregacoes_pedidas(oper)
+        col_op = entrada.get("column_operation")
+        colunas_op = [resolvedor.resolver(c) for c in (col_op if isinstance(col_op, list) else [col_op]) if c]
+        self.colunas_op = list(dict.fromkeys(c for c in colunas_op if c in resolvedor.reais))
+        if isinstance(col_op, list):
+            col_op = col_op[0] if col_op else None
+        if isinstance(oper, list):
+            oper = oper[0] if oper else None
+        self.op_low = str(oper).strip().lower() if oper else ""
+        self.col_op = resolvedor.resolver(col_op) if col_op else None
+        if self.col_op not in resolvedor.reais:
+            self.col_op = None
+        mostrar = [resolvedor.resolver(c) for c in (entrada.get("columns_to_show") or [])]
+        self.mostrar = [c for c in mostrar if c in resolvedor.reais]
+        group_by = entrada.get("group_by", []) or []
+        group_by = [group_by] if isinstance(group_by, (str, dict)) else group_by
+        self.grupos = [c for c in (resolvedor.resolver(g) for g in group_by) if c in resolvedor.reais]
+        pares = entrada.get("comparisons") or []
+        pares = [resolvedor.resolver(c) for c in pares[:2]] if isinstance(pares, list) and len(pares) >= 2 else []
+        correlacao = entrada.get("correlation") or entrada.get("comparisons") or []
+        correlacao = [resolvedor.resolver(c) for c in correlacao[:2]] if isinstance(correlacao, list) and len(correlacao) >= 2 else []
+
+        op = self.op_low
+        if self.agregacoes:
+            self.tipo = "agregacoes"
+            if self.grupos:
+                self.partes["grupos"] = ParciaisGrupo(self.grupos, self.colunas_op)
+            else:
+                self.partes.update({c: Momentos() for c in self.colunas_op})
+        elif op in ["count", "contagem"]:
+            self.tipo = "contagem"
+            if self.grupos:
+                self.partes["grupos"] = ParciaisGrupo(self.grupos, [])
+        elif op in ["porcentagem", "percent", "percentage", "percentual"]:
+            self.tipo = "porcentagem"
+            if self.grupos:
+                self.partes["total"] = ParciaisGrupo(self.grupos, [])
+                self.partes["grupos"] = ParciaisGrupo(self.grupos, [])
+        elif op in ["mean", "media", "sum", "soma", "max", "min", "std"] and self.col_op:
+            self.tipo = "estatistica"
+            if self.grupos and op in ["mean", "media"]:
+                self.partes["grupos"] = ParciaisGrupo(self.grupos, [self.col_op])
+            else:
+                self.partes[self.col_op] = Momentos()
+        elif op in ["compare_mean", "comparar_media"] and pares and all(c in resolvedor.reais for c in pares):
+            self.tipo = "compare_mean"
+            self.col_op, self.grupos = pares[0], [pares[1]]
+            self.partes["grupos"] = ParciaisGrupo(self.grupos, [self.col_op])
+        elif op in ["correlacao", "correlation"] and correlacao and all(c in resolvedor.reais for c in correlacao):
+            self.tipo = "correlacao"
+            self.pares = correlacao
+            self.partes["correlacao"] = Correlacao()
+        elif op in ["top", "ranking"] and self.col_op:
+            self.tipo = "top"
+            ordem = entrada.get("ranking", [])
+            ordem = str(ordem[0]).lower() if isinstance(ordem, list) and ordem else (str(ordem).lower() if ordem else "desc")
+            limite = int(entrada.get("limit") or entrada.get("n") or 5)
+            self.partes["top"] = TopN(self.col_op, limite, ordem in ["asc", "cresc", "ascending"])
+        elif op in ["", "list", "listar"]:
+            self.tipo = "linhas"
+            self.partes["linhas"] = []
+        else:
+            self.tipo = "invalida"
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # o resolvedor guarda condições compiladas (funções locais); quem junta usa o seu próprio
+        estado = dict(self.__dict__)
+        estado["resolvedor"] = None
+        return estado
+
+    def colunas(self) -> Optional[List[str]]:
+        """Colunas a ler de cada bloco (None: todas)."""
+        return planejar_colunas(self.entrada, self.resolvedor)
+
+    def _valores(self, linhas: pd.DataFrame, coluna: str) -> np.ndarray:
+        serie = linhas[coluna]
+        if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            serie = pd.to_numeric(serie, errors="coerce")
+        return serie.to_numpy(dtype=float, na_value=np.nan)
+
+    def atualizar(self, bloco: pd.DataFrame) -> None:
+        filtro = montar_filtro(self.entrada, bloco, VisoesColunas(bloco), _MascarasDescartaveis(), self.resolvedor)
+        linhas = recortar(bloco, filtro)
+        self.total_linhas += len(bloco)
+        self.filtradas += len(linhas)
+        if self.tipo == "invalida" or (linhas.empty and self.tipo != "porcentagem"):
+            return
+        if self.tipo == "contagem" and self.col_op:
+            self.nao_nulos += int(linhas[self.col_op].notna().sum())
+        if "total" in self.partes:
+            self.partes["total"].atualizar(bloco, {})
+        if "grupos" in self.partes:
+            grupos = self.partes["grupos"]
+            grupos.atualizar(linhas, {c: self._valores(linhas, c) for c in grupos.colunas})
+        for chave, parte in self.partes.items():
+            if isinstance(parte, Momentos):
+                parte.juntar(Momentos.de_valores(self._valores(linhas, chave)))
+        if self.tipo == "correlacao":
+            self.partes["correlacao"].atualizar(*(self._valores(linhas, c) for c in self.pares))
+        elif self.tipo == "top":
+            self.partes["top"].atualizar(linhas)
+        elif self.tipo == "linhas":
+            self.partes["linhas"].append(linhas[self.mostrar] if self.mostrar else linhas)
+
+    def juntar(self, outra: "ConsultaEmBlocos") -> "ConsultaEmBlocos":
+        """Junta o estado de outra parte da mesma consulta (partes na ordem das linhas)."""
+        self.total_linhas += outra.total_linhas
+        self.filtradas += outra.filtradas
+        self.nao_nulos += outra.nao_nulos
+        for chave, parte in self.partes.items():
+            if isinstance(parte, list):
+                parte.extend(outra.partes[chave])
+            else:
+                parte.juntar(outra.partes[chave])
+        return self
+
+    def resultado(self) -> pd.DataFrame:
+        if self.tipo == "invalida" or (not self.filtradas and self.tipo != "porcentagem"):
+            return pd.DataFrame()
+        grupos = self.partes.get("grupos")
+        if self.tipo == "agregacoes":
+            if grupos is not None:
+                if not self.colunas_op:
+                    return grupos.tabela({"contagem": ("linhas", "count")})
+                return grupos.tabela({f"{f}_{c}": (c, f) for c in self.colunas_op for f in self.agregacoes})
+            if not self.colunas_op:
+                return pd.DataFrame([{"contagem": self.filtradas}])
+            return pd.DataFrame([{f"{f}_{c}": self.partes[c].valor(f) for c in self.colunas_op for f in self.agregacoes}])
+        if self.tipo == "contagem":
+            if grupos is not None:
+                return grupos.tabela({"contagem": ("linhas", "count")})
+            return pd.DataFrame([{"contagem": self.nao_nulos if self.col_op else self.filtradas}])
+        if self.tipo == "porcentagem":
+            if grupos is None:
+                pct = (self.filtradas / self.total_linhas) * 100 if self.total_linhas else 0
+                return pd.DataFrame([{"porcentagem": round(pct, 2), "total_filtrado": self.filtradas,
+                                      "total_geral": self.total_linhas}])
+            res = self.partes["total"].tabela({"total_no_grupo": ("linhas", "count")}).merge(
+                grupos.tabela({"filtrados_no_grupo": ("linhas", "count")}), on=self.grupos, how="left")
+            res["filtrados_no_grupo"] = res["filtrados_no_grupo"].fillna(0)
+            res["porcentagem_no_grupo"] = (res["filtrados_no_grupo"] / res["total_no_grupo"] * 100).round(2)
+            return res
+        if self.tipo in ("estatistica", "compare_mean"):
+            funcao = AGREGACOES[self.op_low] if self.tipo == "estatistica" else "mean"
+            if grupos is not None:
+                return grupos.tabela({f"{funcao}_{self.col_op}": (self.col_op, funcao)})
+            return pd.DataFrame([{f"{funcao}_{self.col_op}": self.partes[self.col_op].valor(funcao)}])
+        if self.tipo == "correlacao":
+            corr = self.partes["correlacao"].valor()
+            return pd.DataFrame([{"correlacao": None if pd.isna(corr) else round(float(corr), 4),
+                                  "colunas": f"{self.pares[0]} vs {self.pares[1]}"}])
+        if self.tipo == "top":
+            linhas = self.partes["top"].linhas
+            return linhas[self.mostrar] if self.mostrar else linhas
+        return pd.concat(self.partes["linhas"])
+
+
+def executar_pesquisa_streaming(entrada: dict, arquivo_excel: str = "Planilha.xlsx", aba: Optional[int] = None,
+                                header_linha: int = 0, linhas_por_bloco: int = LINHAS_POR_BLOCO) -> pd.DataFrame:
+    """
+    Executa a 'entrada' lendo a planilha em blocos (ver ler_blocos), sem carregá-la inteira.
+    Mostra o resultado no console e o retorna como DataFrame (não há DataFrame filtrado
+    completo em memória). 'describe' e operações que precisam de todas as linhas não estão disponíveis.
+    """
+    try:
+        with etapa("leitura"):
+            fontes = expandir_fontes(arquivo_excel, aba)
+            esquema = esquema_blocos(fontes, header_linha)
+        with etapa("resolucao"):
+            consulta = ConsultaEmBlocos(entrada, obter_resolvedor(esquema, COLUNAS_MAPEAMENTO_LOWER))
+        if consulta.tipo == "invalida":
+            print("Operação não disponível no modo streaming.")
+            return pd.DataFrame()
+        blocos = iter(ler_blocos_fontes(fontes, header_linha, consulta.colunas(), linhas_por_bloco))
+        while True:
+            # leitura e filtro se alternam bloco a bloco: cada parte soma na sua etapa
+            with etapa("leitura"):
+                bloco = next(blocos, None)
+            if bloco is None:
+                break
+            contar("linhas_entrada", len(bloco))
+            with etapa("filtro"):
+                consulta.atualizar(bloco)
+    except FileNotFoundError:
+        print(f"Arquivo não encontrado: {arquivo_excel}. Verifique o caminho e tente novamente.")
+        return pd.DataFrame()
+    except Exception as e:
+        print(f"Erro ao ler o arquivo em blocos: {e}")
+        return pd.DataFrame()
+
+    with etapa("operacao"):
+        return mostrar_resultado_em_partes(consulta, "em streaming")
+
+
+def mostrar_resultado_em_partes(consulta: ConsultaEmBlocos, modo: str) -> pd.DataFrame:
+    res = consulta.resultado()
+    if res.empty:
+        print("Nenhum resultado encontrado após aplicar filtros.")
+        return res
+    print(f"Resultado {modo} ({consulta.filtradas} de {consulta.total_linhas} linhas passaram nos filtros):")
+    print(res.to_string(index=False))
+    return res
+
+
+# --- EXECUÇÃO PARALELA ---
+# Opcional ("paralelo": true, ou o número de processos, na entrada): as linhas são divididas em
+# partições e cada processo filtra e resume a sua com ConsultaEmBlocos, lendo o snapshot colunar
+# (.arrow memory-mapped: as páginas do arquivo são compartilhadas entre os processos) ou os row
+# groups de um .parquet. Os resumos voltam ao processo principal e são juntados na ordem das
+# partições. Requer pyarrow; .csv não tem acesso por posição e é lido em streaming.
+PROCESSOS_PARALELOS = os.cpu_count() or 1
+_executores: Dict[int, ProcessPoolExecutor] = {}
+_lock_executores = threading.Lock()
+
+
+def obter_executor(processos: int) -> ProcessPoolExecutor:
+    """Pool de processos reaproveitado entre consultas (criá-lo custa mais que uma consulta pequena)."""
+    with _lock_executores:
+        executor = _executores.get(processos)
+        if executor is None:
+            executor = _executores[processos] = ProcessPoolExecutor(max_workers=processos)
+        return executor
+
+
+def particoes_paralelas(arquivo_excel: str, aba: Any, header_linha: int, partes: int) -> Tuple[List[Tuple], int]:
+    """Até 'partes' fontes contíguas de linhas, ("arrow", snapshot, início, fim) ou ("parquet",
+    arquivo, row groups, início), e o total de linhas. Grava o snapshot se ele não existir."""
+    if arquivo_excel.lower().endswith(".parquet"):
+        metadados = pq.ParquetFile(arquivo_excel).metadata
+        linhas = [metadados.row_group(i).num_rows for i in range(metadados.num_row_groups)]
+        inicios = np.concatenate([[0], np.cumsum(linhas)]).astype(int)
+        grupos = np.array_split(np.arange(len(linhas)), max(min(partes, len(linhas)), 1))
+        return [("parquet", arquivo_excel, g.tolist(), int(inicios[g[0]])) for g in grupos if len(g)], int(inicios[-1])
+    snapshot = caminho_snapshot(arquivo_excel, aba, header_linha)
+    if not snapshot_valido(snapshot, os.stat(arquivo_excel)):
+        ler_planilha(arquivo_excel, aba, header_linha)  # leitura completa, que grava o snapshot
+        if not snapshot_valido(snapshot, os.stat(arquivo_excel)):
+            raise ValueError("não foi possível gravar o snapshot colunar da planilha")
+    with pa.memory_map(snapshot) as origem:
+        total = pa.ipc.open_file(origem).read_all().num_rows
+    limites = np.linspace(0, total, max(partes, 1) + 1).astype(int)
+    return [("arrow", snapshot, int(a), int(b)) for a, b in zip(limites[:-1], limites[1:]) if b > a], total
+
+
+def executar_particao(entrada: dict, esquema: List[str], fonte: Tuple, colunas: Optional[List[str]],
+                      deslocamento: int = 0, rotulo: Optional[str] = None) -> ConsultaEmBlocos:
+    """Executada em cada processo: lê as linhas da partição e devolve o estado da consulta sobre elas.
+    Com várias planilhas, 'deslocamento' é a posição da primeira linha da planilha no conjunto e
+    'rotulo' o valor da coluna de origem."""
+    tipo, caminho = fonte[:2]
+    if tipo == "arrow":
+        inicio, fim = fonte[2:]
+        nomes = colunas
+        if nomes is not None and rotulo is not None:
+            with pa.memory_map(caminho) as arquivo:
+                existentes = set(pa.ipc.open_file(arquivo).schema.names)
+            nomes = [c for c in nomes if c in existentes]
+        tabela = feather.read_table(caminho, columns=nomes, memory_map=True).slice(inicio, fim - inicio)
+    else:
+        grupos, inicio = fonte[2:]
+        origem = pq.ParquetFile(caminho)
+        nomes = [n for n in origem.schema_arrow.names if colunas is None or str(n).strip() in set(colunas)]
+        tabela = origem.read_row_groups(grupos, columns=nomes)
+    bloco = tabela.to_pandas(split_blocks=True)
+    bloco.columns = [str(c).strip() for c in bloco.columns]
+    if rotulo is not None:
+        bloco = bloco.reindex(columns=[c for c in esquema if c != COLUNA_ORIGEM and (colunas is None or c in colunas)])
+        bloco[COLUNA_ORIGEM] = rotulo
+    bloco.index = pd.RangeIndex(deslocamento + inicio, deslocamento + inicio + len(bloco))
+    consulta = ConsultaEmBlocos(entrada, obter_resolvedor(esquema, COLUNAS_MAPEAMENTO_LOWER))
+    consulta.atualizar(bloco)
+    return consulta
+
+
+def executar_pesquisa_paralela(entrada: dict, arquivo_excel: str = "Planilha.xlsx", aba: Optional[int] = None,
+                               header_linha: int = 0, processos: Optional[int] = None) -> pd.DataFrame:
+    """
+    Executa a 'entrada' dividindo as linhas entre 'processos' processos (padrão: um por núcleo).
+    Mesmas operações e mesmo formato de resultado de executar_pesquisa_streaming.
+    """
+    processos = max(1, int(processos or PROCESSOS_PARALELOS))
+    try:
+        planilhas = expandir_fontes(arquivo_excel, aba)
+        if any(a.lower().endswith(".csv") for a, _ in planilhas):
+            return executar_pesquisa_streaming(entrada, arquivo_excel, aba, header_linha)
+        if pa is None:
+            raise ImportError("o modo paralelo requer pyarrow")
+        if len(planilhas) == 1:
+            rotulos: List[Optional[str]] = [None]
+        else:
+            rotulos = rotulos_fontes(planilhas)
+            # as partições de várias planilhas dividem os processos entre si
+            processos_por_planilha = max(1, processos // len(planilhas))
+        # partição -> (fonte, deslocamento da planilha, rótulo de origem)
+        fontes: List[Tuple] = []
+        deslocamento = 0
+        for (arquivo, aba_fonte), rotulo in zip(planilhas, rotulos):
+            particoes, total = particoes_paralelas(arquivo, aba_fonte, header_linha,
+                                                   processos if rotulo is None else processos_por_planilha)
+            fontes.extend((p, deslocamento, rotulo) for p in particoes)
+            deslocamento += total
+        esquema = esquema_blocos(planilhas, header_linha) if len(planilhas) > 1 else (
+            cabecalho_blocos(planilhas[0][0]) if planilhas[0][0].lower().endswith(".parquet")
+            else ler_esquema(planilhas[0][0], planilhas[0][1], header_linha))
+        consulta = ConsultaEmBlocos(entrada, obter_resolvedor(esquema, COLUNAS_MAPEAMENTO_LOWER))
+        if consulta.tipo == "invalida":
+            print("Operação não disponível no modo paralelo.")
+            return pd.DataFrame()
+        colunas = consulta.colunas()
+        n = len(fontes)
+        argumentos = ([entrada] * n, [esquema] * n, [f[0] for f in fontes], [colunas] * n,
+                      [f[1] for f in fontes], [f[2] for f in fontes])
+        if processos == 1 or n == 1:
+            partes = list(map(executar_particao, *argumentos))
+        else:
+            partes = obter_executor(processos).map(executar_particao, *argumentos)
+        for parte in partes:
+            consulta.juntar(parte)
+    except FileNotFoundError:
+        print(f"Arquivo não encontrado: {arquivo_excel}. Verifique o caminho e tente novamente.")
+        return pd.DataFrame()
+    except Exception as e:
+        print(f"Erro na execução paralela: {e}")
+        return pd.DataFrame()
+    return mostrar_resultado_em_partes(consulta, f"em paralelo, {len(fontes)} partições")
+
+
+# --- EXEMPLO DE USO ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ferramenta de pesquisa em planilhas Excel.")
+    parser.add_argument("--gerar-snapshots", metavar="PASTA",
+                        help="pré-gera os snapshots colunares (.arrow) das planilhas da pasta e sai")
+    parser.add_argument("--aba", default=0, help="aba usada ao gerar os snapshots (padrão: 0)")
+    parser.add_argument("--header-linha", type=int, default=0, help="linha do cabeçalho (padrão: 0)")
+    args = parser.parse_args()
+    if args.gerar_snapshots:
+        aba = int(args.aba) if str(args.aba).isdigit() else args.aba
+        gerar_snapshots(args.gerar_snapshots, aba=aba, header_linha=args.header_linha)
+        raise SystemExit(0)
 
-# --- EXEMPLO DE USO ---
-if __name__ == "__main__":
     arquivo_excel = "Planilha.xltx"  # ajuste se necessário
 
     # entrada de exemplo (você pode testar diversas das entradas que listou)